@@ -0,0 +1,82 @@
+"""
+Startup benchmark, how long `import ccd` takes in a fresh interpreter.
+
+Runs `python -X importtime -c "import ccd"` a few times and reports the best
+cumulative import time of ccd, the slowest modules it pulls in, and whether
+any of the heavy optional dependencies got imported along the way.
+
+Usage:
+    python benchmarks/startup.py [--repeat 5] [--top 10] [--max-ms 500]
+
+Exits with a non-zero status when a heavy dependency is imported, or when
+the import takes longer than --max-ms.
+"""
+import argparse
+import subprocess
+import sys
+
+# Only needed by optional code paths, `import ccd` should not load them
+HEAVY = ('sklearn', 'scipy')
+
+
+def importtime(statement='import ccd'):
+    """
+    Run the statement in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict of module name to its (self, cumulative) import time in
+        microseconds
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime',
+                           '-c', statement],
+                          stderr=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own), int(cumulative))
+
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs to take the best of')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest modules to list')
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail when import ccd takes longer')
+    args = parser.parse_args(argv)
+
+    runs = [importtime() for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times['ccd'][1])
+
+    total_ms = best['ccd'][1] / 1000.0
+    print('import ccd: %.1f ms (best of %d)' % (total_ms, args.repeat))
+
+    print('slowest modules, cumulative ms:')
+    slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (_, cumulative) in slowest[1:args.top + 1]:
+        print('  %8.1f  %s' % (cumulative / 1000.0, name))
+
+    heavy = sorted(name for name in best if name.split('.')[0] in HEAVY)
+    status = 0
+
+    if heavy:
+        print('heavy dependencies imported: %s' % ', '.join(heavy))
+        status = 1
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print('import ccd is over %.1f ms' % args.max_ms)
+        status = 1
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Benchmark suite, detect end to end and each of its stages.
+
+Runs detect on every pixel in test/resources and on synthetic long time
+series, timing the whole call and the time spent in each stage: QA
+unpacking, the procedure filters, the adjusted variogram, Tmask, the
+initialize, lookforward, lookback and catch steps and the fitters. Stage
+times are inclusive, initialize includes the Tmask and fits it runs.
+
+Each case is run once untimed, then the best time of --repeat runs is kept
+for each case and stage. Results can be saved as a baseline, and later runs
+compared against it, flagging any case or stage that got slower by more than
+--threshold.
+
+Usage:
+    python benchmarks/suite.py [--repeat 3] [--save NAME]
+    python benchmarks/suite.py [--compare NAME] [--threshold 0.1]
+
+Baselines are JSON files in benchmarks/baselines, NAME may also be a path.
+They are specific to the machine they were saved on, so none are committed.
+Exits with a non-zero status when a regression is flagged or the baseline to
+compare against does not exist.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import ccd
+from ccd import procedures, qa, synthetic
+from ccd.models import FitterSession, tmask
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESOURCES = os.path.join(HERE, os.pardir, 'test', 'resources')
+BASELINES = os.path.join(HERE, 'baselines')
+
+# Parameters for the CSV resources, which hold CFMask style QA values
+CSV_PARAMS = {'QA_BITPACKED': False,
+              'QA_FILL': 255,
+              'QA_CLEAR': 0,
+              'QA_WATER': 1,
+              'QA_SHADOW': 2,
+              'QA_SNOW': 3,
+              'QA_CLOUD': 4}
+
+# Functions timed as stages, looked up where the callers find them
+STAGES = (('unpackqa', qa, 'unpackqa'),
+          ('filters', qa, 'standard_procedure_filter'),
+          ('filters', qa, 'snow_procedure_filter'),
+          ('filters', qa, 'insufficient_clear_filter'),
+          ('variogram', procedures, 'adjusted_variogram'),
+          ('tmask', tmask, 'tmask'),
+          ('initialize', procedures, 'initialize'),
+          ('lookforward', procedures, 'lookforward'),
+          ('lookback', procedures, 'lookback'),
+          ('catch', procedures, 'catch'),
+          ('fit', FitterSession, 'fit'))
+
+
+@contextlib.contextmanager
+def instrumented(timings):
+    """
+    Accumulate the seconds spent in each of the STAGES into timings while
+    active.
+    """
+    originals = []
+
+    def timed(stage, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - start
+
+        return wrapper
+
+    try:
+        for stage, owner, name in STAGES:
+            func = owner.__dict__[name]
+            originals.append((owner, name, func))
+            setattr(owner, name, timed(stage, func))
+
+        yield timings
+    finally:
+        for owner, name, func in originals:
+            setattr(owner, name, func)
+
+
+def cases():
+    """
+    The benchmark cases.
+
+    Returns:
+        list of (name, detect keyword arguments) tuples
+    """
+    found = []
+
+    for path in sorted(glob.glob(os.path.join(RESOURCES, '*.csv'))):
+        # Expected coefficients, not a time series
+        if path.endswith('_coefficients.csv'):
+            continue
+
+        data = np.genfromtxt(path, delimiter=',', dtype=np.int64).T
+        names = ('dates', 'blues', 'greens', 'reds', 'nirs', 'swir1s',
+                 'swir2s', 'thermals', 'qas')
+        arguments = dict(zip(names, data), params=CSV_PARAMS)
+        found.append((os.path.basename(path), arguments))
+
+    for path in sorted(glob.glob(os.path.join(RESOURCES, '*.npy'))):
+        # Saved as (coordinates, keyword arguments) object arrays
+        data = np.load(path, allow_pickle=True)
+        found.append((os.path.basename(path), dict(data[1])))
+
+    for observations, changes in ((2000, 2), (4000, 4)):
+        data = synthetic.chip(pixels=1, observations=observations,
+                              breaks=changes, cloud=0.2, params=CSV_PARAMS,
+                              seed=observations)
+        arguments = dict(synthetic.pixel(data), params=CSV_PARAMS)
+        found.append(('synthetic_{}_{}'.format(observations, changes),
+                      arguments))
+
+    return found
+
+
+def run(repeat=3, select=None):
+    """
+    Time every case.
+
+    Args:
+        repeat: runs to take the best of
+        select: optional substring a case name has to contain
+
+    Returns:
+        dict of case name to a dict of stage to its best time in seconds,
+        with the end to end time under 'detect'
+    """
+    results = {}
+
+    for name, arguments in cases():
+        if select is not None and select not in name:
+            continue
+
+        # Untimed, so lazy imports and caches do not count against the
+        # first case
+        ccd.detect(**arguments)
+
+        best = {}
+        for _ in range(repeat):
+            timings = defaultdict(float)
+
+            with instrumented(timings):
+                start = time.perf_counter()
+                ccd.detect(**arguments)
+                timings['detect'] = time.perf_counter() - start
+
+            for stage, seconds in timings.items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+
+        results[name] = best
+
+    return results
+
+
+def baseline_path(name):
+    """
+    Path of a named baseline, names containing a separator are paths.
+    """
+    if os.sep in name or name.endswith('.json'):
+        return name
+
+    return os.path.join(BASELINES, name + '.json')
+
+
+def save(results, name):
+    path = baseline_path(name)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'numpy': np.__version__,
+                   'results': results}, f, indent=2, sort_keys=True)
+
+    return path
+
+
+def compare(results, baseline, threshold, min_ms):
+    """
+    Find the cases and stages that got slower than their baseline.
+
+    Args:
+        results: dict as returned by run
+        baseline: dict as returned by run
+        threshold: relative slow down that is flagged, 0.1 for 10%
+        min_ms: ignore stages faster than this, in both runs, as noise
+
+    Returns:
+        list of (case, stage, baseline seconds, seconds) tuples
+    """
+    flagged = []
+
+    for case, stages in sorted(results.items()):
+        for stage, seconds in sorted(stages.items()):
+            before = baseline.get(case, {}).get(stage)
+
+            if before is None or max(before, seconds) * 1000 < min_ms:
+                continue
+
+            if seconds > before * (1 + threshold):
+                flagged.append((case, stage, before, seconds))
+
+    return flagged
+
+
+def report(results):
+    stages = ['detect'] + list(dict.fromkeys(stage for stage, _, _ in STAGES))
+
+    print('best times, ms')
+    print('%-55s' % 'case' + ''.join('%12s' % stage for stage in stages))
+
+    for case, timings in sorted(results.items()):
+        print('%-55s' % case +
+              ''.join('%12.1f' % (timings.get(stage, 0) * 1000)
+                      for stage in stages))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs to take the best of')
+    parser.add_argument('--select',
+                        help='only run the cases containing this')
+    parser.add_argument('--save', metavar='NAME',
+                        help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='NAME',
+                        help='compare the results to a baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slow down flagged as a regression')
+    parser.add_argument('--min-ms', type=float, default=5.0,
+                        help='ignore stages faster than this')
+    args = parser.parse_args(argv)
+
+    # Before spending any time on the cases
+    if args.compare and not os.path.exists(baseline_path(args.compare)):
+        sys.stderr.write('no baseline %s, save one first with make '
+                         'bench-baseline or --save %s\n'
+                         % (baseline_path(args.compare), args.compare))
+        return 2
+
+    results = run(args.repeat, args.select)
+    report(results)
+
+    if args.save:
+        print('saved baseline %s' % save(results, args.save))
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)['results']
+
+        flagged = compare(results, baseline, args.threshold, args.min_ms)
+
+        for case, stage, before, seconds in flagged:
+            print('REGRESSION %s %s: %.1f ms -> %.1f ms (%+.0f%%)'
+                  % (case, stage, before * 1000, seconds * 1000,
+                     (seconds / before - 1) * 100))
+
+        if flagged:
+            return 1
+
+        print('no regressions over %.0f%%' % (args.threshold * 100))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,32 @@
 import time
 import logging
+from collections import namedtuple
 
 from ccd.procedures import fit_procedure as __determine_fit_procedure
+from ccd.procedures import fit_procedures as __determine_fit_procedures
+from ccd.procedures import checkpointed_procedure as __checkpointed_procedure
+from ccd.procedures import resume_procedure as __resume_procedure
+from ccd.procedures import standard_procedure as __standard_procedure
 import numpy as np
-from ccd import app, math_utils, qa
-import importlib
+from ccd import app, diagnostics, math_utils, qa
+from ccd.results import ColumnarResults, pack_mask, stack_segments
 from .version import __version__
 from .version import __algorithm__ as algorithm
 from .version import __name
 
 log = logging.getLogger(__name)
 
+# The inputs of a pixel so far and where its standard procedure stopped, see
+# update
+#   dates: 1-d ndarray of sorted ordinal dates
+#   spectra: 2-d ndarray, (bands, observations)
+#   qas: 1-d ndarray of the qa values as given
+#   params: dict of the processing parameters
+#   checkpoint: ccd.procedures.Checkpoint, None when the next update has to
+#       run over the whole time series
+UpdateState = namedtuple('UpdateState',
+                         ['dates', 'spectra', 'qas', 'params', 'checkpoint'])
+
 
 def attr_from_str(value):
     """Returns a reference to the full qualified function, attribute or class.
@@ -19,24 +35,28 @@ def attr_from_str(value):
         value = Fully qualified path (e.g. 'ccd.models.lasso.fitted_model')
 
     Returns:
-        A reference to the target attribute (e.g. fitted_model)
+        A reference to the target attribute (e.g. fitted_model), or None if
+        it cannot be found, see app.resolve for a version that raises
     """
-    module, target = value.rsplit('.', 1)
     try:
-        obj = importlib.import_module(module)
-        return getattr(obj, target)
-    except (ImportError, AttributeError) as e:
+        return app.resolve(value)
+    except ValueError as e:
         log.debug(e)
         return None
 
 
-def __attach_metadata(procedure_results, probs):
+def __attach_metadata(procedure_results, probs, proc_params, diag=None):
     """
     Attach some information on the algorithm version, what procedure was used,
     and which inputs were used
 
+    The diagnostics collected for the pixel are added under 'diagnostics',
+    or on the diagnostics field of the ColumnarResults, when DIAGNOSTICS is
+    set, see ccd.diagnostics.
+
     Returns:
-        A dict representing the change detection results
+        A dict representing the change detection results, or
+        ccd.results.ColumnarResults when COLUMNAR_RESULTS is set
 
     {algorithm: 'pyccd:x.x.x',
      processing_mask: (bool, bool, ...),
@@ -83,12 +103,34 @@ def __attach_metadata(procedure_results, probs):
     """
     change_models, processing_mask = procedure_results
 
-    return {'algorithm': algorithm,
-            'processing_mask': [int(_) for _ in processing_mask],
-            'change_models': change_models,
-            'cloud_prob': probs[0],
-            'snow_prob': probs[1],
-            'water_prob': probs[2]}
+    if proc_params.COLUMNAR_RESULTS:
+        return ColumnarResults(algorithm=algorithm,
+                               segments=stack_segments(change_models),
+                               processing_mask=pack_mask(processing_mask),
+                               observations=len(processing_mask),
+                               cloud_prob=probs[0],
+                               snow_prob=probs[1],
+                               water_prob=probs[2],
+                               diagnostics=__diagnostics_block(diag))
+
+    results = {'algorithm': algorithm,
+               'processing_mask': [int(_) for _ in processing_mask],
+               'change_models': change_models,
+               'cloud_prob': probs[0],
+               'snow_prob': probs[1],
+               'water_prob': probs[2]}
+
+    if diag is not None:
+        results['diagnostics'] = diag.asdict()
+
+    return results
+
+
+def __diagnostics_block(diag):
+    """
+    The diagnostics dict of a collector, None when nothing was collected.
+    """
+    return None if diag is None else diag.asdict()
 
 
 def __split_dates_spectra(matrix):
@@ -97,8 +139,44 @@ def __split_dates_spectra(matrix):
 
 
 def __sort_dates(dates):
-    """ Sort the values chronologically """
-    return np.argsort(dates)
+    """ Sort the values chronologically, same day values keep their order """
+    return np.argsort(dates, kind='stable')
+
+
+def __is_sorted(dates):
+    """ Check if the values are already in chronological order """
+    return bool(np.all(dates[1:] >= dates[:-1]))
+
+
+def __check_matrix(matrix):
+    """
+    Make sure the pre-stacked input has a row for the dates, each spectral
+    band and the QA.
+
+    Args:
+        matrix: 2-d ndarray, (9, observations)
+    """
+    assert matrix.ndim == 2
+    assert matrix.shape[0] == 9
+
+
+def __check_chip_inputs(dates, quality, spectra):
+    """
+    Make sure the chip inputs are of the correct relative size to each-other.
+
+    Args:
+        dates: 1-d ndarray
+        quality: 2-d ndarray, (pixels, observations)
+        spectra: 3-d ndarray, (bands, pixels, observations)
+    """
+    # Dates are shared across the chip
+    assert dates.ndim == 1
+    assert quality.ndim == 2
+    assert spectra.ndim == 3
+    # Make sure there is quality information for each pixel and date
+    assert quality.shape == spectra.shape[1:]
+    # Make sure there is spectral data for each date
+    assert dates.shape[0] == spectra.shape[2]
 
 
 def __check_inputs(dates, quality, spectra):
@@ -140,14 +218,12 @@ def detect(dates, blues, greens, reds, nirs,
             parameters
 
     Returns:
-        Tuple of ccd.detections namedtuples
+        A dict of the change detection results, see __attach_metadata, or
+        ccd.results.ColumnarResults when COLUMNAR_RESULTS is set
     """
     t1 = time.time()
 
-    proc_params = app.get_default_params()
-
-    if params:
-        proc_params.update(params)
+    proc_params = app.compile_params(params)
 
     dates = np.asarray(dates)
     qas = np.asarray(qas)
@@ -158,13 +234,70 @@ def detect(dates, blues, greens, reds, nirs,
 
     __check_inputs(dates, qas, spectra)
 
-    indices = __sort_dates(dates)
-    dates = dates[indices]
-    spectra = spectra[:, indices]
-    qas = qas[indices]
+    if not __is_sorted(dates):
+        indices = __sort_dates(dates)
+        dates = dates[indices]
+        spectra = spectra[:, indices]
+        qas = qas[indices]
+
+    with diagnostics.collecting(proc_params.DIAGNOSTICS) as diag:
+        results, probs = __detect(dates, spectra, qas, proc_params)
+    log.debug('Total time for algorithm: %s', time.time() - t1)
+
+    # call detect and return results as the detections namedtuple
+    return __attach_metadata(results, probs, proc_params, diag)
 
-    # load the fitter_fn
-    fitter_fn = attr_from_str(proc_params.FITTER_FN)
+
+def detect_matrix(matrix, params=None):
+    """Entry point call to detect change from a pre-stacked array
+
+    Same as detect, with the inputs stacked as the rows of a single array:
+    dates, blue, green, red, nir, swir1, swir2, thermal and qa, such as an
+    integer (9, n) array. The rows are used in place, without conversion or
+    copying, when the dates are already in chronological order. The
+    spectral values keep their dtype until they are fit.
+
+    Args:
+        matrix: 2d-array shaped as (9, observations)
+        params: python dictionary to change module wide processing
+            parameters
+
+    Returns:
+        dict in the same form as returned by detect
+    """
+    t1 = time.time()
+
+    proc_params = app.compile_params(params)
+
+    matrix = np.asarray(matrix)
+
+    __check_matrix(matrix)
+
+    if not __is_sorted(matrix[0]):
+        matrix = matrix[:, __sort_dates(matrix[0])]
+
+    with diagnostics.collecting(proc_params.DIAGNOSTICS) as diag:
+        results, probs = __detect(matrix[0], matrix[1:8], matrix[8],
+                                  proc_params)
+    log.debug('Total time for algorithm: %s', time.time() - t1)
+
+    return __attach_metadata(results, probs, proc_params, diag)
+
+
+def __detect(dates, spectra, qas, proc_params):
+    """
+    Run the change detection on sorted inputs.
+
+    Args:
+        dates: 1-d ndarray of sorted ordinal dates
+        spectra: 2-d ndarray, (bands, observations)
+        qas: 1-d ndarray of qa values
+        proc_params: CompiledParameters
+
+    Returns:
+        tuple: the procedure results and the QA probabilities
+    """
+    fitter_fn = proc_params.function('FITTER_FN')
 
     if proc_params.QA_BITPACKED is True:
         qas = qa.unpackqa(qas, proc_params)
@@ -173,9 +306,235 @@ def detect(dates, blues, greens, reds, nirs,
 
     # Determine which procedure to use for the detection
     procedure = __determine_fit_procedure(qas, proc_params)
+    diagnostics.current().picked(procedure)
 
-    results = procedure(dates, spectra, fitter_fn, qas, proc_params)
-    log.debug('Total time for algorithm: %s', time.time() - t1)
+    return procedure(dates, spectra, fitter_fn, qas, proc_params), probs
 
-    # call detect and return results as the detections namedtuple
-    return __attach_metadata(results, probs)
+
+def detect_chip(dates, spectra, qas, params=None):
+    """Detect change for a chip of pixels that share acquisition dates
+
+    Equivalent to calling detect for each pixel, but the date sorting, QA
+    unpacking, QA probabilities and procedure selection are done once for
+    the whole chip.
+
+    Args:
+        dates: 1d-array or list of ordinal date values, shared by all pixels
+        spectra: 3d-array of spectral values shaped as
+            (bands, pixels, observations), bands are ordered blue, green,
+            red, nir, swir1, swir2, thermal
+        qas: 2d-array of qa band values shaped as (pixels, observations)
+        params: python dictionary to change module wide processing
+            parameters
+
+    Returns:
+        list of dicts, one per pixel, in the same form as returned by detect,
+        or a single ccd.results.ColumnarResults for the chip when
+        COLUMNAR_RESULTS is set
+    """
+    t1 = time.time()
+
+    proc_params = app.compile_params(params)
+
+    dates = np.asarray(dates)
+    qas = np.asarray(qas)
+    spectra = np.asarray(spectra)
+
+    __check_chip_inputs(dates, qas, spectra)
+
+    if not __is_sorted(dates):
+        indices = __sort_dates(dates)
+        dates = dates[indices]
+        qas = qas[:, indices]
+        spectra = spectra[:, :, indices]
+
+    # One copy into (pixels, bands, observations), so that each pixel's
+    # spectra is contiguous
+    spectra = np.ascontiguousarray(spectra.transpose(1, 0, 2))
+
+    fitter_fn = proc_params.function('FITTER_FN')
+
+    if proc_params.QA_BITPACKED is True:
+        qas = qa.unpackqa(qas, proc_params)
+
+    cloud, snow, water = qa.quality_probabilities(qas, proc_params, axis=-1)
+
+    procedures = __determine_fit_procedures(qas, proc_params)
+
+    results = []
+    for idx, procedure in enumerate(procedures):
+        with diagnostics.collecting(proc_params.DIAGNOSTICS) as diag:
+            diagnostics.current().picked(procedure)
+            pixel_results = procedure(dates, spectra[idx], fitter_fn,
+                                      qas[idx], proc_params)
+
+        if proc_params.COLUMNAR_RESULTS:
+            change_models, processing_mask = pixel_results
+            results.append((stack_segments(change_models, idx),
+                            pack_mask(processing_mask),
+                            __diagnostics_block(diag)))
+            continue
+
+        results.append(__attach_metadata(pixel_results,
+                                         (cloud[idx], snow[idx], water[idx]),
+                                         proc_params, diag))
+
+    log.debug('Total time for chip: %s', time.time() - t1)
+
+    if proc_params.COLUMNAR_RESULTS:
+        segments = [stack_segments([])] + [pixel for pixel, _, _ in results]
+        masks = np.array([mask for _, mask, _ in results], dtype=np.uint8)
+
+        return ColumnarResults(
+            algorithm=algorithm,
+            segments=np.concatenate(segments),
+            processing_mask=masks.reshape(len(results),
+                                          (dates.shape[0] + 7) // 8),
+            observations=dates.shape[0],
+            cloud_prob=cloud,
+            snow_prob=snow,
+            water_prob=water,
+            diagnostics=([block for _, _, block in results]
+                         if proc_params.DIAGNOSTICS else None))
+
+    return results
+
+
+def __previous_models(previous_result, checkpoint):
+    """
+    The change models of a previous result that come before a checkpoint.
+    """
+    if isinstance(previous_result, ColumnarResults):
+        segments = previous_result.segments
+        models = list(segments)
+        observations = previous_result.observations
+    else:
+        models = list(previous_result['change_models'])
+        observations = len(previous_result['processing_mask'])
+
+    if len(models) < checkpoint.segments or \
+            observations != checkpoint.observations:
+        raise ValueError('The previous result does not match the state')
+
+    return models[:checkpoint.segments]
+
+
+def update(previous_result, new_dates, new_spectra, new_qa, state,
+           params=None, exact=True):
+    """Update the results of a pixel with newly acquired observations
+
+    Picks the standard procedure up where it stopped on the previous
+    observations, usually the segment left open by lookforward, and only
+    processes what follows, returning the same results as detect over all
+    of the observations.
+
+    The whole time series is run instead when resuming is not possible: the
+    new observations change the variogram or the adjusted peek size, and
+    with them the change threshold, another procedure is picked for the
+    pixel, the parameters differ from those of the state, or a new date is
+    earlier than the previous ones.
+
+    The variogram is a median over the whole time series, so it often moves
+    a little with each acquisition. With exact off, the variogram and peek
+    size the state was built with are kept, every update resumes, and the
+    results may differ slightly from those of detect.
+
+    Start with no previous result and no state, which runs the observations
+    given in full:
+
+        >>> results, state = ccd.update(None, dates, spectra, qas, None)
+        >>> results, state = ccd.update(results, new_dates, new_spectra,
+        ...                             new_qas, state)
+
+    Args:
+        previous_result: results returned with the state, or None
+        new_dates: 1d-array or list of ordinal date values
+        new_spectra: 2d-array of spectral values shaped as
+            (bands, observations), bands are ordered blue, green, red, nir,
+            swir1, swir2, thermal
+        new_qa: 1d-array or list of qa band values
+        state: UpdateState returned with the previous result, or None
+        params: python dictionary to change module wide processing
+            parameters, defaults to those of the state
+        exact: whether the results have to be the same as those of detect
+
+    Returns:
+        tuple of the results, in the same form as returned by detect, and
+        the UpdateState for the next update
+
+    Raises:
+        ValueError: if the previous result does not go with the state
+    """
+    t1 = time.time()
+
+    if params is None and state is not None:
+        params = state.params
+
+    proc_params = app.compile_params(params)
+
+    dates = np.asarray(new_dates)
+    qas = np.asarray(new_qa)
+    spectra = np.asarray(new_spectra)
+
+    __check_inputs(dates, qas, spectra)
+
+    checkpoint = None
+    if state is not None:
+        if state.checkpoint is not None and previous_result is not None and \
+                proc_params.asdict() == state.params:
+            checkpoint = state.checkpoint
+
+        dates = np.concatenate([state.dates, dates])
+        qas = np.concatenate([state.qas, qas])
+        spectra = np.concatenate([state.spectra, spectra], axis=1)
+
+    if not __is_sorted(dates):
+        # The new observations are not all after the previous ones
+        checkpoint = None
+
+        indices = __sort_dates(dates)
+        dates = dates[indices]
+        spectra = spectra[:, indices]
+        qas = qas[indices]
+
+    fitter_fn = proc_params.function('FITTER_FN')
+
+    unpacked = qas
+    if proc_params.QA_BITPACKED is True:
+        unpacked = qa.unpackqa(qas, proc_params)
+
+    probs = qa.quality_probabilities(unpacked, proc_params)
+
+    with diagnostics.collecting(proc_params.DIAGNOSTICS) as diag:
+        procedure = __determine_fit_procedure(unpacked, proc_params)
+        diagnostics.current().picked(procedure)
+
+        resumed = None
+        if procedure is __standard_procedure and checkpoint is not None:
+            resumed = __resume_procedure(
+                dates, spectra, fitter_fn, unpacked, proc_params, checkpoint,
+                __previous_models(previous_result, checkpoint), exact)
+
+        if resumed is not None:
+            log.debug('Resumed from %s observations',
+                      checkpoint.observations)
+            results, processing_mask, checkpoint = resumed
+        elif procedure is __standard_procedure:
+            results, processing_mask, checkpoint = __checkpointed_procedure(
+                dates, spectra, fitter_fn, unpacked, proc_params)
+        else:
+            results, processing_mask = procedure(dates, spectra, fitter_fn,
+                                                 unpacked, proc_params)
+            checkpoint = None
+
+    log.debug('Total time for update: %s', time.time() - t1)
+
+    state = UpdateState(dates=dates,
+                        spectra=spectra,
+                        qas=qas,
+                        params=proc_params.asdict(),
+                        checkpoint=checkpoint)
+
+    return (__attach_metadata((results, processing_mask), probs, proc_params,
+                              diag),
+            state)
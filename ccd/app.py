@@ -11,10 +11,169 @@ Module level constructs are only evaluated once in a Python application's
 lifecycle, usually at the time of first import. This pattern is borrowed
 from Flask.
 """
+import functools
 import hashlib
+import importlib
 
 from ccd import parameters
 
+# Callables resolved so far, by qualified or registered name
+__registry = {}
+
+
+def register(name, fn):
+    """
+    Register a callable under a name, so that parameters such as FITTER_FN
+    can refer to it even if it is not importable by that name.
+
+    Worker processes that are spawned rather than forked need to register
+    the callable as well.
+
+    Args:
+        name: name to refer to the callable by
+        fn: the callable
+
+    Returns:
+        the callable, so this can be used inline
+    """
+    if not callable(fn):
+        raise TypeError('Cannot register non-callable %r as %s' % (fn, name))
+
+    __registry[name] = fn
+
+    return fn
+
+
+def resolve(value):
+    """
+    Returns the callable referenced by a parameter value.
+
+    Names are looked up in the registry first, otherwise they are imported as
+    a fully qualified path (e.g. 'ccd.models.lasso.fitted_models') and the
+    result is kept in the registry for the next lookup.
+
+    Args:
+        value: callable, registered name, or fully qualified path
+
+    Returns:
+        the callable
+
+    Raises:
+        ValueError: if the value cannot be resolved to a callable
+    """
+    if callable(value):
+        return value
+
+    try:
+        return __registry[value]
+    except (KeyError, TypeError):
+        pass
+
+    try:
+        module, target = value.rsplit('.', 1)
+        fn = getattr(importlib.import_module(module), target)
+    except (AttributeError, ImportError, ValueError) as e:
+        raise ValueError('Unable to resolve %r: %s' % (value, e)) from e
+
+    return register(value, fn)
+
+
+def check_fitter(fn, warm_start=True, avg_days_yr=None):
+    """
+    Check that a callable can be called as a FITTER_FN:
+
+        fn(coef_matrix, spectra, max_iter, num_coefficients, warm_start=None)
+
+    returning a FittedModel for each band, see
+    ccd.models.gram_lasso.fitted_models. Callables whose signature cannot be
+    inspected are let through.
+
+    Fitters of the earlier, single band, contract:
+
+        fn(dates, spectra_obs, max_iter, avg_days_yr, num_coefficients)
+
+    such as ccd.models.lasso.fitted_model, are adapted to fit each band in
+    turn when avg_days_yr is given, see ccd.models.band_fitter.
+
+    The outcome is cached for each callable, parameters are compiled for
+    every pixel while the signature only has to be inspected once.
+
+    Args:
+        fn: the callable
+        warm_start: whether it has to take warm_start, see LASSO_WARM_START
+        avg_days_yr: average number of days in a year, see AVG_DAYS_YR,
+            needed to adapt a fitter of the earlier contract
+
+    Returns:
+        the callable, or its adapter for a fitter of the earlier contract
+
+    Raises:
+        ValueError: if the callable cannot be called that way
+    """
+    try:
+        error = __fitter_error(fn, warm_start)
+    except TypeError:
+        # Unhashable callables are checked every time
+        error = __fitter_error.__wrapped__(fn, warm_start)
+
+    if error is None:
+        return fn
+
+    try:
+        earlier = __earlier_contract(fn)
+    except TypeError:
+        earlier = __earlier_contract.__wrapped__(fn)
+
+    if avg_days_yr is not None and earlier:
+        # Imported here to keep app free of the processing modules
+        from ccd.models import band_fitter
+
+        return band_fitter(fn, avg_days_yr)
+
+    raise ValueError(
+        'FITTER_FN %r cannot be called as fn(coef_matrix, spectra, '
+        'max_iter, num_coefficients%s): %s' %
+        (fn, ', warm_start=None' if warm_start else '', error))
+
+
+@functools.lru_cache(maxsize=64)
+def __fitter_error(fn, warm_start):
+    """
+    Why a callable cannot be called as a FITTER_FN, None when it can.
+    """
+    import inspect
+
+    try:
+        signature = inspect.signature(fn)
+    except (TypeError, ValueError):
+        return None
+
+    arguments = {'warm_start': None} if warm_start else {}
+
+    try:
+        signature.bind(None, None, None, None, **arguments)
+    except TypeError as e:
+        return str(e)
+
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def __earlier_contract(fn):
+    """
+    Whether a callable follows the earlier FITTER_FN contract, taking the
+    dates and avg_days_yr, see check_fitter.
+    """
+    import inspect
+
+    try:
+        signature = inspect.signature(fn)
+        signature.bind(None, None, None, None, None)
+    except (TypeError, ValueError):
+        return False
+
+    return bool({'dates', 'avg_days_yr'} & set(signature.parameters))
+
 
 # Simplify parameter setting and make it easier for adjustment
 class Parameters(dict):
@@ -38,6 +197,172 @@ class Parameters(dict):
             raise AttributeError('No such attribute: ' + name)
 
 
+class CompiledParameters(object):
+    """
+    Frozen processing parameters, compiled once for a run.
+
+    Attribute access is a plain slot lookup, instead of a dict lookup behind
+    __getattr__, and the values cannot be changed by the procedures. Keys
+    that are not part of the defaults are kept as well and remain available
+    as attributes. Values derived from the parameters, such as the change
+    threshold for each peek size, are computed once and memoized.
+
+    Parameters ending in _FN name pluggable callables, they are resolved when
+    the parameters are compiled, see resolve, and are available through
+    function. FITTER_FN is checked against the fitter contract, and a fitter
+    of the earlier contract adapted to it, see check_fitter.
+
+    Pickling only carries the parameter values, so handing the object to
+    worker processes is cheap, the memoized values are rebuilt on demand.
+
+    Args:
+        params: dict of processing parameters, missing keys are taken from
+            the defaults
+    """
+    __slots__ = tuple(parameters.defaults) + ('extras', 'functions',
+                                              'thresholds')
+
+    def __init__(self, params):
+        for key, value in parameters.defaults.items():
+            object.__setattr__(self, key, params.get(key, value))
+
+        object.__setattr__(self, 'extras',
+                           {key: value for key, value in params.items()
+                            if key not in parameters.defaults})
+        object.__setattr__(self, 'thresholds', {})
+
+        # Fail now rather than part way through processing
+        object.__setattr__(self, 'functions',
+                           {key: resolve(value) for key, value in
+                            self.asdict().items()
+                            if key.endswith('_FN') and value is not None})
+
+        if 'FITTER_FN' not in self.functions:
+            raise ValueError('FITTER_FN must be set')
+
+        self.functions['FITTER_FN'] = check_fitter(
+            self.functions['FITTER_FN'], self.LASSO_WARM_START,
+            self.AVG_DAYS_YR)
+
+    def __getattr__(self, name):
+        # Only called when the slots do not hold the attribute
+        try:
+            return self.extras[name]
+        except KeyError:
+            raise AttributeError('No such attribute: ' + name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Compiled parameters are read-only: ' + name)
+
+    def __delattr__(self, name):
+        raise AttributeError('Compiled parameters are read-only: ' + name)
+
+    def __reduce__(self):
+        return CompiledParameters, (self.asdict(),)
+
+    def __repr__(self):
+        return 'CompiledParameters(%r)' % self.asdict()
+
+    def asdict(self):
+        """
+        Returns:
+            dict of the parameter values
+        """
+        params = {key: getattr(self, key) for key in parameters.defaults}
+        params.update(self.extras)
+
+        return params
+
+    def function(self, name):
+        """
+        Returns the callable for a pluggable parameter, such as FITTER_FN.
+
+        Args:
+            name: parameter name
+
+        Returns:
+            callable, None for a parameter that is not set
+        """
+        return self.functions.get(name)
+
+    def change_threshold(self, peek_size):
+        """
+        Change threshold adjusted for a peek size, see
+        ccd.change.adjustchgthresh.
+
+        Args:
+            peek_size: number of observations used to detect change
+
+        Returns:
+            float
+        """
+        try:
+            return self.thresholds[peek_size]
+        except KeyError:
+            # Imported here to keep app free of the processing modules
+            from ccd.change import adjustchgthresh
+
+            thresh = adjustchgthresh(peek_size, self.PEEK_SIZE,
+                                     self.CHANGE_THRESHOLD)
+            self.thresholds[peek_size] = thresh
+
+            return thresh
+
+
+class RunParameters(object):
+    """
+    Parameters for processing a single time series.
+
+    Holds the values that are adjusted to the time series being processed,
+    everything else is read from the compiled parameters it wraps, so the
+    shared parameters are never modified.
+
+    Args:
+        params: CompiledParameters
+        peek_size: number of observations used to detect change
+        change_threshold: change threshold adjusted for the peek size
+    """
+    __slots__ = ('params', 'PEEK_SIZE', 'CHANGE_THRESHOLD')
+
+    def __init__(self, params, peek_size, change_threshold):
+        self.params = params
+        self.PEEK_SIZE = peek_size
+        self.CHANGE_THRESHOLD = change_threshold
+
+    def __getattr__(self, name):
+        # Only called when the slots do not hold the attribute, params is
+        # not set yet while the object is being copied or unpickled
+        if name == 'params' or name.startswith('__'):
+            raise AttributeError('No such attribute: ' + name)
+
+        return getattr(self.params, name)
+
+    def __reduce__(self):
+        return RunParameters, (self.params, self.PEEK_SIZE,
+                               self.CHANGE_THRESHOLD)
+
+
+def compile_params(params=None):
+    """
+    Compile processing parameters, filling in the defaults.
+
+    Args:
+        params: dict, Parameters or CompiledParameters, optional
+
+    Returns:
+        CompiledParameters
+    """
+    if isinstance(params, CompiledParameters):
+        return params
+
+    merged = dict(parameters.defaults)
+
+    if params:
+        merged.update(params)
+
+    return CompiledParameters(merged)
+
+
 # Don't need to be going down this rabbit hole just yet
 # mainly here as reference
 def numpy_hashkey(array):
@@ -47,7 +372,7 @@ def numpy_hashkey(array):
 # This is a string.fully.qualified.reference to the fitter function.
 # Cannot import and supply the function directly or we'll get a
 # circular dependency
-FITTER_FN = 'ccd.models.lasso.fitted_model'
+FITTER_FN = 'ccd.models.gram_lasso.fitted_models'
 
 
 def get_default_params():
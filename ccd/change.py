@@ -7,7 +7,6 @@ These should be as close to the functional paradigm as possible.
 """
 import logging
 import numpy as np
-from scipy.stats import chi2
 
 from ccd.models import lasso
 from ccd.math_utils import sum_of_squares
@@ -74,21 +73,66 @@ def change_magnitude(residuals, variogram, comparison_rmse):
     return change_mag
 
 
-def calc_residuals(dates, observations, model, avg_days_yr):
+def calc_residuals(coef_matrix, observations, model, avg_days_yr=None):
     """
     Calculate the residuals using the fitted model.
 
+    The earlier form of the call, calc_residuals(dates, observations, model,
+    avg_days_yr), is still accepted, see lasso.predict.
+
     Args:
-        dates: ordinal dates associated with the observations
+        coef_matrix: harmonic matrix rows associated with the observations,
+            or the ordinal dates when avg_days_yr is given
         observations: spectral observations
         model: named tuple with the scipy model, rmse, and residuals
+        avg_days_yr: average number of days in a year, only for the
+            earlier form of the call
 
     Returns:
         1-d ndarray of residuals
     """
     # This needs to be modularized in the future.
     # Basically the model object should have a predict method with it.
-    return np.abs(observations - lasso.predict(model, dates, avg_days_yr))
+    return np.abs(observations - lasso.predict(model, coef_matrix,
+                                               avg_days_yr))
+
+
+def stack_coefficients(models):
+    """
+    Stack the coefficients and intercepts of the models for every band, so
+    that they can be applied to all of the bands at once.
+
+    Args:
+        models: list of FittedModel, one for each band
+
+    Returns:
+        2-d ndarray: coefficients shaped as (bands, coefficients)
+        1-d ndarray: intercepts for each band
+    """
+    coefs = np.array([model.fitted_model.coef_ for model in models])
+    intercepts = np.array([model.fitted_model.intercept_ for model in models])
+
+    return coefs, intercepts
+
+
+def calc_band_residuals(coef_matrix, observations, coefs, intercepts):
+    """
+    Calculate the residuals of every band with a single matrix product.
+
+    Args:
+        coef_matrix: harmonic matrix rows associated with the observations
+        observations: 2-d ndarray of spectral observations shaped as
+            (bands, observations)
+        coefs: 2-d ndarray of stacked coefficients, see stack_coefficients
+        intercepts: 1-d ndarray of stacked intercepts
+
+    Returns:
+        2-d ndarray of absolute residuals shaped as (bands, observations)
+    """
+    predictions = coefs.dot(coef_matrix.T)
+    predictions += intercepts[:, None]
+
+    return np.abs(observations - predictions)
 
 
 def detect_change(magnitudes, change_threshold):
@@ -301,6 +345,9 @@ def adjustpeek(dates, defpeek):
 def adjustchgthresh(peek, defpeek, defthresh):
     thresh = defthresh
     if peek > defpeek:
+        # scipy.stats is slow to import and only needed for sparse series
+        from scipy.stats import chi2
+
         pt_cg = 1 - (1 - 0.99) ** (defpeek / peek)
         thresh = chi2.ppf(pt_cg, 5)
 
@@ -0,0 +1,718 @@
+"""
+Command line batch engine, installed as pyccd-detect.
+
+Runs change detection over pixel and chip inputs, given as files,
+directories or a manifest listing one path per line:
+
+    .csv  a pixel, one row per observation with the date, the blue, green,
+          red, nir, swir1, swir2 and thermal values and the QA value, as in
+          test/resources
+    .npy  a pixel saved as a (coordinates, detect keyword arguments) object
+          array, as in test/resources, needs --allow-pickle.
+          A numeric (9, observations) array is a pixel as taken by
+          ccd.detect_matrix, and a numeric (9, pixels, observations) array
+          is a chip of such pixels that share their dates
+    .npz  a chip, with dates, spectra and qas arrays as taken by
+          ccd.detect_chip
+
+Pixel inputs are spread across a process pool, chips across the pool of
+ccd.parallel.run_chip. Results are streamed to a JSON lines file, one
+compact line per pixel, as soon as each input finishes:
+
+    {"input": str, "pixel": int, "algorithm": str, "observations": int,
+     "processing_mask": str, "cloud_prob": float, "snow_prob": float,
+     "water_prob": float,
+     "segments": {"start_day": [int], ..., "rmse": [[float]], ...}}
+
+processing_mask is the base64 of the bit-packed mask, see
+ccd.results.pack_mask, and segments holds a list for each SEGMENT_FIELDS
+column of the segments, the band-wise ones as segments x bands and
+coefficients as segments x bands x coefficients. A diagnostics block is
+added with DIAGNOSTICS set. read_results reads the lines back as
+ccd.results.ColumnarResults.
+
+The byte offset of
+the output after each input is appended to a progress file next to it, so
+an interrupted run started again with --resume truncates any partial input
+and skips everything already written.
+
+An input that fails, because it cannot be loaded or detect raises on it, is
+logged and reported at the end of the run, and the run carries on with the
+others. Failed inputs are not recorded as done, so --resume tries them
+again.
+
+Example:
+    $ pyccd-detect --output results.jsonl --workers 8 data/
+    $ pyccd-detect --output results.jsonl --workers 8 data/ --resume
+"""
+import argparse
+import base64
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+import ccd
+from ccd import app, diagnostics, parallel
+from ccd.models import solver_counts
+from ccd.results import SEGMENT_DTYPE, ColumnarResults, from_change_models, \
+    pack_mask, stack_segments
+from ccd.version import __algorithm__ as algorithm
+
+log = logging.getLogger(__name__)
+
+# Extensions of the inputs that are picked up from directories
+EXTENSIONS = ('.csv', '.npy', '.npz')
+
+# Files that directories may hold next to the inputs and that are not
+# inputs, such as the expected coefficients in test/resources
+IGNORED_SUFFIXES = ('_coefficients.csv',)
+
+# Segment columns of the output lines, the pixel is given on the line
+SEGMENT_FIELDS = SEGMENT_DTYPE.names[1:]
+
+# Parameters and pickle setting of the current worker process
+__worker = {}
+
+
+def input_paths(paths, manifest=None):
+    """
+    Expand the input arguments to the list of input files.
+
+    Args:
+        paths: list of file or directory paths, directories contribute their
+            files with one of the EXTENSIONS, in sorted order, except for
+            those with one of the IGNORED_SUFFIXES
+        manifest: optional path of a file listing one input path per line,
+            blank lines and lines starting with # are ignored
+
+    Returns:
+        list of file paths, without duplicates, in the order given
+    """
+    paths = list(paths)
+
+    if manifest is not None:
+        with open(manifest) as f:
+            paths.extend(line.strip() for line in f
+                         if line.strip() and not line.startswith('#'))
+
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, name)
+                         for name in sorted(os.listdir(path))
+                         if name.endswith(EXTENSIONS) and
+                         not name.endswith(IGNORED_SUFFIXES))
+        else:
+            found.append(path)
+
+    return list(dict.fromkeys(found))
+
+
+def load_input(path, allow_pickle=False):
+    """
+    Load an input file.
+
+    Args:
+        path: input file path, see the module documentation for the formats
+        allow_pickle: whether object .npy files may be unpickled
+
+    Returns:
+        tuple of the kind, 'pixel' or 'chip', and a dict of the keyword
+        arguments for ccd.detect or ccd.detect_chip, without the params
+    """
+    if path.endswith('.csv'):
+        rows = np.genfromtxt(path, delimiter=',', dtype=np.int64).T
+        return 'pixel', __pixel_arguments(rows)
+
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return 'chip', {'dates': data['dates'],
+                            'spectra': data['spectra'],
+                            'qas': data['qas']}
+
+    if path.endswith('.npy'):
+        data = np.load(path, allow_pickle=allow_pickle)
+
+        if data.dtype == object:
+            return 'pixel', dict(data[1])
+
+        if data.ndim == 2:
+            return 'pixel', __pixel_arguments(data)
+
+        if data.ndim == 3:
+            return 'chip', {'dates': data[0, 0],
+                            'spectra': data[1:8],
+                            'qas': data[8]}
+
+    raise ValueError('Unsupported input: {}'.format(path))
+
+
+def __pixel_arguments(rows):
+    """
+    Keyword arguments for ccd.detect from the rows of a (9, observations)
+    array.
+    """
+    names = ('dates', 'blues', 'greens', 'reds', 'nirs', 'swir1s', 'swir2s',
+             'thermals', 'qas')
+
+    if rows.ndim != 2 or rows.shape[0] != len(names):
+        raise ValueError('Expected {} values for each observation, got an '
+                         'array shaped as {}'.format(len(names),
+                                                     rows.shape[::-1]))
+
+    return dict(zip(names, rows))
+
+
+def __init_worker(params, allow_pickle):
+    """
+    Set the processing parameters of a worker process.
+    """
+    __worker['params'] = params
+    __worker['allow_pickle'] = allow_pickle
+
+
+def __run_pixel(path):
+    """
+    Run a pixel input in a worker process.
+
+    Returns:
+        tuple of the compact results, see compact, the number of band models
+        fit and the error the input failed with, None when it did not
+    """
+    fits = solver_counts['fits']
+
+    try:
+        _, arguments = load_input(path, __worker['allow_pickle'])
+        result = ccd.detect(params=__worker['params'], **arguments)
+    except Exception as error:
+        return None, 0, __describe(error)
+
+    return compact([result]), solver_counts['fits'] - fits, None
+
+
+def __describe(error):
+    """
+    Message for an input that failed with an exception.
+    """
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def __to_json(value):
+    """
+    Convert numpy values for json.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+def compact(results):
+    """
+    Combine the results of the pixels of an input.
+
+    Args:
+        results: list of what ccd.detect returned for each pixel, dicts or
+            ccd.results.ColumnarResults, or the ccd.parallel.ChipResults of
+            a chip
+
+    Returns:
+        tuple of a ccd.results.ColumnarResults holding every pixel, as for
+        a chip, and the list of the pixels' diagnostics blocks, None for
+        the pixels without one
+    """
+    if isinstance(results, parallel.ChipResults):
+        pixels = results.pixels
+        return (ColumnarResults(algorithm=algorithm,
+                                segments=results.segments,
+                                processing_mask=results.masks,
+                                observations=results.dates.shape[0],
+                                cloud_prob=pixels['cloud_prob'],
+                                snow_prob=pixels['snow_prob'],
+                                water_prob=pixels['water_prob']),
+                [None] * pixels.shape[0])
+
+    segments = []
+    masks = []
+    for idx, result in enumerate(results):
+        if isinstance(result, ColumnarResults):
+            segments.append(stack_segments(result.segments, idx))
+            masks.append(result.processing_mask)
+        else:
+            segments.append(from_change_models(result['change_models'], idx))
+            masks.append(pack_mask(result['processing_mask']))
+
+    def values(name):
+        return np.array([__get(result, name) for result in results])
+
+    return (ColumnarResults(algorithm=__get(results[0], 'algorithm'),
+                            segments=np.concatenate(segments),
+                            processing_mask=np.stack(masks),
+                            observations=__get(results[0], 'observations'),
+                            cloud_prob=values('cloud_prob'),
+                            snow_prob=values('snow_prob'),
+                            water_prob=values('water_prob')),
+            [__get(result, 'diagnostics') for result in results])
+
+
+def __get(result, name):
+    """
+    A value of a detect result, whichever its form.
+    """
+    if isinstance(result, ColumnarResults):
+        return getattr(result, name, None)
+
+    if name == 'observations':
+        return len(result['processing_mask'])
+
+    return result.get(name)
+
+
+def result_lines(path, results, blocks=None):
+    """
+    Compact JSON lines for the results of an input, see the module
+    documentation.
+
+    Args:
+        path: input file path
+        results: ccd.results.ColumnarResults of the input, see compact
+        blocks: optional list of the diagnostics blocks of the pixels
+
+    Returns:
+        str
+    """
+    masks = np.atleast_2d(results.processing_mask)
+    bounds = np.searchsorted(results.segments['pixel'],
+                             np.arange(masks.shape[0] + 1))
+
+    lines = []
+    for pixel, mask in enumerate(masks):
+        segments = results.segments[bounds[pixel]:bounds[pixel + 1]]
+
+        record = {'input': path,
+                  'pixel': pixel,
+                  'algorithm': results.algorithm,
+                  'observations': results.observations,
+                  'processing_mask': base64.b64encode(
+                      mask.tobytes()).decode('ascii'),
+                  'cloud_prob': np.atleast_1d(results.cloud_prob)[pixel],
+                  'snow_prob': np.atleast_1d(results.snow_prob)[pixel],
+                  'water_prob': np.atleast_1d(results.water_prob)[pixel],
+                  'segments': {name: segments[name]
+                               for name in SEGMENT_FIELDS}}
+
+        if blocks and blocks[pixel] is not None:
+            record['diagnostics'] = blocks[pixel]
+
+        lines.append(json.dumps(record, separators=(',', ':'),
+                                default=__to_json))
+
+    return ''.join(line + '\n' for line in lines)
+
+
+def read_results(output_path):
+    """
+    Read the results written by run.
+
+    Args:
+        output_path: path of the JSON lines output
+
+    Returns:
+        generator of (input path, pixel index, ColumnarResults) tuples, the
+        results in the same form as returned by ccd.detect with
+        COLUMNAR_RESULTS set
+    """
+    with open(output_path) as f:
+        for line in f:
+            record = json.loads(line)
+            columns = record['segments']
+
+            segments = np.zeros(len(columns['start_day']),
+                                dtype=SEGMENT_DTYPE)
+            for name in SEGMENT_FIELDS:
+                segments[name] = columns[name]
+
+            mask = np.frombuffer(base64.b64decode(record['processing_mask']),
+                                 dtype=np.uint8)
+
+            yield (record['input'], record['pixel'],
+                   ColumnarResults(algorithm=record['algorithm'],
+                                   segments=segments,
+                                   processing_mask=mask,
+                                   observations=record['observations'],
+                                   cloud_prob=record['cloud_prob'],
+                                   snow_prob=record['snow_prob'],
+                                   water_prob=record['water_prob']))
+
+
+def read_progress(progress_path):
+    """
+    Read the progress file of an earlier run.
+
+    Args:
+        progress_path: path of the progress file
+
+    Returns:
+        tuple of the byte offset of the output after the last completed
+        input and the set of completed input paths
+    """
+    done = set()
+    offset = 0
+
+    if not os.path.exists(progress_path):
+        return offset, done
+
+    with open(progress_path) as f:
+        for line in f:
+            # A line cut short by an interruption is not complete
+            if not line.endswith('\n'):
+                break
+
+            position, path = line.rstrip('\n').split('\t', 1)
+            offset = int(position)
+            done.add(path)
+
+    return offset, done
+
+
+class Writer(object):
+    """
+    Append results to the output and record the progress after each input.
+
+    Args:
+        output_path: path of the JSON lines output
+        resume: continue the output of an earlier run instead of starting
+            over
+    """
+    def __init__(self, output_path, resume):
+        self.progress_path = output_path + '.progress'
+
+        if resume:
+            offset, self.done = read_progress(self.progress_path)
+        else:
+            offset, self.done = 0, set()
+            open(self.progress_path, 'w').close()
+
+        mode = 'r+' if resume and os.path.exists(output_path) else 'w'
+        self.output = open(output_path, mode)
+
+        # Drop whatever an interrupted input had written
+        self.output.seek(offset)
+        self.output.truncate()
+
+        self.progress = open(self.progress_path, 'a')
+
+    def write(self, path, results, blocks=None):
+        self.output.write(result_lines(path, results, blocks))
+        self.output.flush()
+        os.fsync(self.output.fileno())
+
+        self.progress.write('{}\t{}\n'.format(self.output.tell(), path))
+        self.progress.flush()
+
+        self.done.add(path)
+
+    def close(self):
+        self.output.close()
+        self.progress.close()
+
+
+class Throughput(object):
+    """
+    Track and report the pixels and fits per second of a run, and the
+    diagnostics summed over the pixels that carry them, see ccd.diagnostics.
+
+    Args:
+        stream: file to report to
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.start = time.time()
+        self.inputs = 0
+        self.pixels = 0
+        self.fits = 0
+        self.failed = {}
+        self.diagnostics = Counter()
+
+    def add(self, path, pixels, fits, blocks=()):
+        self.inputs += 1
+        self.pixels += pixels
+        self.fits += fits
+
+        for block in blocks:
+            if block is not None:
+                diagnostics.accumulate(self.diagnostics, block)
+
+        log.info('%s: %s pixels, %s fits', path, pixels, fits)
+
+    def fail(self, path, error):
+        self.failed[path] = error
+
+        log.error('%s failed: %s', path, error)
+
+    def report(self):
+        elapsed = max(time.time() - self.start, 1e-9)
+
+        self.stream.write('{} inputs, {} pixels in {:.1f}s: {:.2f} pixels/s, '
+                          '{:.1f} fits/s\n'.format(self.inputs, self.pixels,
+                                                   elapsed,
+                                                   self.pixels / elapsed,
+                                                   self.fits / elapsed))
+
+        if self.failed:
+            self.stream.write('{} inputs failed:\n'.format(len(self.failed)))
+            for path, error in self.failed.items():
+                self.stream.write('  {}: {}\n'.format(path, error))
+
+        if self.diagnostics:
+            self.stream.write('diagnostics: {}\n'.format(
+                json.dumps(dict(sorted(self.diagnostics.items())),
+                           separators=(',', ':'))))
+
+
+def parse_params(path=None, pairs=()):
+    """
+    Processing parameters from the command line.
+
+    Args:
+        path: optional path of a JSON file with a dictionary of parameters
+        pairs: list of KEY=VALUE strings, values are read as JSON when
+            possible and kept as strings otherwise
+
+    Returns:
+        dict
+    """
+    params = {}
+
+    if path is not None:
+        with open(path) as f:
+            params.update(json.load(f))
+
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+
+        if not sep:
+            raise ValueError('Expected KEY=VALUE: {}'.format(pair))
+
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+
+    return params
+
+
+def __positive(value):
+    """
+    Argument type of the counts that have to be at least 1.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError('{} is not a positive integer'
+                                         .format(value))
+
+    return number
+
+
+def parser():
+    """
+    The argument parser of pyccd-detect.
+    """
+    arguments = argparse.ArgumentParser(
+        prog='pyccd-detect',
+        description='Run change detection over pixel and chip inputs.')
+
+    arguments.add_argument('inputs', nargs='*',
+                           help='input files or directories of them')
+    arguments.add_argument('-m', '--manifest',
+                           help='file listing one input path per line')
+    arguments.add_argument('-o', '--output', required=True,
+                           help='JSON lines output file')
+    arguments.add_argument('-w', '--workers', type=__positive,
+                           default=os.cpu_count() or 1,
+                           help='number of worker processes')
+    arguments.add_argument('-c', '--chunk-size', type=__positive,
+                           default=None,
+                           help='most chip pixels handed to a worker at a '
+                                'time')
+    arguments.add_argument('-p', '--params',
+                           help='JSON file of processing parameters')
+    arguments.add_argument('-s', '--set', action='append', default=[],
+                           metavar='KEY=VALUE', dest='pairs',
+                           help='processing parameter, may be repeated')
+    arguments.add_argument('-r', '--resume', action='store_true',
+                           help='continue an interrupted run')
+    arguments.add_argument('-f', '--force', action='store_true',
+                           help='overwrite an existing output')
+    arguments.add_argument('--allow-pickle', action='store_true',
+                           help='load object .npy inputs, only for trusted '
+                                'files')
+    arguments.add_argument('-v', '--verbose', action='store_true',
+                           help='log each input as it finishes')
+
+    return arguments
+
+
+def run(inputs, output, params=None, workers=1, chunk_size=None,
+        resume=False, allow_pickle=False, stream=sys.stderr):
+    """
+    Run change detection over the inputs and stream the results.
+
+    Args:
+        inputs: list of input file paths, see input_paths
+        output: path of the JSON lines output
+        params: python dictionary to change module wide processing
+            parameters
+        workers: number of worker processes
+        chunk_size: most chip pixels handed to a worker at a time
+        resume: skip the inputs an earlier run completed
+        allow_pickle: whether object .npy files may be unpickled
+        stream: file to report the throughput to
+
+    Returns:
+        Throughput of the run, with the inputs that failed and their errors
+        in failed
+
+    Raises:
+        ValueError: if workers is less than 1
+    """
+    if workers < 1:
+        raise ValueError('workers has to be at least 1, got {}'
+                         .format(workers))
+
+    # Have detect build the segment records the output is written from,
+    # unless the diagnostics blocks, which only the dicts carry, are needed
+    params = dict(params or {})
+    if not app.compile_params(params).DIAGNOSTICS:
+        params.setdefault('COLUMNAR_RESULTS', True)
+
+    proc_params = app.compile_params(params)
+
+    writer = Writer(output, resume)
+    throughput = Throughput(stream)
+
+    try:
+        todo = [path for path in inputs if path not in writer.done]
+
+        if len(todo) < len(inputs):
+            log.info('Resuming, %s of %s inputs already done',
+                     len(inputs) - len(todo), len(inputs))
+
+        kinds = {}
+        for path in todo:
+            try:
+                kinds[path] = __input_kind(path)
+            except Exception as error:
+                throughput.fail(path, __describe(error))
+
+        # Inputs whose kind could not be told have already failed
+        pixels = [path for path, kind in kinds.items() if kind == 'pixel']
+        chips = [path for path, kind in kinds.items() if kind == 'chip']
+
+        if pixels:
+            with multiprocessing.Pool(min(workers, len(pixels)),
+                                      __init_worker,
+                                      (proc_params, allow_pickle)) as pool:
+                done = pool.imap(__run_pixel, pixels, chunksize=1)
+
+                for path, (results, fits, error) in zip(pixels, done):
+                    if error is not None:
+                        throughput.fail(path, error)
+                        continue
+
+                    results, blocks = results
+                    writer.write(path, results, blocks)
+                    throughput.add(path, len(blocks), fits, blocks)
+
+        for path in chips:
+            try:
+                _, arguments = load_input(path, allow_pickle)
+                chip = parallel.run_chip(params=proc_params, workers=workers,
+                                         chunk_size=chunk_size, **arguments)
+            except Exception as error:
+                throughput.fail(path, __describe(error))
+                continue
+
+            results, _ = compact(chip)
+            writer.write(path, results)
+            throughput.add(path, chip.pixels.shape[0], chip.load.fits)
+    finally:
+        writer.close()
+        throughput.report()
+
+    return throughput
+
+
+def __input_kind(path):
+    """
+    Whether an input is a pixel or a chip, without loading its data.
+    """
+    if path.endswith('.csv'):
+        return 'pixel'
+
+    if path.endswith('.npz'):
+        return 'chip'
+
+    if path.endswith('.npy'):
+        try:
+            data = np.load(path, mmap_mode='r')
+        except ValueError:
+            # Object arrays cannot be memory mapped, they hold a pixel
+            return 'pixel'
+
+        return 'chip' if data.ndim == 3 else 'pixel'
+
+    raise ValueError('Unsupported input: {}'.format(path))
+
+
+def detect(argv=None):
+    """
+    Entry point of pyccd-detect.
+
+    Args:
+        argv: list of command line arguments, defaults to sys.argv
+
+    Returns:
+        int exit status, 1 when any input failed
+    """
+    args = parser().parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else
+                        logging.WARNING)
+
+    inputs = input_paths(args.inputs, args.manifest)
+
+    if not inputs:
+        sys.stderr.write('No inputs found\n')
+        return 2
+
+    if os.path.exists(args.output) and not (args.resume or args.force):
+        sys.stderr.write('{} exists, use --resume to continue it or --force '
+                         'to overwrite it\n'.format(args.output))
+        return 2
+
+    throughput = run(inputs, args.output,
+                     params=parse_params(args.params, args.pairs),
+                     workers=args.workers,
+                     chunk_size=args.chunk_size,
+                     resume=args.resume,
+                     allow_pickle=args.allow_pickle)
+
+    return 1 if throughput.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(detect())
@@ -0,0 +1,208 @@
+"""
+Per pixel instrumentation of the procedures, opt in through the DIAGNOSTICS
+parameter.
+
+With DIAGNOSTICS set, detect and detect_chip collect what each pixel cost and
+add it to the results as a 'diagnostics' dict:
+
+    {'procedure': 'standard_procedure',
+     'seconds': {'initialize': float, 'lookback': float, 'catch': float,
+                 'lookforward': float, 'total': float},
+     'counts': {'fitter_calls': int, 'fits_reused': int,
+                'design_matrices': int, 'tmask': int,
+                'window_shifts': int, 'window_extensions': int,
+                'tmask_outliers': int, 'outliers': int}}
+
+The seconds are the wall time spent in each step of the standard procedure,
+and total the whole procedure. window_shifts counts the unstable windows
+that initialize moved forward, window_extensions the windows it grew for
+lack of time or observations, tmask_outliers the observations masked by
+Tmask and outliers those masked by lookforward and lookback.
+
+With COLUMNAR_RESULTS set the block goes on the diagnostics field of the
+ColumnarResults, a list of blocks in pixel order for detect_chip. For
+ccd.parallel the diagnostics are only summed in totals.
+
+The procedures find the collector of the running pixel through current, which
+returns a collector that ignores everything when the mode is off, so the
+instrumentation points cost a method call that does nothing.
+
+The diagnostics of every pixel collected in the process are also summed in
+totals, and the blocks returned for a batch, such as those of a pyccd-detect
+run, can be summed with aggregate.
+"""
+import contextlib
+import threading
+import time
+from collections import Counter
+
+# Diagnostics summed over every pixel collected in the process, flat keys:
+# pixels, the counts, the procedure names and the step seconds as
+# seconds.<step>
+totals = Counter()
+
+# Collector of the pixel being processed by each thread
+__local = threading.local()
+
+
+class Diagnostics(object):
+    """
+    Collects the diagnostics of a single pixel.
+
+    Attributes:
+        procedure: name of the procedure picked by fit_procedure
+        seconds: Counter of wall time by procedure step
+        counts: Counter of the work done
+    """
+    __slots__ = ('procedure', 'seconds', 'counts')
+
+    def __init__(self):
+        self.procedure = None
+        self.seconds = Counter()
+        self.counts = Counter()
+
+    def picked(self, procedure):
+        """
+        Record the procedure picked for the pixel.
+
+        Args:
+            procedure: the procedure function
+        """
+        self.procedure = procedure.__name__
+
+    def count(self, name, value=1):
+        """
+        Add to a count.
+
+        Args:
+            name: name of the count
+            value: amount to add
+        """
+        self.counts[name] += value
+
+    @contextlib.contextmanager
+    def timed(self, step):
+        """
+        Add the wall time of the block to a step.
+
+        Args:
+            step: name of the step
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[step] += time.perf_counter() - start
+
+    def asdict(self):
+        """
+        Returns:
+            dict of the diagnostics, see the module documentation
+        """
+        return {'procedure': self.procedure,
+                'seconds': dict(self.seconds),
+                'counts': dict(self.counts)}
+
+
+class Ignored(object):
+    """
+    Stands in for Diagnostics when the mode is off, ignoring everything.
+    """
+    __slots__ = ()
+
+    # Shared by every timed block
+    nothing = contextlib.nullcontext()
+
+    def picked(self, procedure):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def timed(self, step):
+        return self.nothing
+
+
+IGNORED = Ignored()
+
+
+def current():
+    """
+    The collector of the pixel being processed.
+
+    Returns:
+        Diagnostics, or IGNORED when the mode is off
+    """
+    return getattr(__local, 'active', IGNORED)
+
+
+@contextlib.contextmanager
+def collecting(enabled):
+    """
+    Collect the diagnostics of a pixel processed within the block.
+
+    Args:
+        enabled: whether to collect, usually the DIAGNOSTICS parameter
+
+    Yields:
+        Diagnostics, or None when not enabled
+    """
+    if not enabled:
+        yield None
+        return
+
+    diagnostics = Diagnostics()
+    previous = getattr(__local, 'active', IGNORED)
+    __local.active = diagnostics
+
+    try:
+        with diagnostics.timed('total'):
+            yield diagnostics
+    finally:
+        __local.active = previous
+        accumulate(totals, diagnostics.asdict())
+
+
+def accumulate(counter, block):
+    """
+    Add a diagnostics block to a flat Counter, see totals.
+
+    Args:
+        counter: Counter to add to
+        block: dict as returned by Diagnostics.asdict
+    """
+    counter['pixels'] += 1
+
+    if block['procedure'] is not None:
+        counter[block['procedure']] += 1
+
+    counter.update(block['counts'])
+    counter.update({'seconds.' + step: seconds
+                    for step, seconds in block['seconds'].items()})
+
+
+def aggregate(blocks):
+    """
+    Sum the diagnostics blocks of a batch of pixels.
+
+    Args:
+        blocks: iterable of dicts as returned by Diagnostics.asdict, such as
+            the 'diagnostics' of detect results
+
+    Returns:
+        dict with the number of pixels, the number of pixels run by each
+        procedure, and the summed seconds and counts
+    """
+    summed = {'pixels': 0,
+              'procedures': Counter(),
+              'seconds': Counter(),
+              'counts': Counter()}
+
+    for block in blocks:
+        summed['pixels'] += 1
+        summed['procedures'][block['procedure']] += 1
+        summed['seconds'].update(block['seconds'])
+        summed['counts'].update(block['counts'])
+
+    return {key: dict(value) if isinstance(value, Counter) else value
+            for key, value in summed.items()}
@@ -0,0 +1,342 @@
+"""
+Write change detection results to Parquet, and read them back.
+
+Results are flattened into an Arrow table with a row for each segment. Each
+row holds the pixel's x and y coordinates, its QA probabilities and
+bit-packed processing mask, the segment values, and band-wise columns such
+as nir_rmse, nir_magnitude, nir_intercept and nir_coef_0 to nir_coef_6.
+Pixels without any segments get a single row whose segment columns are null.
+
+ResultWriter writes each chip as its own Parquet row group, so only one chip
+is held in memory at a time, and ResultReader rebuilds the detect dicts for
+single pixels, reading only the row groups whose coordinate statistics can
+hold them.
+
+pyarrow is an optional dependency, only needed by this module.
+
+Example:
+    >>> from ccd import io
+    >>> with io.ResultWriter('tile.parquet') as writer:
+    ...     for chip_x, chip_y, dates, spectra, qas in chips:
+    ...         results = ccd.detect_chip(dates, spectra, qas)
+    ...         writer.write(results, xs, ys)
+    >>> io.ResultReader('tile.parquet').pixel(x, y)
+"""
+import numpy as np
+
+from ccd.results import BANDS, NUM_COEFFICIENTS, SEGMENT_DTYPE, \
+    ColumnarResults, change_models, from_change_models, pack_mask, \
+    unpack_mask
+
+# Segment columns, which are null for pixels without segments
+SEGMENT_COLUMNS = ('segment', 'start_day', 'end_day', 'break_day',
+                   'observation_count', 'change_probability', 'curve_qa')
+
+
+def columns(results, xs, ys):
+    """
+    Flatten the results of a chip into columns, with a row for each segment.
+
+    Args:
+        results: list of dicts as returned by detect_chip, or a
+            ccd.results.ColumnarResults for a chip or a single pixel
+        xs: x coordinate of each pixel
+        ys: y coordinate of each pixel
+
+    Returns:
+        tuple of a dict of the column ndarrays, with the null masks of the
+        segment columns under 'null', and the algorithm
+    """
+    if not isinstance(results, ColumnarResults):
+        results = __columnar(results)
+
+    segments = results.segments
+    masks = np.atleast_2d(results.processing_mask)
+    count = masks.shape[0]
+
+    xs = np.broadcast_to(np.asarray(xs, dtype=np.float64), (count,))
+    ys = np.broadcast_to(np.asarray(ys, dtype=np.float64), (count,))
+
+    # One row for each segment, and one for each pixel without any, ordered
+    # by pixel
+    counts = np.bincount(segments['pixel'], minlength=count)
+    empty = np.flatnonzero(counts == 0)
+
+    rows = np.concatenate([segments,
+                           np.zeros(empty.shape[0], dtype=SEGMENT_DTYPE)])
+    rows['pixel'][segments.shape[0]:] = empty
+    rows = rows[np.argsort(rows['pixel'], kind='stable')]
+    pixels = rows['pixel']
+
+    null = counts[pixels] == 0
+    starts = np.concatenate([[0], np.cumsum(np.maximum(counts, 1))])
+
+    data = {'x': xs[pixels],
+            'y': ys[pixels],
+            'cloud_prob': np.atleast_1d(results.cloud_prob)[pixels],
+            'snow_prob': np.atleast_1d(results.snow_prob)[pixels],
+            'water_prob': np.atleast_1d(results.water_prob)[pixels],
+            'observations': np.full(rows.shape[0], results.observations,
+                                    dtype=np.int32),
+            'processing_mask': masks[pixels],
+            'segment': (np.arange(rows.shape[0]) -
+                        starts[pixels]).astype(np.int32),
+            'null': null}
+
+    for name in SEGMENT_COLUMNS[1:]:
+        data[name] = rows[name]
+
+    for band_idx, band in enumerate(BANDS):
+        for name in ('magnitude', 'rmse', 'intercept'):
+            data['{}_{}'.format(band, name)] = rows[name][:, band_idx]
+
+        for idx in range(NUM_COEFFICIENTS):
+            data['{}_coef_{}'.format(band, idx)] = \
+                rows['coefficients'][:, band_idx, idx]
+
+    return data, results.algorithm
+
+
+def __columnar(results):
+    """
+    Convert a list of detect dicts to ColumnarResults.
+    """
+    if not results:
+        raise ValueError('No results to convert')
+
+    segments = [from_change_models(result['change_models'], idx)
+                for idx, result in enumerate(results)]
+
+    return ColumnarResults(
+        algorithm=results[0]['algorithm'],
+        segments=np.concatenate(segments),
+        processing_mask=pack_mask([result['processing_mask']
+                                   for result in results]),
+        observations=len(results[0]['processing_mask']),
+        cloud_prob=np.array([result['cloud_prob'] for result in results]),
+        snow_prob=np.array([result['snow_prob'] for result in results]),
+        water_prob=np.array([result['water_prob'] for result in results]))
+
+
+def to_table(results, xs, ys):
+    """
+    Flatten the results of a chip into an Arrow table.
+
+    Args:
+        results: list of dicts as returned by detect_chip, or a
+            ccd.results.ColumnarResults
+        xs: x coordinate of each pixel
+        ys: y coordinate of each pixel
+
+    Returns:
+        pyarrow.Table, with the algorithm in the schema metadata
+    """
+    import pyarrow as pa
+
+    data, algorithm = columns(results, xs, ys)
+    null = data.pop('null')
+
+    arrays = {}
+    for name, values in data.items():
+        if name == 'processing_mask':
+            arrays[name] = pa.array([mask.tobytes() for mask in values],
+                                    type=pa.binary())
+            continue
+
+        is_segment = name in SEGMENT_COLUMNS or name.startswith(BANDS)
+        arrays[name] = pa.array(values, mask=null if is_segment else None)
+
+    table = pa.table(arrays)
+
+    return table.replace_schema_metadata({'algorithm': algorithm})
+
+
+class ResultWriter(object):
+    """
+    Write the results of chips to a Parquet file, a row group for each
+    write.
+
+    Args:
+        path: Parquet file path
+        compression: Parquet compression codec
+    """
+    def __init__(self, path, compression='snappy'):
+        self.path = path
+        self.compression = compression
+        self.writer = None
+
+    def write(self, results, xs, ys):
+        """
+        Write the results of a chip as a row group.
+
+        Args:
+            results: list of dicts as returned by detect_chip, or a
+                ccd.results.ColumnarResults
+            xs: x coordinate of each pixel
+            ys: y coordinate of each pixel
+        """
+        import pyarrow.parquet as pq
+
+        table = to_table(results, xs, ys)
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema,
+                                           compression=self.compression)
+
+        self.writer.write_table(table, row_group_size=table.num_rows)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def __segments(table):
+    """
+    SEGMENT_DTYPE records of the rows of a table that hold a segment.
+    """
+    present = ~table.column('segment').is_null().to_numpy()
+
+    def column(name):
+        return table.column(name).to_numpy()[present]
+
+    records = np.zeros(int(present.sum()), dtype=SEGMENT_DTYPE)
+
+    for name in SEGMENT_COLUMNS[1:]:
+        records[name] = column(name)
+
+    for band_idx, band in enumerate(BANDS):
+        for name in ('magnitude', 'rmse', 'intercept'):
+            records[name][:, band_idx] = column('{}_{}'.format(band, name))
+
+        for idx in range(NUM_COEFFICIENTS):
+            records['coefficients'][:, band_idx, idx] = \
+                column('{}_coef_{}'.format(band, idx))
+
+    return records
+
+
+def to_result(table, algorithm):
+    """
+    Rebuild the detect dict of a pixel from its rows.
+
+    Args:
+        table: pyarrow.Table holding the rows of a single pixel
+        algorithm: algorithm name and version
+
+    Returns:
+        dict in the same form as returned by detect
+    """
+    first = {name: table.column(name)[0].as_py()
+             for name in ('processing_mask', 'observations', 'cloud_prob',
+                          'snow_prob', 'water_prob')}
+
+    mask = unpack_mask(np.frombuffer(first['processing_mask'], np.uint8),
+                       first['observations'])
+
+    return {'algorithm': algorithm,
+            'processing_mask': [int(_) for _ in mask],
+            'change_models': change_models(__segments(table)),
+            'cloud_prob': first['cloud_prob'],
+            'snow_prob': first['snow_prob'],
+            'water_prob': first['water_prob']}
+
+
+class ResultReader(object):
+    """
+    Read results written by ResultWriter.
+
+    Args:
+        path: Parquet file path
+    """
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.file = pq.ParquetFile(path)
+
+        metadata = self.file.schema_arrow.metadata or {}
+        self.algorithm = metadata.get(b'algorithm', b'').decode()
+
+    def pixel(self, x, y):
+        """
+        Rebuild the detect dict of a single pixel.
+
+        Only the row groups whose x and y statistics include the pixel are
+        read, from the file opened by the reader.
+
+        Args:
+            x: x coordinate of the pixel
+            y: y coordinate of the pixel
+
+        Returns:
+            dict in the same form as returned by detect, None if the pixel
+            is not in the file
+        """
+        metadata = self.file.metadata
+
+        for group in range(metadata.num_row_groups):
+            if not self.__holds(metadata.row_group(group), x, y):
+                continue
+
+            table = self.file.read_row_group(group)
+
+            # Rows of a pixel are contiguous
+            rows = np.flatnonzero((table.column('x').to_numpy() == x) &
+                                  (table.column('y').to_numpy() == y))
+
+            if rows.shape[0]:
+                return to_result(table.slice(rows[0], rows.shape[0]),
+                                 self.algorithm)
+
+        return None
+
+    @staticmethod
+    def __holds(group, x, y):
+        """
+        Whether the x and y statistics of a row group include the pixel,
+        row groups without statistics may hold any pixel.
+        """
+        coordinates = {'x': x, 'y': y}
+
+        for idx in range(group.num_columns):
+            column = group.column(idx)
+            value = coordinates.get(column.path_in_schema)
+
+            if value is None:
+                continue
+
+            stats = column.statistics
+            if stats is not None and stats.has_min_max and \
+                    not stats.min <= value <= stats.max:
+                return False
+
+        return True
+
+    def pixels(self):
+        """
+        Rebuild the detect dicts of every pixel, a row group at a time.
+
+        Returns:
+            generator of ((x, y), dict) tuples
+        """
+        for group in range(self.file.num_row_groups):
+            table = self.file.read_row_group(group)
+
+            xs = table.column('x').to_numpy()
+            ys = table.column('y').to_numpy()
+
+            # Rows of a pixel are contiguous
+            starts = np.flatnonzero(np.concatenate(
+                [[True], (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])]))
+            stops = np.append(starts[1:], table.num_rows)
+
+            for start, stop in zip(starts, stops):
+                yield ((xs[start], ys[start]),
+                       to_result(table.slice(start, stop - start),
+                                 self.algorithm))
@@ -10,7 +10,6 @@ stand-alone. I.e. it should not import any other piece of the overall project.
 from functools import wraps
 
 import numpy as np
-from scipy.stats import mode
 
 # TODO: Cache timings
 # TODO: Numba timings
@@ -25,32 +24,82 @@ def adjusted_variogram(dates, observations):
 
     This attempts to combat commission error due to temporal autocorrelation.
 
+    The smallest lag, in number of observations, whose most common date
+    difference is over 30 days is used. Beyond the lag at which every date
+    difference is over 30 days there is nothing left to check, so at most
+    that many lags are looked at, 31 for unique integer dates.
+
     Args:
-        dates: 1-d array of values representing ordinal day
+        dates: 1-d array of values representing ordinal day, sorted
         observations: 2-d array of spectral observations corresponding to the
-            dates array
+            dates array, or an n-d array with the observations along the
+            last axis, such as (pixels, bands, observations) for a chip of
+            pixels sharing the dates
 
     Returns:
-        1-d ndarray of floats
+        ndarray of floats, shaped as observations without the last axis
+    """
+    lag = variogram_lag(dates)
+
+    if lag is None:
+        return calculate_variogram(observations)
+
+    ids = (dates[lag:] - dates[:-lag]) > 30
+    # Differences of narrow integer values, such as int16, can overflow
+    diff = np.subtract(observations[..., lag:][..., ids],
+                       observations[..., :-lag][..., ids], dtype=np.float64)
+
+    return np.median(np.abs(diff), axis=-1)
+
+
+def variogram_lag(dates):
     """
-    vario = calculate_variogram(observations)
+    Find the lag used by adjusted_variogram.
+
+    Args:
+        dates: 1-d array of values representing ordinal day, sorted
+
+    Returns:
+        int, or None if no lag has a majority difference over 30 days
+    """
+    count = dates.shape[0]
+
+    if count < 2:
+        return None
 
-    for idx in range(dates.shape[0]):
-        var = dates[1 + idx:] - dates[:-idx - 1]
+    # Past this lag every date difference is greater than 30 days
+    last = np.max(np.searchsorted(dates, dates + 30, side='right') -
+                  np.arange(count))
 
-        majority = mode(var)[0]#[0]
+    for lag in range(1, min(last, count - 1) + 1):
+        if majority(dates[lag:] - dates[:-lag]) > 30:
+            return lag
 
-        if majority > 30:
-            diff = observations[:, 1 + idx:] - observations[:, :-idx - 1]
-            ids = var > 30
+    return None
 
-            vario = np.median(np.abs(diff[:, ids]), axis=1)
-            break
 
-    return vario
+def majority(vector):
+    """
+    Most common value of a vector, the smallest one in case of a tie.
 
+    Args:
+        vector: 1-d array of values
 
-def euclidean_norm(vector):
+    Returns:
+        the most common value
+    """
+    if np.issubdtype(vector.dtype, np.integer):
+        # Date differences span a small range, counting is cheaper than the
+        # sort behind np.unique
+        low = vector.min()
+        return low + np.argmax(np.bincount(vector - low))
+
+    values, counts = np.unique(vector, return_counts=True)
+
+    return values[np.argmax(counts)]
+
+
+def euclidean_norm(vector, axis=None):
     """
     Calculate the euclidean norm across a vector
 
@@ -58,11 +107,12 @@ def euclidean_norm(vector):
 
     Args:
         vector: 1-d array of values
+        axis: axis along which to calculate the norm
 
     Returns:
-        float
+        float or ndarray when an axis is given
     """
-    return np.sum(vector ** 2) ** .5
+    return np.sum(vector ** 2, axis=axis) ** .5
 
 
 def sum_of_squares(vector, axis=None):
@@ -155,12 +205,16 @@ def calculate_variogram(observations):
     Helper method to make subsequent code clearer
 
     Args:
-        observations: spectral band values
+        observations: spectral band values, with the observations along the
+            last axis
 
     Returns:
-        1-d ndarray representing the variogram values
+        ndarray representing the variogram values
     """
-    return np.median(np.abs(np.diff(observations)), axis=1)
+    diff = np.subtract(observations[..., 1:], observations[..., :-1],
+                       dtype=np.float64)
+
+    return np.median(np.abs(diff), axis=-1)
 
 
 def mask_duplicate_values(vector):
@@ -199,15 +253,16 @@ def mask_value(vector, val):
     return vector == val
 
 
-def count_value(vector, val):
+def count_value(vector, val, axis=None):
     """
     Count the number of occurrences of a value in the vector.
     
     Args:
-        vector: 1-d ndarray of values
+        vector: 1-d ndarray of values, or n-d array with an axis set
         val: value to count
+        axis: numpy axis to operate on in cases of more than 1-d array
 
     Returns:
-        int
+        int, or ndarray of ints if an axis is given
     """
-    return np.sum(mask_value(vector, val))
+    return np.sum(mask_value(vector, val), axis=axis)
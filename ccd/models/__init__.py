@@ -1,4 +1,8 @@
-from collections import namedtuple
+import copy
+import functools
+from collections import namedtuple, Counter
+
+import numpy as np
 
 # TODO: establish standardize object for handling models used for general
 # regression purposes. This will truly make the code much more modular.
@@ -9,6 +13,298 @@ from collections import namedtuple
 # TODO: give better names to avoid model.model.predict nonsense
 FittedModel = namedtuple('FittedModel', ['fitted_model', 'residual', 'rmse'])
 
+# Solver work summed over every session of the process: the number of fitter
+# calls, band models fit, warm started fits, fits reused from the previous
+# request, solver iterations, and solver iterations saved by the warm starts.
+# The last one is only counted when sessions are asked to.
+solver_counts = Counter()
+
+# Session classes of the fitters that provide their own, see register_session
+__sessions = {}
+
+
+class FitterSession(object):
+    """
+    Fits models for windows of a single time series.
+
+    The standard procedure fits many overlapping windows of the same time
+    series, a session is built once for the series so that a fitter can keep
+    state between those fits. A fitter_fn may provide its own session class,
+    see register_session and the FITTER_SESSION_FN parameter, this default
+    one simply slices the inputs and calls the fitter_fn for every fit.
+
+    Models from a previous fit can be handed back to `fit` as a warm start,
+    they are passed on to the fitter_fn as the warm_start keyword argument.
+    When count_saved is set, every warm started fit is repeated from a cold
+    start to count the solver iterations it saved, this is meant for
+    measurement only as it doubles the work.
+
+    The last fit is remembered, asking again for the same rows and number of
+    coefficients, such as lookforward starting from the window that
+    initialize found stable, returns those models instead of fitting again.
+
+    A snapshot of a session can be extended to the same time series with
+    observations appended, and then fits exactly as the session would have
+    for the longer time series, see ccd.procedures.resume_procedure.
+
+    Args:
+        fitter_fn: function used to fit every spectral band, taking the
+            arguments coef_matrix, spectra, max_iter, num_coefficients
+        coef_matrix: 2-d ndarray, harmonic matrix for every date of the
+            time series
+        observations: 2-d ndarray, spectral values for every date of the
+            time series, shaped as (bands, observations)
+        max_iter: maximum number of iterations for the fitter
+        warm_start: whether fits may start from previous models
+        count_saved: whether to count the iterations saved by warm starts
+
+    Attributes:
+        counts: Counter of the solver work done by this session, see
+            solver_counts
+    """
+    def __init__(self, fitter_fn, coef_matrix, observations, max_iter,
+                 warm_start=True, count_saved=False):
+        self.fitter_fn = fitter_fn
+        self.coef_matrix = coef_matrix
+        self.observations = observations
+        self.max_iter = max_iter
+        self.warm_start = warm_start
+        self.count_saved = count_saved
+        self.counts = Counter()
+        self.last = None
+
+    def fit(self, rows, num_coefficients, residuals=True, warm_start=None):
+        """
+        Fit models to a subset of the time series.
+
+        Args:
+            rows: 1-d ndarray of sorted indices into the time series
+            num_coefficients: how many coefficients to use for the fit
+            residuals: whether the residual vectors are needed, if not they
+                may be left as None
+            warm_start: optional list of FittedModel, one for each band,
+                whose coefficients are used as the starting point
+
+        Returns:
+            list of FittedModel, one for each band
+        """
+        rows = np.asarray(rows)
+
+        if self.last is not None:
+            last_rows, last_coefficients, models = self.last
+
+            if last_coefficients == num_coefficients and \
+                    np.array_equal(last_rows, rows):
+                self.counts['reused'] += 1
+                solver_counts['reused'] += 1
+
+                if residuals:
+                    models = self.residuals(models, rows, num_coefficients)
+                    self.last = (rows, num_coefficients, models)
+
+                return models
+
+        if not self.warm_start:
+            warm_start = None
+
+        models = self.solve(rows, num_coefficients, residuals, warm_start)
+        self.last = (rows, num_coefficients, models)
+
+        return models
+
+    def solve(self, rows, num_coefficients, residuals, warm_start):
+        """
+        Fit models to a subset of the time series, see fit.
+
+        Args:
+            rows: 1-d ndarray of sorted indices into the time series
+            num_coefficients: how many coefficients to use for the fit
+            residuals: whether the residual vectors are needed
+            warm_start: optional list of FittedModel to start from
+
+        Returns:
+            list of FittedModel, one for each band
+        """
+        def fitter(warm_start):
+            if warm_start is None:
+                return self.fitter_fn(self.coef_matrix[rows],
+                                      self.observations[:, rows],
+                                      self.max_iter, num_coefficients)
+
+            return self.fitter_fn(self.coef_matrix[rows],
+                                  self.observations[:, rows],
+                                  self.max_iter, num_coefficients,
+                                  warm_start=warm_start)
+
+        models = fitter(warm_start)
+        self.tally([model.fitted_model for model in models], warm_start,
+                   lambda: [model.fitted_model for model in fitter(None)])
+
+        return models
+
+    def tally(self, models, warm_start, cold_fit):
+        """
+        Count the solver work of a fit.
+
+        Args:
+            models: list of the fitted regression models, their n_iter_
+                attribute is counted when it is available
+            warm_start: the warm start that the models were fit with
+            cold_fit: function returning the same models fit without
+                a warm start, only called when counting saved iterations
+        """
+        counts = Counter(calls=1, fits=len(models),
+                         iterations=sum(getattr(model, 'n_iter_', 0)
+                                        for model in models))
+
+        if warm_start is not None:
+            counts['warm_fits'] = len(models)
+
+            if self.count_saved:
+                counts['iterations_saved'] = sum(
+                    getattr(model, 'n_iter_', 0)
+                    for model in cold_fit()) - counts['iterations']
+
+        self.counts.update(counts)
+        solver_counts.update(counts)
+
+    def snapshot(self):
+        """
+        A copy of the session as it is now, sharing the time series arrays.
+
+        Returns:
+            FitterSession
+        """
+        session = copy.copy(self)
+        session.counts = Counter(self.counts)
+
+        return session
+
+    def extend(self, coef_matrix, observations):
+        """
+        Carry the session over to the time series with observations
+        appended.
+
+        Args:
+            coef_matrix: 2-d ndarray, harmonic matrix for every date of the
+                longer time series, starting with the rows of the current one
+            observations: 2-d ndarray, spectral values for every date of the
+                longer time series, shaped as (bands, observations)
+        """
+        self.coef_matrix = coef_matrix
+        self.observations = observations
+
+    def residuals(self, models, rows, num_coefficients=None):
+        """
+        Make sure the models carry their residual vectors.
+
+        Args:
+            models: list of FittedModel as returned by fit
+            rows: the same rows that the models were fit with
+            num_coefficients: how many coefficients were used for the fit
+
+        Returns:
+            list of FittedModel
+        """
+        if models[0].residual is not None:
+            return models
+
+        coef_matrix = self.coef_matrix[rows]
+        predictions = np.array([model.fitted_model.predict(coef_matrix)
+                                for model in models])
+        residuals = self.observations[:, rows] - predictions
+
+        return [model._replace(residual=residual)
+                for model, residual in zip(models, residuals)]
+
+
+def band_fitter(fitted_model, avg_days_yr):
+    """
+    Adapt a fitter of the earlier, single band, contract:
+
+        fitted_model(dates, spectra_obs, max_iter, avg_days_yr,
+                     num_coefficients)
+
+    such as ccd.models.lasso.fitted_model, to the FITTER_FN contract. The
+    adapted fitter is called once for each band, with the dates taken from
+    the first column of the coefficient matrix. It cannot warm start, a
+    warm_start is ignored.
+
+    Args:
+        fitted_model: fitter of the earlier contract
+        avg_days_yr: average number of days in a year, see AVG_DAYS_YR
+
+    Returns:
+        callable following the FITTER_FN contract
+    """
+    return functools.partial(__fit_each_band, fitted_model, avg_days_yr)
+
+
+def __fit_each_band(fitted_model, avg_days_yr, coef_matrix, spectra, max_iter,
+                    num_coefficients, warm_start=None):
+    """
+    Fit every band through a fitter of the earlier contract, see band_fitter.
+    """
+    dates = coef_matrix[:, 0]
+
+    return [fitted_model(dates, spectrum, max_iter, avg_days_yr,
+                         num_coefficients)
+            for spectrum in spectra]
+
+
+def register_session(fitter_fn, session):
+    """
+    Register the session class of a fitter, which fitter_session builds for
+    it instead of a FitterSession.
+
+    The session is looked up by the fitter_fn itself, a wrapped fitter, such
+    as a functools.partial, has to be registered as well, or its session
+    given through the FITTER_SESSION_FN parameter.
+
+    Args:
+        fitter_fn: function used to fit every spectral band
+        session: class taking the arguments coef_matrix, observations,
+            max_iter, warm_start and count_saved, see
+            ccd.models.gram_lasso.GramSession
+
+    Returns:
+        the session class
+    """
+    __sessions[fitter_fn] = session
+
+    return session
+
+
+def fitter_session(fitter_fn, coef_matrix, observations, max_iter,
+                   warm_start=True, count_saved=False, session=None):
+    """
+    Build the fitting session for a time series.
+
+    Args:
+        fitter_fn: function used to fit every spectral band
+        coef_matrix: 2-d ndarray, harmonic matrix for every date of the
+            time series
+        observations: 2-d ndarray, spectral values for every date of the
+            time series, shaped as (bands, observations)
+        max_iter: maximum number of iterations for the fitter
+        warm_start: whether fits may start from previous models
+        count_saved: whether to count the iterations saved by warm starts
+        session: optional session class to build, defaults to the one
+            registered for the fitter_fn, see register_session
+
+    Returns:
+        FitterSession, or the session class of the fitter_fn
+    """
+    if session is None:
+        session = __sessions.get(fitter_fn)
+
+    if session is None:
+        return FitterSession(fitter_fn, coef_matrix, observations, max_iter,
+                             warm_start, count_saved)
+
+    return session(coef_matrix, observations, max_iter, warm_start,
+                   count_saved)
+
 
 def results_to_changemodel(fitted_models, start_day, end_day, break_day,
                            magnitudes, observation_count, change_probability,
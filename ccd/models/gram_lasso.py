@@ -0,0 +1,504 @@
+"""
+Lasso regression solved by cyclic coordinate descent on the Gram system.
+
+The regressions used by the change detection procedures are tiny, at most 7
+coefficients plus the intercept, so the cost of fitting through
+`sklearn.linear_model.Lasso` is dominated by input validation and object
+setup. Here the centered X'X / X'y system is built once and the solver works
+on that directly.
+
+This is a port of the coordinate descent used by sklearn (alpha of 1, the
+intercept fit by centering, the same update order, and the same duality gap
+convergence check), so the coefficients agree with the sklearn based fitter
+to within its tolerance.
+
+A `GramSession` goes one step further for the standard procedure, the windows
+it fits mostly overlap with the previous ones, so the sufficient statistics
+(X'X, X'y and y'y) are kept for the current rows and updated with rank-one
+additions and removals as the window moves. A refit then costs O(k^2) per band
+instead of a pass over every observation.
+
+Reference:
+    sklearn/linear_model/_cd_fast.pyx enet_coordinate_descent_gram
+"""
+import numpy as np
+
+from ccd.models import FittedModel, FitterSession, register_session
+from ccd.models.lasso import coefficient_matrix
+
+# Regularization and tolerance values used by sklearn's Lasso defaults
+ALPHA = 1.0
+TOL = 1e-4
+
+
+class GramLasso(object):
+    """
+    Lightweight fitted model, holds the same attributes that are used from
+    the sklearn models.
+
+    Attributes:
+        coef_ (np.ndarray): 1D array of model coefficients
+        intercept_ (float): intercept
+        n_iter_ (int): number of coordinate descent iterations run
+    """
+    __slots__ = ('coef_', 'intercept_', 'n_iter_')
+
+    def __init__(self, coef, intercept, n_iter):
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.n_iter_ = n_iter
+
+    def predict(self, X):
+        """ Predict yhat using model
+
+        Args:
+            X (np.ndarray): 2D (n_obs x n_features) design matrix
+
+        Returns:
+            np.ndarray: 1D yhat prediction
+        """
+        return X.dot(self.coef_) + self.intercept_
+
+
+def coordinate_descent(gram, xty, yty, alpha, max_iter, tol, warm_start=None):
+    """
+    Minimize (1 / 2) * ||y - Xw||^2 + alpha * ||w||_1 using only the
+    centered Gram system.
+
+    Starting from the solution of a closely related problem, such as the
+    previous window of the same time series, usually needs far fewer
+    iterations than starting from zero.
+
+    Args:
+        gram: 2-d ndarray, X'X
+        xty: 1-d ndarray, X'y
+        yty: float, y'y
+        alpha: l1 penalty, already scaled by the number of samples
+        max_iter: maximum number of passes over the coefficients
+        tol: convergence tolerance, relative to y'y
+        warm_start: 1-d ndarray, optional starting coefficients
+
+    Returns:
+        1-d ndarray: coefficients
+        int: number of iterations run
+    """
+    # Plain floats are much quicker than numpy scalars for this size
+    Q = gram.tolist()
+    q = xty.tolist()
+    n_features = len(q)
+    features = range(n_features)
+
+    if warm_start is None:
+        w = [0.0] * n_features
+        # H = Q.w
+        H = [0.0] * n_features
+    else:
+        w = warm_start.tolist()
+        H = gram.dot(warm_start).tolist()
+
+    d_w_tol = tol
+    tol = tol * yty
+
+    n_iter = 0
+    for n_iter in range(max_iter):
+        w_max = 0.0
+        d_w_max = 0.0
+
+        for ii in features:
+            Q_ii = Q[ii]
+            if Q_ii[ii] == 0.0:
+                continue
+
+            w_ii = w[ii]
+            tmp = q[ii] - H[ii] + Q_ii[ii] * w_ii
+
+            if tmp > alpha:
+                new_w = (tmp - alpha) / Q_ii[ii]
+            elif tmp < -alpha:
+                new_w = (tmp + alpha) / Q_ii[ii]
+            else:
+                new_w = 0.0
+
+            if new_w != w_ii:
+                delta = new_w - w_ii
+                for jj in features:
+                    H[jj] += delta * Q_ii[jj]
+                w[ii] = new_w
+
+                d_w_ii = delta if delta > 0.0 else -delta
+                if d_w_ii > d_w_max:
+                    d_w_max = d_w_ii
+
+            abs_w = new_w if new_w > 0.0 else -new_w
+            if abs_w > w_max:
+                w_max = abs_w
+
+        if w_max == 0.0 or d_w_max / w_max < d_w_tol or n_iter == max_iter - 1:
+            # The biggest coordinate update of this iteration was smaller
+            # than the tolerance, check the duality gap as the ultimate
+            # stopping criterion
+            q_dot_w = sum(q[jj] * w[jj] for jj in features)
+            R_norm2 = yty - 2.0 * q_dot_w + \
+                sum(w[jj] * H[jj] for jj in features)
+            dual_norm_XtA = max(abs(q[jj] - H[jj]) for jj in features)
+
+            if R_norm2 < 0.0:
+                R_norm2 = 0.0
+
+            if dual_norm_XtA > alpha:
+                const = alpha / dual_norm_XtA
+                gap = 0.5 * (R_norm2 + R_norm2 * const ** 2)
+            else:
+                const = 1.0
+                gap = R_norm2
+
+            gap += (alpha * sum(abs(v) for v in w) - const * yty +
+                    const * q_dot_w)
+
+            if gap < tol:
+                break
+
+    return np.array(w), n_iter + 1
+
+
+def gram_models(gram, xty, yty, n_samples, x_offset, y_offset, max_iter,
+                num_coefficients, total_coefficients, warm_start=None):
+    """
+    Solve the centered Gram systems of every band.
+
+    Args:
+        gram: 2-d ndarray, centered X'X of the populated columns
+        xty: 2-d ndarray, centered X'y shaped as (bands, columns)
+        yty: 1-d ndarray, centered y'y for each band
+        n_samples: number of observations behind the statistics
+        x_offset: 1-d ndarray, column means of X
+        y_offset: 1-d ndarray, means of each band
+        max_iter: maximum number of iterations that the coefficients
+            undergo to find the convergence point.
+        num_coefficients: how many coefficients to use for the fit
+        total_coefficients: length of the returned coefficient vectors
+        warm_start: optional list of FittedModel, one for each band, whose
+            coefficients are used as the starting point
+
+    Returns:
+        list of GramLasso, one for each band
+    """
+    cols = num_coefficients - 1
+
+    models = []
+    for band in range(len(yty)):
+        start = None
+        if warm_start is not None:
+            start = warm_start[band].fitted_model.coef_[:cols]
+
+        coef, n_iter = coordinate_descent(gram, xty[band], yty[band],
+                                          ALPHA * n_samples, max_iter, TOL,
+                                          start)
+
+        coefs = np.zeros(total_coefficients)
+        coefs[:cols] = coef
+
+        models.append(GramLasso(coefs, y_offset[band] - x_offset.dot(coef),
+                                n_iter))
+
+    return models
+
+
+def fit_bands(coef_matrix, spectra, max_iter, num_coefficients,
+              warm_start=None):
+    """
+    Fit a lasso model for each spectral band to a shared coefficient matrix.
+
+    The centering and the Gram matrix are computed once for all of the bands,
+    only the coordinate descent itself is run per band.
+
+    Args:
+        coef_matrix: 2-d ndarray, as built by lasso.coefficient_matrix
+        spectra: 2-d array of values shaped as (bands, observations)
+        max_iter: maximum number of iterations that the coefficients
+            undergo to find the convergence point.
+        num_coefficients: how many coefficients to use for the fit
+        warm_start: optional list of FittedModel to start the solver from
+
+    Returns:
+        list of GramLasso, one for each band
+    """
+    # Only the populated columns take part, the rest stay at zero
+    cols = num_coefficients - 1
+    X = coef_matrix[:, :cols]
+    Y = np.asarray(spectra, dtype=np.float64)
+    n_samples = Y.shape[1]
+
+    X_offset = X.mean(axis=0)
+    Y_offset = Y.mean(axis=1)
+    Xc = X - X_offset
+    Yc = Y - Y_offset[:, None]
+
+    gram = Xc.T.dot(Xc)
+    xty = Yc.dot(Xc)
+    yty = np.einsum('ij,ij->i', Yc, Yc)
+
+    return gram_models(gram, xty, yty, n_samples, X_offset, Y_offset,
+                       max_iter, num_coefficients, coef_matrix.shape[1],
+                       warm_start)
+
+
+def fitted_models(coef_matrix, spectra, max_iter, num_coefficients,
+                  warm_start=None):
+    """Create fully fitted lasso models for every spectral band.
+
+    All of the bands share a single coefficient matrix and Gram computation.
+
+    Args:
+        coef_matrix: 2-d ndarray, rows of the harmonic matrix for the
+            observation dates, see lasso.coefficient_matrix
+        spectra: 2-d array of values corresponding to the observation dates,
+            shaped as (bands, observations)
+        max_iter: maximum number of iterations that the coefficients
+            undergo to find the convergence point.
+        num_coefficients: how many coefficients to use for the fit
+        warm_start: optional list of FittedModel, one for each band, whose
+            coefficients are used as the starting point of the solver
+
+    Returns:
+        list of FittedModel with GramLasso models, one for each band
+    """
+    models = fit_bands(coef_matrix, spectra, max_iter, num_coefficients,
+                       warm_start)
+
+    coefs = np.array([model.coef_ for model in models])
+    intercepts = np.array([model.intercept_ for model in models])
+
+    residuals = spectra - (coefs.dot(coef_matrix.T) + intercepts[:, None])
+    rmses = (np.sum(residuals ** 2, axis=1) /
+             (residuals.shape[1] - num_coefficients)) ** 0.5
+
+    return [FittedModel(fitted_model=model, rmse=rmse, residual=residual)
+            for model, rmse, residual in zip(models, rmses, residuals)]
+
+
+class GramSession(FitterSession):
+    """
+    Fits windows of a single time series from running sufficient statistics.
+
+    The raw sums X'X, X'y, y'y, X'1 and y'1 are kept for the rows of the
+    current fit. When the next fit is requested only the rows that entered or
+    left the window are added or subtracted, the centered Gram system is then
+    derived from the sums. To keep the sums well conditioned the dates column
+    and the spectra are taken relative to the first observation of the time
+    series, and the sums are rebuilt from scratch when most of the rows
+    change or after as many updates as there are rows.
+
+    Args:
+        coef_matrix: 2-d ndarray, harmonic matrix for every date of the
+            time series
+        observations: 2-d ndarray, spectral values for every date of the
+            time series, shaped as (bands, observations)
+        max_iter: maximum number of iterations for the fitter
+        warm_start: whether fits may start from previous models
+        count_saved: whether to count the iterations saved by warm starts
+    """
+    def __init__(self, coef_matrix, observations, max_iter, warm_start=True,
+                 count_saved=False):
+        super(GramSession, self).__init__(fitted_models, coef_matrix,
+                                          observations, max_iter,
+                                          warm_start, count_saved)
+
+        self.x_origin = coef_matrix[0].copy()
+        self.y_origin = np.asarray(observations[:, 0], dtype=np.float64)
+
+        self.X = coef_matrix - self.x_origin
+        self.Y = observations - self.y_origin[:, None]
+
+        self.rows = np.zeros(0, dtype=np.intp)
+        self.updates = 0
+        self.__reset()
+
+    def snapshot(self):
+        """
+        A copy of the session as it is now, sharing the time series arrays.
+
+        Returns:
+            GramSession
+        """
+        session = super(GramSession, self).snapshot()
+
+        # The sums are updated in place
+        for name in ('sxx', 'sx', 'sxy', 'sy', 'syy'):
+            setattr(session, name, getattr(self, name).copy())
+
+        return session
+
+    def extend(self, coef_matrix, observations):
+        """
+        Carry the session over to the time series with observations
+        appended, the sums of the current rows stay as they are.
+
+        Args:
+            coef_matrix: 2-d ndarray, harmonic matrix for every date of the
+                longer time series, starting with the rows of the current one
+            observations: 2-d ndarray, spectral values for every date of the
+                longer time series, shaped as (bands, observations)
+        """
+        super(GramSession, self).extend(coef_matrix, observations)
+
+        self.X = coef_matrix - self.x_origin
+        self.Y = observations - self.y_origin[:, None]
+
+    def __reset(self):
+        num_coef = self.X.shape[1]
+
+        self.sxx = np.zeros((num_coef, num_coef))
+        self.sx = np.zeros(num_coef)
+        self.sxy = np.zeros((self.Y.shape[0], num_coef))
+        self.sy = np.zeros(self.Y.shape[0])
+        self.syy = np.zeros(self.Y.shape[0])
+
+    def __accumulate(self, rows, sign):
+        X = self.X[rows]
+        Y = self.Y[:, rows]
+
+        self.sxx += sign * X.T.dot(X)
+        self.sx += sign * X.sum(axis=0)
+        self.sxy += sign * Y.dot(X)
+        self.sy += sign * Y.sum(axis=1)
+        self.syy += sign * np.einsum('ij,ij->i', Y, Y)
+
+    def __sync(self, rows):
+        """
+        Bring the sufficient statistics in line with the requested rows.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+
+        if self.rows.shape == rows.shape and np.array_equal(self.rows, rows):
+            return
+
+        added = np.setdiff1d(rows, self.rows, assume_unique=True)
+        removed = np.setdiff1d(self.rows, rows, assume_unique=True)
+        changes = added.shape[0] + removed.shape[0]
+
+        if changes >= rows.shape[0] or self.updates + changes > rows.shape[0]:
+            self.__reset()
+            self.__accumulate(rows, 1.0)
+            self.updates = 0
+        else:
+            if added.shape[0]:
+                self.__accumulate(added, 1.0)
+            if removed.shape[0]:
+                self.__accumulate(removed, -1.0)
+            self.updates += changes
+
+        self.rows = rows
+
+    def solve(self, rows, num_coefficients, residuals, warm_start):
+        """
+        Fit models to a subset of the time series from the sufficient
+        statistics, see FitterSession.fit.
+
+        Args:
+            rows: 1-d ndarray of sorted indices into the time series
+            num_coefficients: how many coefficients to use for the fit
+            residuals: whether the residual vectors are needed, if not they
+                are left as None and can be filled in through residuals
+            warm_start: optional list of FittedModel, one for each band,
+                whose coefficients are used as the starting point
+
+        Returns:
+            list of FittedModel with GramLasso models, one for each band
+        """
+        self.__sync(rows)
+
+        cols = num_coefficients - 1
+        n_samples = self.rows.shape[0]
+
+        x_mean = self.sx[:cols] / n_samples
+        y_mean = self.sy / n_samples
+
+        gram = self.sxx[:cols, :cols] - n_samples * np.outer(x_mean, x_mean)
+        xty = self.sxy[:, :cols] - n_samples * np.outer(y_mean, x_mean)
+        yty = self.syy - n_samples * y_mean ** 2
+
+        def solve(warm_start):
+            return gram_models(gram, xty, yty, n_samples,
+                               x_mean + self.x_origin[:cols],
+                               y_mean + self.y_origin,
+                               self.max_iter, num_coefficients,
+                               self.X.shape[1], warm_start)
+
+        models = solve(warm_start)
+        self.tally(models, warm_start, lambda: solve(None))
+
+        if residuals:
+            return self.residuals([FittedModel(fitted_model=model,
+                                               residual=None, rmse=None)
+                                   for model in models], rows,
+                                  num_coefficients)
+
+        # Residual sum of squares straight from the statistics,
+        # ||y - Xw||^2 = y'y - 2w'X'y + w'X'Xw on the centered system
+        coefs = np.array([model.coef_[:cols] for model in models])
+        rss = (yty - 2 * np.einsum('ij,ij->i', coefs, xty) +
+               np.einsum('ij,jk,ik->i', coefs, gram, coefs))
+        rmses = (np.maximum(rss, 0) / (n_samples - num_coefficients)) ** 0.5
+
+        return [FittedModel(fitted_model=model, residual=None, rmse=rmse)
+                for model, rmse in zip(models, rmses)]
+
+    def residuals(self, models, rows, num_coefficients=None):
+        """
+        Make sure the models carry their residual vectors and an RMSE
+        computed from them.
+
+        Args:
+            models: list of FittedModel as returned by fit
+            rows: the same rows that the models were fit with
+            num_coefficients: how many coefficients were used for the fit,
+                needed only when the RMSE is missing
+
+        Returns:
+            list of FittedModel
+        """
+        if models[0].residual is not None:
+            return models
+
+        coefs = np.array([model.fitted_model.coef_ for model in models])
+        intercepts = np.array([model.fitted_model.intercept_
+                               for model in models])
+
+        residuals = self.observations[:, rows] - (
+            coefs.dot(self.coef_matrix[rows].T) + intercepts[:, None])
+
+        if models[0].rmse is None:
+            rmses = (np.sum(residuals ** 2, axis=1) /
+                     (residuals.shape[1] - num_coefficients)) ** 0.5
+        else:
+            rmses = [model.rmse for model in models]
+
+        return [FittedModel(fitted_model=model.fitted_model, rmse=rmse,
+                            residual=residual)
+                for model, rmse, residual in zip(models, rmses, residuals)]
+
+
+register_session(fitted_models, GramSession)
+
+
+def fitted_model(dates, spectra_obs, max_iter, avg_days_yr, num_coefficients):
+    """Create a fully fitted lasso model.
+
+    Drop in replacement for lasso.fitted_model.
+
+    Args:
+        dates: list or ordinal observation dates
+        spectra_obs: list of values corresponding to the observation dates for
+            a single spectral band
+        num_coefficients: how many coefficients to use for the fit
+        max_iter: maximum number of iterations that the coefficients
+            undergo to find the convergence point.
+
+    Returns:
+        FittedModel with a GramLasso model
+    """
+    coef_matrix = coefficient_matrix(dates, avg_days_yr, num_coefficients)
+
+    return fitted_models(coef_matrix, np.asarray(spectra_obs)[None, :],
+                         max_iter, num_coefficients)[0]
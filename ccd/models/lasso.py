@@ -1,14 +1,9 @@
-from sklearn import linear_model
 import numpy as np
 
 from ccd.models import FittedModel
 from ccd.math_utils import calc_rmse
 
 
-def __coefficient_cache_key(observation_dates):
-    return tuple(observation_dates)
-
-
 def coefficient_matrix(dates, avg_days_yr, num_coefficients):
     """
     Fourier transform function to be used for the matrix of inputs for
@@ -68,6 +63,9 @@ def fitted_model(dates, spectra_obs, max_iter, avg_days_yr, num_coefficients):
     """
     coef_matrix = coefficient_matrix(dates, avg_days_yr, num_coefficients)
 
+    # sklearn is only needed when this fitter is chosen, see FITTER_FN
+    from sklearn import linear_model
+
     lasso = linear_model.Lasso(max_iter=max_iter)
     model = lasso.fit(coef_matrix, spectra_obs)
 
@@ -77,7 +75,73 @@ def fitted_model(dates, spectra_obs, max_iter, avg_days_yr, num_coefficients):
     return FittedModel(fitted_model=model, rmse=rmse, residual=residuals)
 
 
-def predict(model, dates, avg_days_yr):
-    coef_matrix = coefficient_matrix(dates, avg_days_yr, 8)
+def fitted_models(coef_matrix, spectra, max_iter, num_coefficients,
+                  warm_start=None):
+    """Create a fully fitted lasso model for every spectral band.
+
+    Args:
+        coef_matrix: 2-d ndarray, rows of the harmonic matrix for the
+            observation dates, see coefficient_matrix
+        spectra: 2-d array of values corresponding to the observation dates,
+            shaped as (bands, observations)
+        max_iter: maximum number of iterations that the coefficients
+            undergo to find the convergence point.
+        num_coefficients: how many coefficients to use for the fit
+        warm_start: optional list of FittedModel, one for each band, whose
+            coefficients are used as the starting point of the solver
+
+    Returns:
+        list of FittedModel, one for each band
+    """
+    from sklearn import linear_model
+
+    # Same layout as coefficient_matrix, the unused columns are zeroed out
+    matrix = np.array(coef_matrix, order='F')
+    matrix[:, num_coefficients - 1:] = 0
+
+    models = []
+    for band, spectrum in enumerate(spectra):
+        lasso = linear_model.Lasso(max_iter=max_iter,
+                                   warm_start=warm_start is not None)
+
+        if warm_start is not None:
+            coef = np.zeros(matrix.shape[1])
+            coef[:num_coefficients - 1] = \
+                warm_start[band].fitted_model.coef_[:num_coefficients - 1]
+            lasso.coef_ = coef
+
+        model = lasso.fit(matrix, spectrum)
+
+        predictions = model.predict(matrix)
+        rmse, residuals = calc_rmse(spectrum, predictions,
+                                    num_pm=num_coefficients)
+
+        models.append(FittedModel(fitted_model=model, rmse=rmse,
+                                  residual=residuals))
+
+    return models
+
+
+def predict(model, coef_matrix, avg_days_yr=None):
+    """
+    Predict values using the fitted model.
+
+    The earlier form of the call, predict(model, dates, avg_days_yr), is
+    still accepted and builds the harmonic matrix for the dates.
+
+    Args:
+        model: FittedModel
+        coef_matrix: 2-d ndarray, rows of the harmonic matrix for the
+            dates to predict, see coefficient_matrix, or the ordinal dates
+            when avg_days_yr is given
+        avg_days_yr: average number of days in a year, only for the
+            earlier form of the call
+
+    Returns:
+        1-d ndarray of predicted values
+    """
+    if avg_days_yr is not None:
+        coef_matrix = coefficient_matrix(np.asarray(coef_matrix),
+                                         avg_days_yr, 8)
 
     return model.fitted_model.predict(coef_matrix)
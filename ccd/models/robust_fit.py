@@ -8,15 +8,14 @@ Reference:
     http://cran.r-project.org/web/packages/robustreg/index.html
     http://cran.r-project.org/doc/contrib/Fox-Companion/appendix-robust-regression.pdf
 
-Run this file to test performance gains. Implementation is ~3x faster than
-statsmodels and can reach ~4x faster if Numba is available to accelerate.
+Implementation is ~3x faster than statsmodels and can reach ~4x faster if
+Numba is available to accelerate. Its performance is tracked by the tmask
+stage of benchmarks/suite.py (make bench).
 
 """
 # Don't alias to ``np`` until fix is implemented
 # https://github.com/numba/numba/issues/1559
 import numpy
-import sklearn
-import scipy
 
 # from yatsm.accel import try_jit
 
@@ -101,7 +100,7 @@ def _weight_fit(X, y, w):
 
 
 # Robust regression
-class RLM(sklearn.base.BaseEstimator):
+class RLM(object):
     """ Robust Linear Model using Iterative Reweighted Least Squares (RIRLS)
 
     Perform robust fitting regression via iteratively reweighted least squares
@@ -158,11 +157,12 @@ class RLM(sklearn.base.BaseEstimator):
                 chaining
 
         """
-        self.coef_, resid = _weight_fit(X, y, numpy.ones_like(y))
+        # Float weights, integer ones would drag the fit down to float16
+        self.coef_, resid = _weight_fit(X, y, numpy.ones(y.shape[0]))
         self.scale = self.scale_est(resid, c=self.scale_constant)
 
 
-        Q, R = scipy.linalg.qr(X)
+        Q, R = numpy.linalg.qr(X)
         E = X.dot(numpy.linalg.inv(R[0:X.shape[1],0:X.shape[1]]))
         const_h= numpy.ones(X.shape[0])*0.9999
 
@@ -0,0 +1,469 @@
+"""
+Run change detection for a chip of pixels across a pool of processes.
+
+The chip inputs are placed in `multiprocessing.shared_memory` once, the
+workers attach to it when they start and index their pixels from it without
+any copying or pickling. Results are written back in a compact form to
+shared output buffers:
+
+    pixels: a PIXEL_DTYPE record for each pixel, holding the QA
+        probabilities, the procedure used and the number of segments
+    segments: SEGMENT_DTYPE records, max_segments slots for each pixel,
+        pixels with more segments hand the rest back through the pool
+    masks: the processing masks, bit-packed with np.packbits
+
+Each pixel always writes to the same location, so the output order does not
+depend on the order in which the workers finish.
+
+Pixel runtimes are skewed, a pixel that keeps shifting its initialization
+window costs many times more than a stable one. Pixels are ordered by their
+predicted cost, most expensive first, and grouped in batches that shrink as
+the remaining work does. Idle workers take the next batch from the pool's
+shared queue, so the cheap pixels at the end fill in around the expensive
+ones instead of leaving workers waiting on a static chunk.
+
+Example:
+    >>> from ccd import parallel
+    >>> results = parallel.detect_chip(dates, spectra, qas, workers=4)
+"""
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ccd import app, qa
+from ccd.models import solver_counts
+from ccd.procedures import fit_procedures, permanent_snow_procedure, \
+    insufficient_clear_procedure, standard_procedure
+from ccd.results import SEGMENT_DTYPE, change_models, pack_mask, \
+    stack_segments, unpack_mask
+from ccd.version import __algorithm__ as algorithm
+
+log = logging.getLogger(__name__)
+
+# Procedures are passed to the workers by their index in here
+PROCEDURES = (standard_procedure, permanent_snow_procedure,
+              insufficient_clear_procedure)
+
+PIXEL_DTYPE = np.dtype([('procedure', np.int8),
+                        ('segments', np.int32),
+                        ('cloud_prob', np.float64),
+                        ('snow_prob', np.float64),
+                        ('water_prob', np.float64)])
+
+# Relative cost of the snow and insufficient clear procedures, which fit a
+# single model, to the standard procedure for the same observations
+SINGLE_FIT_COST = 0.1
+
+# Batches target this fraction of the remaining cost per worker
+BATCH_FRACTION = 0.25
+
+# Compact results for a chip, see the module documentation
+ChipResults = namedtuple('ChipResults', ['dates', 'pixels', 'segments',
+                                         'masks', 'load'])
+
+# How the work was spread over the workers
+#   wall: seconds spent running the batches
+#   busy: dict of seconds each worker process spent running pixels
+#   batches: number of batches
+#   imbalance: busiest worker's time over the mean worker time, 1 is even
+#   efficiency: fraction of the available worker time spent running pixels
+#   fits: number of band models fit, see ccd.models.solver_counts
+LoadStats = namedtuple('LoadStats', ['wall', 'busy', 'batches', 'imbalance',
+                                     'efficiency', 'fits'])
+
+# Shared arrays of the current worker process, set by __init_worker
+__worker = {}
+
+
+class SharedArray(object):
+    """
+    A numpy array backed by a shared memory block.
+
+    Args:
+        shape: array shape
+        dtype: array dtype
+        name: name of an existing block to attach to, a new block is
+            created if None
+    """
+    def __init__(self, shape, dtype, name=None):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+
+        # Pool workers share the resource tracker of the process that
+        # created the block, which unlinks it once the chip is done
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None,
+                                              size=size)
+
+        self.spec = (tuple(shape), dtype, self.shm.name)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    def close(self):
+        # Views into the buffer have to go first
+        self.array = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def __init_worker(specs, params):
+    """
+    Attach to the shared chip arrays in a worker process.
+    """
+    __worker['shared'] = {key: SharedArray(*spec)
+                          for key, spec in specs.items()}
+    __worker['params'] = params
+
+
+def __run_batch(batch):
+    """
+    Run the pixels of a batch and write their results to the shared outputs.
+
+    Args:
+        batch: 1-d array of pixel indices
+
+    Returns:
+        tuple of a list of SEGMENT_DTYPE arrays with the segments that did
+        not fit in the pixel's slots, the worker's process id, the seconds
+        spent on the batch and the number of band models fit
+    """
+    t1 = time.time()
+    fits = solver_counts['fits']
+
+    shared = __worker['shared']
+    params = __worker['params']
+    fitter_fn = params.function('FITTER_FN')
+
+    dates = shared['dates'].array
+    spectra = shared['spectra'].array
+    qas = shared['qas'].array
+    pixels = shared['pixels'].array
+    segments = shared['segments'].array
+    masks = shared['masks'].array
+
+    max_segments = segments.shape[1]
+
+    overflow = []
+    for idx in batch:
+        procedure = PROCEDURES[pixels['procedure'][idx]]
+
+        models, processing_mask = procedure(dates, spectra[idx], fitter_fn,
+                                            qas[idx], params)
+
+        records = stack_segments(models, idx)
+
+        pixels['segments'][idx] = records.shape[0]
+        segments[idx, :records.shape[0]] = records[:max_segments]
+        masks[idx] = pack_mask(processing_mask)
+
+        if records.shape[0] > max_segments:
+            overflow.append(records[max_segments:])
+
+    return (overflow, os.getpid(), time.time() - t1,
+            solver_counts['fits'] - fits)
+
+
+def predicted_costs(quality, procedures, proc_params):
+    """
+    Estimate the relative runtime of each pixel in a chip.
+
+    The standard procedure's work grows with the number of clear
+    observations, the observation count times the clear ratio. The
+    procedures that fit a single model are weighted by SINGLE_FIT_COST.
+
+    Args:
+        quality: 2-d array of unpacked QA information, shaped as
+            (pixels, observations)
+        procedures: list of the procedure for each pixel, see
+            ccd.procedures.fit_procedures
+        proc_params: dictionary of processing parameters
+
+    Returns:
+        1-d ndarray of costs
+    """
+    clear = qa.count_clear_or_water(quality, proc_params.QA_CLEAR,
+                                    proc_params.QA_WATER, axis=-1)
+
+    single = np.array([procedure is not standard_procedure
+                       for procedure in procedures], dtype=bool)
+
+    return np.where(single, SINGLE_FIT_COST, 1.0) * (clear + 1)
+
+
+def schedule(costs, workers, max_batch=None):
+    """
+    Group pixels into batches, the most expensive pixels first.
+
+    Each batch takes pixels until it holds BATCH_FRACTION of the cost still
+    left per worker, so the batches start out large and shrink towards the
+    end of the chip, where they fill in the gaps between workers.
+
+    Args:
+        costs: 1-d array of predicted pixel costs, see predicted_costs
+        workers: number of worker processes
+        max_batch: most pixels in a batch, None for no limit
+
+    Returns:
+        list of 1-d ndarrays of pixel indices
+    """
+    order = np.argsort(-np.asarray(costs, dtype=float), kind='stable')
+    remaining = float(np.sum(costs))
+
+    batches = []
+    batch = []
+    batch_cost = 0.0
+    target = remaining * BATCH_FRACTION / workers
+
+    for idx in order:
+        batch.append(idx)
+        batch_cost += costs[idx]
+
+        if batch_cost >= target or len(batch) == max_batch:
+            batches.append(np.array(batch))
+            remaining -= batch_cost
+            batch = []
+            batch_cost = 0.0
+            target = remaining * BATCH_FRACTION / workers
+
+    if batch:
+        batches.append(np.array(batch))
+
+    return batches
+
+
+def load_stats(wall, timings, workers, fits=0):
+    """
+    Summarize how evenly the batches were spread over the workers.
+
+    Args:
+        wall: seconds spent running the batches
+        timings: list of (process id, seconds) tuples, one for each batch
+        workers: number of worker processes
+        fits: number of band models fit
+
+    Returns:
+        LoadStats
+    """
+    busy = {}
+    for pid, seconds in timings:
+        busy[pid] = busy.get(pid, 0.0) + seconds
+
+    # Workers that never got a batch count as idle
+    times = list(busy.values()) + [0.0] * (workers - len(busy))
+    mean = sum(times) / workers
+
+    return LoadStats(wall=wall,
+                     busy=busy,
+                     batches=len(timings),
+                     imbalance=max(times) / mean if mean else 1.0,
+                     efficiency=sum(times) / (workers * wall) if wall else 1.0,
+                     fits=fits)
+
+
+def run_chip(dates, spectra, qas, params=None, workers=None, chunk_size=None,
+             max_segments=16):
+    """
+    Run change detection for a chip of pixels that share acquisition dates,
+    returning the compact results.
+
+    Args:
+        dates: 1d-array or list of ordinal date values, shared by all pixels
+        spectra: 3d-array of spectral values shaped as
+            (bands, pixels, observations), bands are ordered blue, green,
+            red, nir, swir1, swir2, thermal
+        qas: 2d-array of qa band values shaped as (pixels, observations)
+        params: python dictionary to change module wide processing
+            parameters
+        workers: number of worker processes, defaults to the number of
+            CPUs, 1 runs everything in this process
+        chunk_size: most pixels handed to a worker at a time, None sizes
+            the batches by their predicted cost only, see schedule
+        max_segments: number of segments that each pixel has room for in
+            the shared output, any more are handed back through the pool
+
+    Returns:
+        ChipResults, with the sorted dates, a PIXEL_DTYPE array, a
+        SEGMENT_DTYPE array ordered by pixel, the bit-packed processing
+        masks and the LoadStats of the run
+    """
+    t1 = time.time()
+
+    # The workers build the segment records directly
+    proc_params = app.compile_params(params)
+    proc_params = app.compile_params(dict(proc_params.asdict(),
+                                          COLUMNAR_RESULTS=True))
+
+    dates = np.asarray(dates)
+    qas = np.asarray(qas)
+    spectra = np.asarray(spectra)
+
+    # Same checks as ccd.detect_chip
+    assert dates.ndim == 1
+    assert qas.ndim == 2
+    assert spectra.ndim == 3
+    assert qas.shape == spectra.shape[1:]
+    assert dates.shape[0] == spectra.shape[2]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    count, obs_count = qas.shape
+
+    if proc_params.QA_BITPACKED is True:
+        qas = qa.unpackqa(qas, proc_params)
+
+    # Same order as ccd.detect_chip, which only sorts dates that are out of
+    # order, and keeps the order of same day observations so that the same
+    # duplicates are masked
+    if np.all(dates[1:] >= dates[:-1]):
+        indices = slice(None)
+    else:
+        indices = np.argsort(dates, kind='stable')
+
+    shared = {}
+    try:
+        shared['dates'] = SharedArray(dates.shape, dates.dtype)
+        shared['spectra'] = SharedArray((count, spectra.shape[0], obs_count),
+                                        spectra.dtype)
+        shared['qas'] = SharedArray(qas.shape, qas.dtype)
+        shared['pixels'] = SharedArray((count,), PIXEL_DTYPE)
+        shared['segments'] = SharedArray((count, max_segments), SEGMENT_DTYPE)
+        shared['masks'] = SharedArray((count, (obs_count + 7) // 8),
+                                      np.uint8)
+
+        # The single copy of the inputs, sorted by date and with each
+        # pixel's spectra contiguous
+        shared['dates'].array[:] = dates[indices]
+        shared['spectra'].array[:] = spectra.transpose(1, 0, 2)[..., indices]
+        shared['qas'].array[:] = qas[:, indices]
+
+        pixels = shared['pixels'].array
+        pixels[:] = 0
+
+        probs = qa.quality_probabilities(shared['qas'].array, proc_params,
+                                         axis=-1)
+        pixels['cloud_prob'], pixels['snow_prob'], pixels['water_prob'] = probs
+
+        procedures = fit_procedures(shared['qas'].array, proc_params)
+        pixels['procedure'] = [PROCEDURES.index(procedure)
+                               for procedure in procedures]
+
+        costs = predicted_costs(shared['qas'].array, procedures, proc_params)
+        batches = schedule(costs, workers, chunk_size)
+
+        specs = {key: array.spec for key, array in shared.items()}
+
+        t2 = time.time()
+
+        if workers == 1 or len(batches) == 1:
+            workers = 1
+            __worker.update(shared=shared, params=proc_params)
+            try:
+                done = [__run_batch(batch) for batch in batches]
+            finally:
+                __worker.clear()
+        else:
+            # One batch at a time, the next batch goes to whichever worker
+            # frees up first
+            with multiprocessing.Pool(workers, __init_worker,
+                                      (specs, proc_params)) as pool:
+                done = list(pool.imap_unordered(__run_batch, batches,
+                                                chunksize=1))
+
+        load = load_stats(time.time() - t2,
+                          [(pid, seconds) for _, pid, seconds, _ in done],
+                          workers,
+                          sum(fits for _, _, _, fits in done))
+
+        overflow = [records for chunk, _, _, _ in done for records in chunk]
+
+        results = ChipResults(dates=shared['dates'].array.copy(),
+                              pixels=pixels.copy(),
+                              segments=__gather_segments(
+                                  pixels['segments'],
+                                  shared['segments'].array,
+                                  overflow),
+                              masks=shared['masks'].array.copy(),
+                              load=load)
+    finally:
+        for array in shared.values():
+            array.unlink()
+
+    log.debug('Total time for chip of %s pixels over %s workers: %s',
+              count, workers, time.time() - t1)
+    log.debug('Load over %s batches, imbalance: %.2f, efficiency: %.2f',
+              load.batches, load.imbalance, load.efficiency)
+
+    return results
+
+
+def __gather_segments(counts, slots, overflow):
+    """
+    Collect the segments of every pixel, in pixel order, from their slots
+    and from what did not fit in them.
+    """
+    filled = np.arange(slots.shape[1]) < counts[:, None]
+    segments = slots[filled]
+
+    if not overflow:
+        return segments
+
+    overflow = np.concatenate(overflow)
+    segments = np.concatenate([segments, overflow])
+
+    # Slots come before the overflow for a pixel, a stable sort keeps that
+    return segments[np.argsort(segments['pixel'], kind='stable')]
+
+
+def to_results(chip):
+    """
+    Expand compact chip results into the dicts returned by ccd.detect.
+
+    Args:
+        chip: ChipResults
+
+    Returns:
+        list of dicts, one per pixel
+    """
+    obs_count = chip.dates.shape[0]
+    bounds = np.concatenate([[0], np.cumsum(chip.pixels['segments'])])
+    masks = unpack_mask(chip.masks, obs_count)
+
+    results = []
+    for idx, pixel in enumerate(chip.pixels):
+        models = change_models(chip.segments[bounds[idx]:bounds[idx + 1]])
+
+        # The single model of the snow and insufficient clear procedures
+        # comes back as a tuple
+        if models and PROCEDURES[pixel['procedure']] is not standard_procedure:
+            models = tuple(models)
+
+        results.append({'algorithm': algorithm,
+                        'processing_mask': [int(_) for _ in masks[idx]],
+                        'change_models': models,
+                        'cloud_prob': pixel['cloud_prob'],
+                        'snow_prob': pixel['snow_prob'],
+                        'water_prob': pixel['water_prob']})
+
+    return results
+
+
+def detect_chip(dates, spectra, qas, params=None, workers=None,
+                chunk_size=None, max_segments=16):
+    """
+    Detect change for a chip of pixels across a pool of processes.
+
+    Same inputs and results as ccd.detect_chip, see run_chip for the
+    remaining arguments and for the compact form of the results.
+
+    Returns:
+        list of dicts, one per pixel, in the same form as returned by detect
+    """
+    return to_results(run_chip(dates, spectra, qas, params, workers,
+                               chunk_size, max_segments))
@@ -82,6 +82,28 @@ defaults = {
     ############################
     # Values related to model fitting
     ############################
-    'FITTER_FN': 'ccd.models.lasso.fitted_model',
+    'FITTER_FN': 'ccd.models.gram_lasso.fitted_models',
+    # Session class the standard procedure fits through, None for the one
+    # registered for FITTER_FN, see ccd.models.register_session
+    'FITTER_SESSION_FN': None,
     'LASSO_MAX_ITER': 1000,
+
+    # Start the refits of a window from the previously fitted coefficients,
+    # optionally repeating them from a cold start to count the solver
+    # iterations saved (measurement only, doubles the fitting work). Off by
+    # default, the solver then stops at another point within its tolerance,
+    # which moves the coefficients and intercepts by up to a few percent
+    'LASSO_WARM_START': False,
+    'LASSO_COUNT_SAVED': False,
+
+    ############################
+    # Output
+    ############################
+    # Return numpy structured arrays and bit-packed processing masks, see
+    # ccd.results, instead of nested dicts
+    'COLUMNAR_RESULTS': False,
+
+    # Add the per pixel timings and counts of the procedures to the results,
+    # see ccd.diagnostics
+    'DIAGNOSTICS': False,
 }
@@ -9,6 +9,16 @@ functional paradigm.
 Any methods determined by the fit_procedure call must accept same 5 arguments,
 in the same order: dates, observations, fitter_fn, quality, proc_params.
 
+The fitter_fn fits every spectral band at once, it must accept the arguments:
+coef_matrix, observations (bands, n), max_iter, num_coefficients, and return a
+list with a FittedModel for each band. The coef_matrix rows are sliced from the
+harmonic matrix that is built once for the whole time series, see
+`ccd.models.lasso.coefficient_matrix`. The standard procedure fits through a
+`ccd.models.FitterSession` built for the time series, a fitter_fn can supply
+its own session class to reuse work between the fits of overlapping windows,
+registered with `ccd.models.register_session` or given as the
+FITTER_SESSION_FN parameter.
+
 The results of this process is a list-of-lists of change models that correspond
 to observation spectra. A processing mask is also returned, outlining which
 observations were utilized and which were not.
@@ -23,19 +33,61 @@ For more information please refer to the pyccd Algorithm Description Document.
    https://drive.google.com/drive/folders/0BzELHvbrg1pDREJlTF8xOHBZbEU
 """
 import logging
+from collections import namedtuple
+
 import numpy as np
 
-from ccd import qa
+from ccd import app, diagnostics, qa
 from ccd.change import enough_samples, enough_time,\
-    update_processing_mask, stable, determine_num_coefs, calc_residuals, \
-    find_closest_doy, change_magnitude, detect_change, detect_outlier, \
-    adjustpeek, adjustchgthresh
-from ccd.models import results_to_changemodel, tmask
+    update_processing_mask, stable, determine_num_coefs, \
+    calc_band_residuals, stack_coefficients, find_closest_doy, \
+    change_magnitude, detect_change, detect_outlier, adjustpeek
+from ccd.models import results_to_changemodel, fitter_session, tmask, lasso
+from ccd.results import segment_record
 from ccd.math_utils import kelvin_to_celsius, adjusted_variogram, euclidean_norm
 
 
 log = logging.getLogger(__name__)
 
+# Where the standard procedure can be resumed from once observations are
+# appended to the time series, see resume_procedure
+#   segments: number of change models produced before it
+#   model_window, previous_end, start: state of the main loop
+#   processing_mask: processing mask at that point
+#   fitter: snapshot of the FitterSession at that point
+#   lookforward: LookforwardState of the segment left open, None to resume
+#       at the top of the main loop
+#   peek_size, variogram: derived from the whole time series, resuming is
+#       only possible as long as they do not change
+#   observations: length of the time series it was taken on
+Checkpoint = namedtuple('Checkpoint',
+                        ['segments', 'model_window', 'previous_end', 'start',
+                         'processing_mask', 'fitter', 'lookforward',
+                         'peek_size', 'variogram', 'observations'])
+
+# State of lookforward when it ran out of observations without detecting a
+# change, the values of its loop variables
+LookforwardState = namedtuple('LookforwardState',
+                              ['model_window', 'fit_window', 'fit_span',
+                               'models', 'fit_residuals', 'peek_window',
+                               'residuals', 'num_coefs'])
+
+
+def changemodel_fn(proc_params):
+    """Determine how the change models are built
+
+    Args:
+        proc_params: dictionary of processing parameters
+
+    Returns:
+        ccd.results.segment_record when COLUMNAR_RESULTS is set, otherwise
+        ccd.models.results_to_changemodel
+    """
+    if proc_params.COLUMNAR_RESULTS:
+        return segment_record
+
+    return results_to_changemodel
+
 
 def fit_procedure(quality, proc_params):
     """Determine which curve fitting method to use
@@ -72,6 +124,45 @@ def fit_procedure(quality, proc_params):
     return func
 
 
+def fit_procedures(quality, proc_params):
+    """Determine which curve fitting method to use for a chip of pixels
+
+    Vectorized counterpart to fit_procedure, the QA ratios are calculated
+    for every pixel at once.
+
+    Args:
+        quality: 2-d array of QA information, shaped as
+            (pixels, observations)
+        proc_params: dictionary of processing parameters
+
+    Returns:
+        list: the corresponding method for each pixel
+    """
+    clear = proc_params.QA_CLEAR
+    water = proc_params.QA_WATER
+    fill = proc_params.QA_FILL
+    snow = proc_params.QA_SNOW
+    clear_thresh = proc_params.CLEAR_PCT_THRESHOLD
+    snow_thresh = proc_params.SNOW_PCT_THRESHOLD
+
+    clear_mask = qa.enough_clear(quality, clear, water, fill, clear_thresh,
+                                 axis=-1)
+    snow_mask = qa.enough_snow(quality, clear, water, snow, snow_thresh,
+                               axis=-1)
+
+    funcs = []
+    for enough_clear, enough_snow in zip(clear_mask, snow_mask):
+        if not enough_clear:
+            if enough_snow:
+                funcs.append(permanent_snow_procedure)
+            else:
+                funcs.append(insufficient_clear_procedure)
+        else:
+            funcs.append(standard_procedure)
+
+    return funcs
+
+
 def permanent_snow_procedure(dates, observations, fitter_fn, quality,
                              proc_params):
     """
@@ -87,7 +178,7 @@ def permanent_snow_procedure(dates, observations, fitter_fn, quality,
         observations: values for one or more spectra corresponding
             to each time.
         fitter_fn: a function used to fit observation values and
-            acquisition dates for each spectra.
+            acquisition dates for all of the spectra at once.
         quality: QA information for each observation
         proc_params: dictionary of processing parameters
 
@@ -112,20 +203,26 @@ def permanent_snow_procedure(dates, observations, fitter_fn, quality,
     if np.sum(processing_mask) < meow_size:
         return [], processing_mask
 
-    models = [fitter_fn(period, spectrum, fit_max_iter, avg_days_yr, num_coef)
-              for spectrum in spectral_obs]
+    coef_matrix = lasso.coefficient_matrix(period, avg_days_yr, num_coef)
+
+    models = fitter_fn(coef_matrix, spectral_obs, fit_max_iter, num_coef)
+
+    diag = diagnostics.current()
+    diag.count('design_matrices')
+    diag.count('fitter_calls')
 
     magnitudes = np.zeros(shape=(observations.shape[0],))
 
     # White space is cheap, so let's use it
-    result = results_to_changemodel(fitted_models=models,
-                                    start_day=dates[0],
-                                    end_day=dates[-1],
-                                    break_day=dates[-1],
-                                    magnitudes=magnitudes,
-                                    observation_count=np.sum(processing_mask),
-                                    change_probability=0,
-                                    curve_qa=curve_qa)
+    changemodel = changemodel_fn(proc_params)
+    result = changemodel(fitted_models=models,
+                         start_day=dates[0],
+                         end_day=dates[-1],
+                         break_day=dates[-1],
+                         magnitudes=magnitudes,
+                         observation_count=np.sum(processing_mask),
+                         change_probability=0,
+                         curve_qa=curve_qa)
 
     return (result,), processing_mask
 
@@ -145,7 +242,7 @@ def insufficient_clear_procedure(dates, observations, fitter_fn, quality,
         observations: values for one or more spectra corresponding
             to each time.
         fitter_fn: a function used to fit observation values and
-            acquisition dates for each spectra.
+            acquisition dates for all of the spectra at once.
         quality: QA information for each observation
         proc_params: dictionary of processing parameters
 
@@ -170,19 +267,25 @@ def insufficient_clear_procedure(dates, observations, fitter_fn, quality,
     if np.sum(processing_mask) < meow_size:
         return [], processing_mask
 
-    models = [fitter_fn(period, spectrum, fit_max_iter, avg_days_yr, num_coef)
-              for spectrum in spectral_obs]
+    coef_matrix = lasso.coefficient_matrix(period, avg_days_yr, num_coef)
+
+    models = fitter_fn(coef_matrix, spectral_obs, fit_max_iter, num_coef)
+
+    diag = diagnostics.current()
+    diag.count('design_matrices')
+    diag.count('fitter_calls')
 
     magnitudes = np.zeros(shape=(observations.shape[0],))
 
-    result = results_to_changemodel(fitted_models=models,
-                                    start_day=dates[0],
-                                    end_day=dates[-1],
-                                    break_day=dates[-1],
-                                    magnitudes=magnitudes,
-                                    observation_count=np.sum(processing_mask),
-                                    change_probability=0,
-                                    curve_qa=curve_qa)
+    changemodel = changemodel_fn(proc_params)
+    result = changemodel(fitted_models=models,
+                         start_day=dates[0],
+                         end_day=dates[-1],
+                         break_day=dates[-1],
+                         magnitudes=magnitudes,
+                         observation_count=np.sum(processing_mask),
+                         change_probability=0,
+                         curve_qa=curve_qa)
 
     return (result,), processing_mask
 
@@ -213,20 +316,164 @@ def standard_procedure(dates, observations, fitter_fn, quality, proc_params):
         observations: 2-d array of observed spectral values corresponding
             to each time.
         fitter_fn: a function used to fit observation values and
-            acquisition dates for each spectra.
+            acquisition dates for all of the spectra at once.
         quality: QA information for each observation
-        proc_params: dictionary of processing parameters
+        proc_params: CompiledParameters, see ccd.app.compile_params
 
     Returns:
         list: Change models for each observation of each spectra.
         1-d ndarray: processing mask indicating which values were used
             for model fitting
     """
+    results, processing_mask, _ = __standard(dates, observations, fitter_fn,
+                                             quality, proc_params, False)
+
+    return results, processing_mask
+
+
+def checkpointed_procedure(dates, observations, fitter_fn, quality,
+                           proc_params):
+    """
+    Runs the standard procedure, keeping the Checkpoint that it can be
+    resumed from once observations are appended to the time series, see
+    resume_procedure.
+
+    Args:
+        dates: list of ordinal day numbers relative to some epoch,
+            the particular epoch does not matter.
+        observations: 2-d array of observed spectral values corresponding
+            to each time.
+        fitter_fn: a function used to fit observation values and
+            acquisition dates for all of the spectra at once.
+        quality: QA information for each observation
+        proc_params: CompiledParameters, see ccd.app.compile_params
+
+    Returns:
+        list: Change models for each observation of each spectra.
+        1-d ndarray: processing mask indicating which values were used
+            for model fitting
+        Checkpoint: where to resume from, None if there were too few
+            observations to start
+    """
+    return __standard(dates, observations, fitter_fn, quality, proc_params,
+                      True)
+
+
+def resume_procedure(dates, observations, fitter_fn, quality, proc_params,
+                     checkpoint, change_models, exact=True):
+    """
+    Continues the standard procedure from a checkpoint, over the time series
+    it was taken on with observations appended, producing the same results
+    as standard_procedure over the whole time series.
+
+    Everything up to the checkpoint only depends on the observations before
+    it, with the exception of the variogram and the peek size which are
+    derived from the whole time series. If the appended observations change
+    either of them the procedure has to start over, unless exact is off, in
+    which case those of the checkpoint are used as they are.
+
+    Args:
+        dates: 1-d ndarray of sorted ordinal dates, starting with those the
+            checkpoint was taken on
+        observations: 2-d array of observed spectral values corresponding
+            to each time.
+        fitter_fn: a function used to fit observation values and
+            acquisition dates for all of the spectra at once.
+        quality: QA information for each observation
+        proc_params: CompiledParameters, the same the checkpoint was taken
+            with
+        checkpoint: Checkpoint as returned by checkpointed_procedure or
+            resume_procedure
+        change_models: the change models produced before the checkpoint,
+            its segments first ones of the earlier results
+        exact: whether the results have to be those of standard_procedure,
+            otherwise they may differ by the variogram and peek size
+
+    Returns:
+        tuple of the change models, processing mask and Checkpoint as
+        returned by checkpointed_procedure, or None if the procedure has to
+        start over
+    """
+    processing_mask = qa.standard_procedure_filter(observations, quality,
+                                                   dates, proc_params)
+
+    if np.sum(processing_mask) <= proc_params.MEOW_SIZE:
+        return None
+
+    if exact:
+        run_params, variogram, coef_matrix = __adjusted(dates, observations,
+                                                        processing_mask,
+                                                        proc_params)
+
+        if run_params.PEEK_SIZE != checkpoint.peek_size or \
+                not np.array_equal(variogram, checkpoint.variogram):
+            log.debug('Variogram or peek size changed, starting over')
+            return None
+    else:
+        peek_size = checkpoint.peek_size
+        run_params = app.RunParameters(proc_params, peek_size,
+                                       proc_params.change_threshold(peek_size))
+        variogram = checkpoint.variogram
+        coef_matrix = lasso.coefficient_matrix(dates, proc_params.AVG_DAYS_YR,
+                                               proc_params.COEFFICIENT_MAX)
+        diagnostics.current().count('design_matrices')
+
+    # The observations before the checkpoint keep the mask they had there,
+    # the Tmask and outliers may have removed some of them since the filter
+    processing_mask = np.concatenate(
+        [checkpoint.processing_mask,
+         processing_mask[checkpoint.observations:]])
+
+    # The checkpoint stays usable, in case the same update is repeated
+    fitter = checkpoint.fitter.snapshot()
+    fitter.extend(coef_matrix, observations)
+    fitter.counts.clear()
+
+    resume = checkpoint._replace(processing_mask=processing_mask,
+                                 fitter=fitter)
+
+    return __build_models(dates, observations, coef_matrix, variogram,
+                          run_params, list(change_models), resume, True)
+
+
+def __adjusted(dates, observations, processing_mask, proc_params):
+    """
+    The values of the standard procedure that are derived from the whole
+    time series: the parameters with the peek size and change threshold
+    adjusted to it, the variogram and the harmonic matrix.
+    """
+    peek_size = adjustpeek(dates[processing_mask], proc_params.PEEK_SIZE)
+    proc_params = app.RunParameters(proc_params, peek_size,
+                                    proc_params.change_threshold(peek_size))
+
+    log.debug('Peek size: %s', proc_params.PEEK_SIZE)
+    log.debug('Chng thresh: %s', proc_params.CHANGE_THRESHOLD)
+
+    # Calculate the variogram/madogram that will be used in subsequent
+    # processing steps. See algorithm documentation for further information.
+    variogram = adjusted_variogram(dates[processing_mask],
+                                   observations[:, processing_mask])
+    log.debug('Variogram values: %s', variogram)
+
+    # The harmonic matrix only depends on the dates, so it is built once and
+    # the subsequent steps fit and predict using slices of it.
+    coef_matrix = lasso.coefficient_matrix(dates, proc_params.AVG_DAYS_YR,
+                                           proc_params.COEFFICIENT_MAX)
+
+    diagnostics.current().count('design_matrices')
+
+    return proc_params, variogram, coef_matrix
+
+
+def __standard(dates, observations, fitter_fn, quality, proc_params, keep):
+    """
+    Runs the standard procedure, see standard_procedure, keeping the last
+    checkpoint when asked to.
+    """
     # TODO do this better
     meow_size = proc_params.MEOW_SIZE
     defpeek = proc_params.PEEK_SIZE
-    thermal_idx = proc_params.THERMAL_IDX
-    curve_qa = proc_params.CURVE_QA
+    fit_max_iter = proc_params.LASSO_MAX_ITER
 
     log.debug('Build change models - dates: %s, obs: %s, '
               'meow_size: %s, peek_size: %s',
@@ -257,84 +504,152 @@ def standard_procedure(dates, observations, fitter_fn, quality, proc_params):
 
     log.debug('Processing mask initial count: %s', obs_count)
 
-    # Accumulator for models. This is a list of ChangeModel named tuples
-    results = []
-
     if obs_count <= meow_size:
-        return results, processing_mask
-
-    # TODO Temporary setup on this to just get it going
-    peek_size = adjustpeek(dates[processing_mask], defpeek)
-    proc_params.PEEK_SIZE = peek_size
-    proc_params.CHANGE_THRESHOLD = adjustchgthresh(peek_size, defpeek,
-                                                   proc_params.CHANGE_THRESHOLD)
-
-    log.debug('Peek size: %s', proc_params.PEEK_SIZE)
-    log.debug('Chng thresh: %s', proc_params.CHANGE_THRESHOLD)
-
-    # Initialize the window which is used for building the models
-    model_window = slice(0, meow_size)
-    previous_end = 0
-
-    # Only capture general curve at the beginning, and not in the middle of
+        return [], processing_mask, None
+
+    # The peek size and change threshold are adjusted to this time series,
+    # the shared parameters are left alone
+    proc_params, variogram, coef_matrix = __adjusted(dates, observations,
+                                                     processing_mask,
+                                                     proc_params)
+
+    # The fitter session keeps whatever the fitter_fn can reuse between the
+    # fits of overlapping windows of this time series.
+    fitter = fitter_session(fitter_fn, coef_matrix, observations, fit_max_iter,
+                            proc_params.LASSO_WARM_START,
+                            proc_params.LASSO_COUNT_SAVED,
+                            proc_params.function('FITTER_SESSION_FN'))
+
+    # Initialize the window which is used for building the models, and only
+    # capture general curve at the beginning, and not in the middle of
     # two stable time segments
-    start = True
-
-    # Calculate the variogram/madogram that will be used in subsequent
-    # processing steps. See algorithm documentation for further information.
-    variogram = adjusted_variogram(dates[processing_mask],
-                                   observations[:, processing_mask])
-    log.debug('Variogram values: %s', variogram)
-
-    # Only build models as long as sufficient data exists.
-    while model_window.stop <= dates[processing_mask].shape[0] - meow_size:
-        # Step 1: Initialize
-        log.debug('Initialize for change model #: %s', len(results) + 1)
-        if len(results) > 0:
-            start = False
-
-        # Make things a little more readable by breaking this apart
-        # catch return -> break apart into components
-        initialized = initialize(dates, observations, fitter_fn, model_window,
-                                 processing_mask, variogram, proc_params)
-
-        model_window, init_models, processing_mask = initialized
+    start = Checkpoint(segments=0,
+                       model_window=slice(0, meow_size),
+                       previous_end=0,
+                       start=True,
+                       processing_mask=processing_mask,
+                       fitter=fitter,
+                       lookforward=None,
+                       peek_size=proc_params.PEEK_SIZE,
+                       variogram=variogram,
+                       observations=dates.shape[0])
+
+    return __build_models(dates, observations, coef_matrix, variogram,
+                          proc_params, [], start, keep)
+
+
+def __build_models(dates, observations, coef_matrix, variogram, proc_params,
+                   results, resume, keep):
+    """
+    The loop of the standard procedure, steps 1 to 6, starting from a
+    checkpoint.
 
-        # Catch for failure
-        if init_models is None:
-            log.debug('Model initialization failed')
-            break
+    Returns:
+        tuple of the change models, the processing mask and the last
+        checkpoint, None unless keep is set
+    """
+    meow_size = proc_params.MEOW_SIZE
+    peek_size = proc_params.PEEK_SIZE
+    curve_qa = proc_params.CURVE_QA
 
-        # Step 2: Lookback
-        if model_window.start > previous_end:
-            lb = lookback(dates, observations, model_window, init_models,
-                          previous_end, processing_mask, variogram, proc_params)
-
-            model_window, processing_mask = lb
-
-        # Step 3: catch
-        # If we have moved > peek_size from the previous break point
-        # then we fit a generalized model to those points.
-        if model_window.start - previous_end > peek_size and start is True:
-            results.append(catch(dates,
-                                 observations,
-                                 fitter_fn,
-                                 processing_mask,
-                                 slice(previous_end, model_window.start),
-                                 curve_qa['START'], proc_params))
-            start = False
-
-        # Handle specific case where if we are at the end of a time series and
-        # the peek size is greater than what remains of the data.
-        if model_window.stop + peek_size > dates[processing_mask].shape[0]:
-            break
+    model_window = resume.model_window
+    previous_end = resume.previous_end
+    start = resume.start
+    processing_mask = resume.processing_mask
+    fitter = resume.fitter
+    resumed = resume.lookforward
+
+    diag = diagnostics.current()
+
+    def checkpoint(lookforward=None):
+        # Copies of everything that is modified in place as the loop goes on
+        if keep:
+            return resume._replace(segments=len(results),
+                                   model_window=model_window,
+                                   previous_end=previous_end,
+                                   start=start,
+                                   processing_mask=processing_mask.copy(),
+                                   fitter=fitter.snapshot(),
+                                   lookforward=lookforward,
+                                   observations=dates.shape[0])
+
+    # Everything after the last time the loop condition was checked, or
+    # after the segment left open by lookforward, depends on the length of
+    # the time series
+    last = checkpoint()
+
+    # Only build models as long as sufficient data exists, or pick an open
+    # segment up where lookforward ran out of observations.
+    while resumed is not None or \
+            model_window.stop <= dates[processing_mask].shape[0] - meow_size:
+        if resumed is None:
+            # Step 1: Initialize
+            log.debug('Initialize for change model #: %s', len(results) + 1)
+            if len(results) > 0:
+                start = False
+
+            # Make things a little more readable by breaking this apart
+            # catch return -> break apart into components
+            with diag.timed('initialize'):
+                initialized = initialize(dates, observations, coef_matrix,
+                                         fitter, model_window,
+                                         processing_mask, variogram,
+                                         proc_params)
+
+            model_window, init_models, processing_mask = initialized
+
+            # Catch for failure
+            if init_models is None:
+                log.debug('Model initialization failed')
+                break
+
+            # Step 2: Lookback
+            if model_window.start > previous_end:
+                with diag.timed('lookback'):
+                    lb = lookback(dates, observations, coef_matrix,
+                                  model_window, init_models, previous_end,
+                                  processing_mask, variogram, proc_params)
+
+                model_window, processing_mask = lb
+
+            # Step 3: catch
+            # If we have moved > peek_size from the previous break point
+            # then we fit a generalized model to those points.
+            if model_window.start - previous_end > peek_size and \
+                    start is True:
+                with diag.timed('catch'):
+                    results.append(catch(dates,
+                                         observations,
+                                         coef_matrix,
+                                         fitter,
+                                         processing_mask,
+                                         slice(previous_end,
+                                               model_window.start),
+                                         curve_qa['START'], proc_params))
+                start = False
+
+            # Handle specific case where if we are at the end of a time
+            # series and the peek size is greater than what remains of the
+            # data.
+            if model_window.stop + peek_size > \
+                    dates[processing_mask].shape[0]:
+                break
 
         # Step 4: lookforward
         log.debug('Extend change model')
-        lf = lookforward(dates, observations, model_window, fitter_fn,
-                         processing_mask, variogram, proc_params)
+        with diag.timed('lookforward'):
+            lf = lookforward(dates, observations, coef_matrix, model_window,
+                             fitter, processing_mask, variogram, proc_params,
+                             resumed)
+
+        result, processing_mask, model_window, exhausted = lf
+        resumed = None
+
+        # The segment is still open when lookforward ran out of
+        # observations, the next update picks it up from there
+        if exhausted is not None:
+            last = checkpoint(exhausted)
 
-        result, processing_mask, model_window = lf
         results.append(result)
 
         log.debug('Accumulate results, {} so far'.format(len(results)))
@@ -343,23 +658,30 @@ def standard_procedure(dates, observations, fitter_fn, quality, proc_params):
         previous_end = model_window.stop
         model_window = slice(model_window.stop, model_window.stop + meow_size)
 
+        if exhausted is None:
+            last = checkpoint()
+
     # Step 6: Catch
     # We can use previous start here as that value should be equal to
     # model_window.stop due to the constraints on the the previous while
     # loop.
     if previous_end + peek_size < dates[processing_mask].shape[0]:
         model_window = slice(previous_end, dates[processing_mask].shape[0])
-        results.append(catch(dates, observations, fitter_fn,
-                             processing_mask, model_window,
-                             curve_qa['END'], proc_params))
+        with diag.timed('catch'):
+            results.append(catch(dates, observations, coef_matrix, fitter,
+                                 processing_mask, model_window,
+                                 curve_qa['END'], proc_params))
+
+    diag.count('fitter_calls', fitter.counts['calls'])
+    diag.count('fits_reused', fitter.counts['reused'])
 
     log.debug("change detection complete")
 
-    return results, processing_mask
+    return results, processing_mask, last
 
 
-def initialize(dates, observations, fitter_fn, model_window, processing_mask,
-               variogram, proc_params):
+def initialize(dates, observations, coef_matrix, fitter, model_window,
+               processing_mask, variogram, proc_params):
     """
     Determine a good starting point at which to build off of for the
     subsequent process of change detection, both forward and backward.
@@ -367,7 +689,9 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
     Args:
         dates: 1-d ndarray of ordinal day values
         observations: 2-d ndarray representing the spectral values
-        fitter_fn: function used for the regression portion of the algorithm
+        coef_matrix: 2-d ndarray, harmonic matrix for each of the dates
+        fitter: FitterSession used for the regression portion of the
+            algorithm
         model_window: start index of time/observation window
         processing_mask: 1-d boolean array identifying which values to
             consider for processing
@@ -387,13 +711,20 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
     change_thresh = proc_params.CHANGE_THRESHOLD
     tmask_scale = proc_params.T_CONST
     avg_days_yr = proc_params.AVG_DAYS_YR
-    fit_max_iter = proc_params.LASSO_MAX_ITER
 
     period = dates[processing_mask]
+    period_index = np.flatnonzero(processing_mask)
     spectral_obs = observations[:, processing_mask]
 
     log.debug('Initial %s', model_window)
     models = None
+
+    # Models of the last window checked, the next window mostly overlaps it
+    # so its coefficients are a good starting point for the solver
+    previous = None
+
+    diag = diagnostics.current()
+
     while model_window.stop + meow_size < period.shape[0]:
         # Finding a sufficient window of time needs to run
         # each iteration because the starting point
@@ -402,6 +733,7 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
         # time-range.
         if not enough_time(period[model_window], day_delta):
             model_window = slice(model_window.start, model_window.stop + 1)
+            diag.count('window_extensions')
             continue
         # stop = find_time_index(dates, model_window, meow_size, day_delta)
         # model_window = slice(model_window.start, stop)
@@ -416,6 +748,10 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
 
         tmask_count = np.sum(tmask_outliers)
 
+        # Tmask builds its own design matrix for the window
+        diag.count('tmask')
+        diag.count('design_matrices')
+
         log.debug('Number of Tmask outliers found: %s', tmask_count)
 
         # Subset the data to the observations that currently under scrutiny
@@ -428,6 +764,7 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
             log.debug('Tmask identified all values as outliers')
 
             model_window = slice(model_window.start, model_window.stop + 1)
+            diag.count('window_extensions')
             continue
 
         # Make sure we still have enough observations and enough time after
@@ -439,6 +776,7 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
                       'extending model window')
 
             model_window = slice(model_window.start, model_window.stop + 1)
+            diag.count('window_extensions')
             continue
 
         # Update the persistent mask with the values identified by the Tmask
@@ -446,18 +784,20 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
             processing_mask = update_processing_mask(processing_mask,
                                                      tmask_outliers,
                                                      model_window)
+            diag.count('tmask_outliers', int(tmask_count))
 
             # The model window now actually refers to a smaller slice
             model_window = slice(model_window.start,
                                  model_window.stop - tmask_count)
             # Update the subset
             period = dates[processing_mask]
+            period_index = np.flatnonzero(processing_mask)
             spectral_obs = observations[:, processing_mask]
 
         log.debug('Generating models to check for stability')
-        models = [fitter_fn(period[model_window], spectrum,
-                            fit_max_iter, avg_days_yr, 4)
-                  for spectrum in spectral_obs[:, model_window]]
+        models = fitter.fit(period_index[model_window], 4,
+                            warm_start=previous)
+        previous = models
 
         # If a model is not stable, then it is possible that a disturbance
         # exists somewhere in the observation window. The window shifts
@@ -467,6 +807,7 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
 
             model_window = slice(model_window.start + 1, model_window.stop + 1)
             log.debug('Unstable model, shift window to: %s', model_window)
+            diag.count('window_shifts')
             models = None
             continue
 
@@ -477,28 +818,36 @@ def initialize(dates, observations, fitter_fn, model_window, processing_mask,
     return model_window, models, processing_mask
 
 
-def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
-                variogram, proc_params):
+def lookforward(dates, observations, coef_matrix, model_window, fitter,
+                processing_mask, variogram, proc_params, resume=None):
     """Increase observation window until change is detected or
     we are out of observations.
 
+    When the observations run out the state of the loop is returned, so
+    that it can be resumed once more observations are available.
+
     Args:
         dates: list of ordinal day numbers relative to some epoch,
             the particular epoch does not matter.
         observations: spectral values, list of spectra -> values
+        coef_matrix: 2-d ndarray, harmonic matrix for each of the dates
         model_window: span of indices that is represented in the current
             process
-        fitter_fn: function used to model observations
+        fitter: FitterSession used to model observations
         processing_mask: 1-d boolean array identifying which values to
             consider for processing
         variogram: 1-d array of variogram values to compare against for the
             normalization factor
         proc_params: dictionary of processing parameters
+        resume: optional LookforwardState to carry on from, the model_window
+            is then taken from it
 
     Returns:
         namedtuple: representation of the time segment
         1-d bool ndarray: processing mask that may have been modified
         slice: model window
+        LookforwardState: if the observations ran out before a change was
+            detected, otherwise None
     """
     # TODO do this better
     peek_size = proc_params.PEEK_SIZE
@@ -509,8 +858,6 @@ def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
     detection_bands = proc_params.DETECTION_BANDS
     change_thresh = proc_params.CHANGE_THRESHOLD
     outlier_thresh = proc_params.OUTLIER_THRESHOLD
-    avg_days_yr = proc_params.AVG_DAYS_YR
-    fit_max_iter = proc_params.LASSO_MAX_ITER
 
     # Step 4: lookforward.
     # The second step is to update a model until observations that do not
@@ -531,11 +878,22 @@ def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
 
     # Initial subset of the data
     period = dates[processing_mask]
+    period_index = np.flatnonzero(processing_mask)
+    period_matrix = coef_matrix[processing_mask]
     spectral_obs = observations[:, processing_mask]
 
     # Used for comparison purposes
     fit_span = period[model_window.stop - 1] - period[model_window.start]
 
+    if resume is not None:
+        model_window, fit_window, fit_span, models, fit_residuals, \
+            peek_window, residuals, num_coefs = resume
+
+        coefs, intercepts = stack_coefficients(models)
+        rmses = np.array([model.rmse for model in models])
+
+    exhausted = None
+
     # stop is always exclusive
     while model_window.stop + peek_size <= period.shape[0]:
         num_coefs = determine_num_coefs(period[model_window], coef_min,
@@ -558,17 +916,21 @@ def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
 
             fit_window = model_window
             log.debug('Retrain models')
-            models = [fitter_fn(period[fit_window], spectrum,
-                                fit_max_iter, avg_days_yr, num_coefs)
-                      for spectrum in spectral_obs[:, fit_window]]
+            # The residual vectors are only needed once the window grows
+            # past 24 observations.
+            models = fitter.fit(period_index[fit_window], num_coefs,
+                                residuals=False, warm_start=models)
 
-        residuals = np.array([calc_residuals(period[peek_window],
-                                             spectral_obs[idx, peek_window],
-                                             models[idx], avg_days_yr)
-                              for idx in range(observations.shape[0])])
+            coefs, intercepts = stack_coefficients(models)
+            rmses = np.array([model.rmse for model in models])
+            fit_residuals = None
+
+        residuals = calc_band_residuals(period_matrix[peek_window],
+                                        spectral_obs[:, peek_window],
+                                        coefs, intercepts)
 
         if model_window.stop - model_window.start <= 24:
-            comp_rmse = [models[idx].rmse for idx in detection_bands]
+            comp_rmse = rmses[detection_bands]
 
         # More than 24 points
         else:
@@ -577,10 +939,15 @@ def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
             closest_indexes = find_closest_doy(period, peek_window.stop - 1,
                                                fit_window, 24)
 
+            if fit_residuals is None:
+                models = fitter.residuals(models, period_index[fit_window])
+                fit_residuals = np.array([models[idx].residual
+                                          for idx in detection_bands])
+
             # Calculate an RMSE for the seasonal residual values, using 8
             # as the degrees of freedom.
-            comp_rmse = [euclidean_norm(models[idx].residual[closest_indexes]) / 4
-                         for idx in detection_bands]
+            comp_rmse = euclidean_norm(fit_residuals[:, closest_indexes],
+                                       axis=1) / 4
 
         # Calculate the change magnitude values for each observation in the
         # peek_window.
@@ -601,12 +968,15 @@ def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
             # processing steps
             processing_mask = update_processing_mask(processing_mask,
                                                      peek_window.start)
+            diagnostics.current().count('outliers')
 
             # Because only one value was excluded, we shouldn't need to adjust
             # the model_window.  The location hasn't been used in
             # processing yet. So, the next iteration can use the same windows
             # without issue.
             period = dates[processing_mask]
+            period_index = np.flatnonzero(processing_mask)
+            period_matrix = coef_matrix[processing_mask]
             spectral_obs = observations[:, processing_mask]
             continue
 
@@ -616,22 +986,28 @@ def lookforward(dates, observations, model_window, fitter_fn, processing_mask,
             break
 
         model_window = slice(model_window.start, model_window.stop + 1)
-
-    result = results_to_changemodel(fitted_models=models,
-                                    start_day=period[model_window.start],
-                                    end_day=period[model_window.stop - 1],
-                                    break_day=period[peek_window.start],
-                                    magnitudes=np.median(residuals, axis=1),
-                                    observation_count=(
-                                    model_window.stop - model_window.start),
-                                    change_probability=change,
-                                    curve_qa=num_coefs)
-
-    return result, processing_mask, model_window
-
-
-def lookback(dates, observations, model_window, models, previous_break,
-             processing_mask, variogram, proc_params):
+    else:
+        # Out of observations without a change
+        exhausted = LookforwardState(model_window, fit_window, fit_span,
+                                     models, fit_residuals, peek_window,
+                                     residuals, num_coefs)
+
+    changemodel = changemodel_fn(proc_params)
+    result = changemodel(fitted_models=models,
+                         start_day=period[model_window.start],
+                         end_day=period[model_window.stop - 1],
+                         break_day=period[peek_window.start],
+                         magnitudes=np.median(residuals, axis=1),
+                         observation_count=(
+                         model_window.stop - model_window.start),
+                         change_probability=change,
+                         curve_qa=num_coefs)
+
+    return result, processing_mask, model_window, exhausted
+
+
+def lookback(dates, observations, coef_matrix, model_window, models,
+             previous_break, processing_mask, variogram, proc_params):
     """
     Special case when there is a gap between the start of a time series model
     and the previous model break point, this can include values that were
@@ -640,6 +1016,7 @@ def lookback(dates, observations, model_window, models, previous_break,
     Args:
         dates: list of ordinal days
         observations: spectral values across bands
+        coef_matrix: 2-d ndarray, harmonic matrix for each of the dates
         model_window: current window of values that is being considered
         models: currently fitted models for the model_window
         previous_break: index value of the previous break point, or the start
@@ -659,10 +1036,13 @@ def lookback(dates, observations, model_window, models, previous_break,
     detection_bands = proc_params.DETECTION_BANDS
     change_thresh = proc_params.CHANGE_THRESHOLD
     outlier_thresh = proc_params.OUTLIER_THRESHOLD
-    avg_days_yr = proc_params.AVG_DAYS_YR
 
     log.debug('Previous break: %s model window: %s', previous_break, model_window)
-    period = dates[processing_mask]
+
+    # The models do not change while looking back
+    coefs, intercepts = stack_coefficients(models)
+    comp_rmse = np.array([models[idx].rmse for idx in detection_bands])
+    period_matrix = coef_matrix[processing_mask]
     spectral_obs = observations[:, processing_mask]
 
     while model_window.start > previous_break:
@@ -683,15 +1063,12 @@ def lookback(dates, observations, model_window, models, previous_break,
         log.debug('Considering index: %s using peek window: %s',
                   peek_window.start, peek_window)
 
-        residuals = np.array([calc_residuals(period[peek_window],
-                                             spectral_obs[idx, peek_window],
-                                             models[idx], avg_days_yr)
-                              for idx in range(observations.shape[0])])
+        residuals = calc_band_residuals(period_matrix[peek_window],
+                                        spectral_obs[:, peek_window],
+                                        coefs, intercepts)
 
         # log.debug('Residuals for peek window: %s', residuals)
 
-        comp_rmse = [models[idx].rmse for idx in detection_bands]
-
         log.debug('RMSE values for comparison: %s', comp_rmse)
 
         magnitude = change_magnitude(residuals[detection_bands, :],
@@ -706,8 +1083,9 @@ def lookback(dates, observations, model_window, models, previous_break,
             log.debug('Outlier detected for index: %s', peek_window.start)
             processing_mask = update_processing_mask(processing_mask,
                                                      peek_window.start)
+            diagnostics.current().count('outliers')
 
-            period = dates[processing_mask]
+            period_matrix = coef_matrix[processing_mask]
             spectral_obs = observations[:, processing_mask]
 
             # Because this location was used in determining the model_window
@@ -721,8 +1099,8 @@ def lookback(dates, observations, model_window, models, previous_break,
     return model_window, processing_mask
 
 
-def catch(dates, observations, fitter_fn, processing_mask, model_window,
-          curve_qa, proc_params):
+def catch(dates, observations, coef_matrix, fitter, processing_mask,
+          model_window, curve_qa, proc_params):
     """
     Handle special cases where general models just need to be fitted and return
     their results.
@@ -731,9 +1109,10 @@ def catch(dates, observations, fitter_fn, processing_mask, model_window,
         dates: list of ordinal day numbers relative to some epoch,
             the particular epoch does not matter.
         observations: spectral values, list of spectra -> values
+        coef_matrix: 2-d ndarray, harmonic matrix for each of the dates
         model_window: span of indices that is represented in the current
             process
-        fitter_fn: function used to model observations
+        fitter: FitterSession used to model observations
         processing_mask: 1-d boolean array identifying which values to
             consider for processing
 
@@ -742,35 +1121,28 @@ def catch(dates, observations, fitter_fn, processing_mask, model_window,
 
     """
     # TODO do this better
-    avg_days_yr = proc_params.AVG_DAYS_YR
-    fit_max_iter = proc_params.LASSO_MAX_ITER
     num_coef = proc_params.COEFFICIENT_MIN
 
     log.debug('Catching observations: %s', model_window)
     period = dates[processing_mask]
-    spectral_obs = observations[:, processing_mask]
-
-    # Subset the data based on the model window
-    model_period = period[model_window]
-    model_spectral = spectral_obs[:, model_window]
+    period_index = np.flatnonzero(processing_mask)
 
-    models = [fitter_fn(model_period, spectrum, fit_max_iter, avg_days_yr,
-                        num_coef)
-              for spectrum in model_spectral]
+    models = fitter.fit(period_index[model_window], num_coef, residuals=False)
 
     if model_window.stop >= period.shape[0]:
         break_day = period[-1]
     else:
         break_day = period[model_window.stop]
 
-    result = results_to_changemodel(fitted_models=models,
-                                    start_day=period[model_window.start],
-                                    end_day=period[model_window.stop - 1],
-                                    break_day=break_day,
-                                    magnitudes=np.zeros(shape=(7,)),
-                                    observation_count=(
-                                        model_window.stop - model_window.start),
-                                    change_probability=0,
-                                    curve_qa=curve_qa)
+    changemodel = changemodel_fn(proc_params)
+    result = changemodel(fitted_models=models,
+                         start_day=period[model_window.start],
+                         end_day=period[model_window.stop - 1],
+                         break_day=break_day,
+                         magnitudes=np.zeros(shape=(7,)),
+                         observation_count=(
+                             model_window.stop - model_window.start),
+                         change_probability=0,
+                         curve_qa=curve_qa)
 
     return result
@@ -1,5 +1,7 @@
 """Filters for pre-processing change model inputs.
 """
+from functools import lru_cache
+
 import numpy as np
 
 from ccd.math_utils import calc_median, mask_value, count_value, mask_duplicate_values
@@ -58,22 +60,139 @@ def qabitval(packedint, proc_params):
         raise ValueError('Unsupported bitpacked QA value {}'.format(packedint))
 
 
+# Sentinel used in the decoded values for unsupported bit-packed values
+QA_UNSUPPORTED = -1
+
+# Number of entries in a QA lookup table, covers the full uint16 range
+QA_LOOKUP_SIZE = 2 ** 16
+
+
+def qa_offsets(proc_params):
+    """
+    Pull out the bit offsets that define how a bit-packed QA value is
+    decoded, in hierarchy order.
+
+    Args:
+        proc_params: dictionary of processing parameters
+
+    Returns:
+        tuple: (fill, cloud, shadow, snow, water, clear, cirrus1, cirrus2,
+            occlusion)
+    """
+    return (proc_params.QA_FILL, proc_params.QA_CLOUD, proc_params.QA_SHADOW,
+            proc_params.QA_SNOW, proc_params.QA_WATER, proc_params.QA_CLEAR,
+            proc_params.QA_CIRRUS1, proc_params.QA_CIRRUS2,
+            proc_params.QA_OCCLUSION)
+
+
+def decodeqa(quality, offsets):
+    """
+    Vectorized form of qabitval, the same hierarchy is applied across the
+    entire array at once.
+
+    fill > cloud > shadow > snow > water > clear
+
+    Args:
+        quality: n-d array of bit-packed QA values
+        offsets: bit offsets as given by qa_offsets
+
+    Returns:
+        ndarray of the same shape as quality, unsupported values are given
+        as QA_UNSUPPORTED
+    """
+    (fill, cloud, shadow, snow, water, clear, cirrus1, cirrus2,
+     occlusion) = offsets
+
+    # Order matters, the first condition met determines the value
+    conditions = [checkbit(quality, fill),
+                  checkbit(quality, cloud),
+                  checkbit(quality, shadow),
+                  checkbit(quality, snow),
+                  checkbit(quality, water),
+                  checkbit(quality, clear),
+                  # L8 Cirrus and Terrain Occlusion
+                  checkbit(quality, cirrus1) & checkbit(quality, cirrus2),
+                  checkbit(quality, occlusion)]
+
+    choices = [fill, cloud, shadow, snow, water, clear, clear, clear]
+
+    return np.select(conditions, choices, default=QA_UNSUPPORTED)
+
+
+@lru_cache(maxsize=None)
+def __lookup_table(offsets):
+    table = decodeqa(np.arange(QA_LOOKUP_SIZE), offsets).astype(np.int8)
+    # Shared between every caller with the same configuration
+    table.flags.writeable = False
+
+    return table
+
+
+def qa_lookup_table(proc_params):
+    """
+    Lookup table from every possible uint16 bit-packed value to the decoded
+    value.
+
+    The table only depends on the QA offsets in the processing parameters,
+    so it is only built once for each distinct configuration.
+
+    Args:
+        proc_params: dictionary of processing parameters
+
+    Returns:
+        read-only 1-d ndarray of QA_LOOKUP_SIZE values
+    """
+    return __lookup_table(qa_offsets(proc_params))
+
+
+def __fits_lookup(quality):
+    """
+    Check that the array values can be used to index a lookup table.
+    """
+    if quality.dtype.kind not in 'ui':
+        return False
+
+    if quality.dtype.itemsize <= 2 and quality.dtype.kind == 'u':
+        return True
+
+    return quality.size == 0 or (quality.min() >= 0 and
+                                 quality.max() < QA_LOOKUP_SIZE)
+
+
 def unpackqa(quality, proc_params):
     """
     Transform the bit-packed QA values into their bit offset.
-    
+
+    Integer values in the uint16 range are decoded through a cached lookup
+    table, anything else is decoded directly.
+
     Args:
-        quality: 1-d array or list of bit-packed QA values
+        quality: n-d array or list of bit-packed QA values
         proc_params: dictionary of processing parameters
 
     Returns:
-        1-d ndarray
+        ndarray of the same shape as quality
+
+    Raises:
+        ValueError: listing all of the unsupported bit-packed values
     """
+    quality = np.asarray(quality)
+
+    if __fits_lookup(quality):
+        unpacked = qa_lookup_table(proc_params)[quality]
+    else:
+        unpacked = decodeqa(quality, qa_offsets(proc_params))
+
+    unsupported = unpacked == QA_UNSUPPORTED
+
+    if np.any(unsupported):
+        raise ValueError('Unsupported bitpacked QA values {}'
+                         .format(np.unique(quality[unsupported]).tolist()))
 
-    return np.array([qabitval(q, proc_params) for q in quality])
+    return unpacked
 
 
-def count_clear_or_water(quality, clear, water):
+def count_clear_or_water(quality, clear, water, axis=None):
     """
     Count clear or water data.
 
@@ -81,14 +200,16 @@ def count_clear_or_water(quality, clear, water):
         quality: quality band values.
         clear: value that represents clear
         water: value that represents water
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         int
     """
-    return count_value(quality, clear) + count_value(quality, water)
+    return (count_value(quality, clear, axis=axis) +
+            count_value(quality, water, axis=axis))
 
 
-def count_total(quality, fill):
+def count_total(quality, fill, axis=None):
     """
     Count non-fill data.
 
@@ -97,14 +218,15 @@ def count_total(quality, fill):
     Arguments:
         quality: quality band values.
         fill: value that represents fill
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         int
     """
-    return np.sum(~mask_value(quality, fill))
+    return np.sum(~mask_value(quality, fill), axis=axis)
 
 
-def ratio_clear(quality, clear, water, fill):
+def ratio_clear(quality, clear, water, fill, axis=None):
     """
     Calculate ratio of clear to non-clear pixels; exclude, fill data.
 
@@ -115,15 +237,16 @@ def ratio_clear(quality, clear, water, fill):
         clear: value that represents clear
         water: value that represents water
         fill: value that represents fill
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         int
     """
-    return (count_clear_or_water(quality, clear, water) /
-            count_total(quality, fill))
+    return (count_clear_or_water(quality, clear, water, axis=axis) /
+            count_total(quality, fill, axis=axis))
 
 
-def ratio_snow(quality, clear, water, snow):
+def ratio_snow(quality, clear, water, snow, axis=None):
     """Calculate ratio of snow to clear pixels; exclude fill and non-clear data.
 
     Useful for determining ratio of snow:clear pixels.
@@ -133,18 +256,19 @@ def ratio_snow(quality, clear, water, snow):
         clear: value that represents clear
         water: value that represents water
         snow: value that represents snow
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         float: Value between zero and one indicating amount of
             snow-observations.
     """
-    snowy_count = count_value(quality, snow)
-    clear_count = count_clear_or_water(quality, clear, water)
+    snowy_count = count_value(quality, snow, axis=axis)
+    clear_count = count_clear_or_water(quality, clear, water, axis=axis)
 
     return snowy_count / (clear_count + snowy_count + 0.01)
 
 
-def ratio_cloud(quality, fill, cloud):
+def ratio_cloud(quality, fill, cloud, axis=None):
     """
     Calculate the ratio of observations that are cloud.
 
@@ -152,17 +276,18 @@ def ratio_cloud(quality, fill, cloud):
         quality: 1-d ndarray of quality information, cannot be bitpacked
         fill: int value representing fill
         cloud: int value representing cloud
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         float
     """
-    cloud_count = count_value(quality, cloud)
-    total = count_total(quality, fill)
+    cloud_count = count_value(quality, cloud, axis=axis)
+    total = count_total(quality, fill, axis=axis)
 
     return cloud_count / total
 
 
-def ratio_water(quality, clear, water):
+def ratio_water(quality, clear, water, axis=None):
     """
         Calculate the ratio of observations that are water.
 
@@ -170,17 +295,18 @@ def ratio_water(quality, clear, water):
             quality: 1-d ndarray of quality information, cannot be bitpacked
             clear: int value representing clear
             water: int value representing water
+            axis: numpy axis to count along for n-d quality arrays
 
         Returns:
             float
         """
-    clear_count = count_clear_or_water(quality, clear, water)
-    water_count = count_value(quality, water)
+    clear_count = count_clear_or_water(quality, clear, water, axis=axis)
+    water_count = count_value(quality, water, axis=axis)
 
     return water_count / (clear_count + 0.01)
 
 
-def enough_clear(quality, clear, water, fill, threshold):
+def enough_clear(quality, clear, water, fill, threshold, axis=None):
     """
     Determine if clear observations exceed threshold.
 
@@ -193,14 +319,15 @@ def enough_clear(quality, clear, water, fill, threshold):
         water: value that represents water
         fill: value that represents fill
         threshold: minimum ratio of clear/water to not-clear/water values.
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         boolean: True if >= threshold
     """
-    return ratio_clear(quality, clear, water, fill) >= threshold
+    return ratio_clear(quality, clear, water, fill, axis=axis) >= threshold
 
 
-def enough_snow(quality, clear, water, snow, threshold):
+def enough_snow(quality, clear, water, snow, threshold, axis=None):
     """
     Determine if snow observations exceed threshold.
 
@@ -212,11 +339,12 @@ def enough_snow(quality, clear, water, snow, threshold):
         water: value that represents water
         snow: value that represents snow
         threshold: minimum ratio of snow to clear/water values.
+        axis: numpy axis to count along for n-d quality arrays
 
     Returns:
         boolean: True if >= threshold
     """
-    return ratio_snow(quality, clear, water, snow) >= threshold
+    return ratio_snow(quality, clear, water, snow, axis=axis) >= threshold
 
 
 def filter_median_green(green, filter_range):
@@ -375,7 +503,7 @@ def insufficient_clear_filter(observations, quality, dates, proc_params):
     return standard_mask
 
 
-def quality_probabilities(quality, proc_params):
+def quality_probabilities(quality, proc_params, axis=None):
     """
     Provide probabilities that any given observation falls into one of three
     categories - cloud, snow, or water.
@@ -386,6 +514,8 @@ def quality_probabilities(quality, proc_params):
     Args:
         quality: 1-d ndarray of quality information, cannot be bitpacked
         proc_params: dictionary of global processing parameters
+        axis: numpy axis to count along for n-d quality arrays, e.g. -1
+            for a (pixels, observations) chip
 
     Returns:
         float probability cloud
@@ -393,10 +523,12 @@ def quality_probabilities(quality, proc_params):
         float probability water
     """
     snow = ratio_snow(quality, proc_params.QA_CLEAR, proc_params.QA_WATER,
-                      proc_params.QA_SNOW)
+                      proc_params.QA_SNOW, axis=axis)
 
-    cloud = ratio_cloud(quality, proc_params.QA_FILL, proc_params.QA_CLOUD)
+    cloud = ratio_cloud(quality, proc_params.QA_FILL, proc_params.QA_CLOUD,
+                        axis=axis)
 
-    water = ratio_water(quality, proc_params.QA_CLEAR, proc_params.QA_WATER)
+    water = ratio_water(quality, proc_params.QA_CLEAR, proc_params.QA_WATER,
+                        axis=axis)
 
     return cloud, snow, water
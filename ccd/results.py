@@ -0,0 +1,210 @@
+"""
+Columnar results, an alternative to the nested change model dicts.
+
+With the COLUMNAR_RESULTS parameter set, the procedures build each segment
+as a SEGMENT_DTYPE record straight from the fitted models, instead of a dict
+holding a dict of python floats for every band, and detect and detect_chip
+return ColumnarResults. Per band values are laid out as segments x bands,
+and the coefficients as segments x bands x coefficients:
+
+    >>> results = ccd.detect(..., params={'COLUMNAR_RESULTS': True})
+    >>> results.segments['break_day']
+    >>> results.segments['rmse'][:, BANDS.index('nir')]
+    >>> unpack_mask(results.processing_mask, results.observations)
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# Band names in the order of the spectra
+BANDS = ('blue', 'green', 'red', 'nir', 'swir1', 'swir2', 'thermal')
+
+# Length of the coefficient vectors returned by the fitters
+NUM_COEFFICIENTS = 7
+
+SEGMENT_DTYPE = np.dtype([('pixel', np.int32),
+                          ('start_day', np.int64),
+                          ('end_day', np.int64),
+                          ('break_day', np.int64),
+                          ('observation_count', np.int32),
+                          ('change_probability', np.float64),
+                          ('curve_qa', np.int32),
+                          ('magnitude', np.float64, (len(BANDS),)),
+                          ('rmse', np.float64, (len(BANDS),)),
+                          ('intercept', np.float64, (len(BANDS),)),
+                          ('coefficients', np.float64,
+                           (len(BANDS), NUM_COEFFICIENTS))])
+
+# Results of detect, or of a whole chip for detect_chip
+#   algorithm: algorithm name and version
+#   segments: 1-d SEGMENT_DTYPE array, in pixel order for a chip
+#   processing_mask: bit-packed processing mask, with a row for each pixel
+#       of a chip
+#   observations: number of observations, the length of the unpacked mask
+#   cloud_prob, snow_prob, water_prob: QA probabilities, with a value for
+#       each pixel of a chip
+#   diagnostics: with DIAGNOSTICS set, the diagnostics dict of the pixel, or
+#       a list of them in pixel order for a chip, see ccd.diagnostics
+ColumnarResults = namedtuple('ColumnarResults',
+                             ['algorithm', 'segments', 'processing_mask',
+                              'observations', 'cloud_prob', 'snow_prob',
+                              'water_prob', 'diagnostics'],
+                             defaults=(None,))
+
+
+# Values of a segment, kept as they come from the procedures until the
+# segments of the pixel are known and written into one array, see
+# stack_segments
+Segment = namedtuple('Segment',
+                     ['fitted_models', 'start_day', 'end_day', 'break_day',
+                      'magnitudes', 'observation_count', 'change_probability',
+                      'curve_qa'])
+
+
+def segment_record(fitted_models, start_day, end_day, break_day, magnitudes,
+                   observation_count, change_probability, curve_qa):
+    """
+    Columnar counterpart to ccd.models.results_to_changemodel, taking the
+    same arguments.
+
+    Nothing is allocated per segment, the values are written into the array
+    of the pixel by stack_segments.
+
+    Returns:
+        Segment
+    """
+    return Segment(fitted_models, start_day, end_day, break_day, magnitudes,
+                   observation_count, change_probability, curve_qa)
+
+
+def stack_segments(change_models, pixel=0):
+    """
+    Combine the segments of a pixel into one array, allocated once and
+    filled in place.
+
+    Args:
+        change_models: sequence of Segment, see segment_record, or of
+            SEGMENT_DTYPE records, such as those of a previous result
+        pixel: pixel index to record on the segments
+
+    Returns:
+        1-d SEGMENT_DTYPE ndarray
+    """
+    records = np.zeros(len(change_models), dtype=SEGMENT_DTYPE)
+
+    for idx, segment in enumerate(change_models):
+        if not isinstance(segment, Segment):
+            records[idx] = segment
+            continue
+
+        records['start_day'][idx] = segment.start_day
+        records['end_day'][idx] = segment.end_day
+        records['break_day'][idx] = segment.break_day
+        records['observation_count'][idx] = segment.observation_count
+        records['change_probability'][idx] = segment.change_probability
+        records['curve_qa'][idx] = segment.curve_qa
+        records['magnitude'][idx] = segment.magnitudes
+
+        rmse = records['rmse'][idx]
+        intercept = records['intercept'][idx]
+        coefficients = records['coefficients'][idx]
+
+        for band_idx, model in enumerate(segment.fitted_models):
+            coef = model.fitted_model.coef_
+
+            rmse[band_idx] = model.rmse
+            intercept[band_idx] = model.fitted_model.intercept_
+            coefficients[band_idx, :len(coef)] = coef
+
+    records['pixel'] = pixel
+
+    return records
+
+
+def from_change_models(change_models, pixel=0):
+    """
+    Convert change model dicts to SEGMENT_DTYPE records, the inverse of
+    change_models.
+
+    Args:
+        change_models: list of dicts, see ccd.models.results_to_changemodel
+        pixel: pixel index to record on the segments
+
+    Returns:
+        1-d SEGMENT_DTYPE ndarray
+    """
+    records = np.zeros(len(change_models), dtype=SEGMENT_DTYPE)
+    records['pixel'] = pixel
+
+    for record, model in zip(records, change_models):
+        for name in ('start_day', 'end_day', 'break_day', 'observation_count',
+                     'change_probability', 'curve_qa'):
+            record[name] = model[name]
+
+        for band_idx, band in enumerate(BANDS):
+            spectral = model[band]
+            record['magnitude'][band_idx] = spectral['magnitude']
+            record['rmse'][band_idx] = spectral['rmse']
+            record['intercept'][band_idx] = spectral['intercept']
+            record['coefficients'][band_idx] = spectral['coefficients']
+
+    return records
+
+
+def change_models(records):
+    """
+    Convert SEGMENT_DTYPE records to change model dicts.
+
+    Args:
+        records: SEGMENT_DTYPE ndarray
+
+    Returns:
+        list of dicts, see ccd.models.results_to_changemodel
+    """
+    models = []
+    for record in records:
+        model = {'start_day': int(record['start_day']),
+                 'end_day': int(record['end_day']),
+                 'break_day': int(record['break_day']),
+                 'observation_count': int(record['observation_count']),
+                 'change_probability': float(record['change_probability']),
+                 'curve_qa': int(record['curve_qa'])}
+
+        for band_idx, band in enumerate(BANDS):
+            model[band] = {
+                'rmse': float(record['rmse'][band_idx]),
+                'coefficients': tuple(float(c) for c in
+                                      record['coefficients'][band_idx]),
+                'intercept': float(record['intercept'][band_idx]),
+                'magnitude': float(record['magnitude'][band_idx])}
+
+        models.append(model)
+
+    return models
+
+
+def pack_mask(processing_mask):
+    """
+    Bit-pack processing masks along their last axis.
+
+    Args:
+        processing_mask: boolean or 0/1 ndarray
+
+    Returns:
+        uint8 ndarray
+    """
+    return np.packbits(np.asarray(processing_mask, dtype=bool), axis=-1)
+
+
+def unpack_mask(packed, observations):
+    """
+    Unpack processing masks packed by pack_mask.
+
+    Args:
+        packed: uint8 ndarray
+        observations: length of the unpacked masks
+
+    Returns:
+        uint8 ndarray of 0s and 1s
+    """
+    return np.unpackbits(packed, axis=-1)[..., :observations]
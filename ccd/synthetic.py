@@ -0,0 +1,262 @@
+"""
+Synthetic chips of Landsat like time series, for scale and throughput
+testing without real data.
+
+Each pixel follows a harmonic seasonal curve for every band, with abrupt
+changes in level and amplitude at its breaks, and noise. Observations are
+then spoiled at the given rates: clouds, which tend to cover a whole
+acquisition as they do for a scene, snow, which falls in the winter, and
+fill. The QA is encoded with the offsets of the processing parameters,
+bit-packed when QA_BITPACKED is set, so the chip runs through detect and
+detect_chip with the same parameters.
+
+Generation is vectorized over the whole chip and seeded, the same arguments
+always give the same chip.
+
+Example:
+    >>> from ccd import synthetic
+    >>> data = synthetic.chip(pixels=100, observations=2000, breaks=2,
+    ...                       cloud=0.3, seed=1)
+    >>> results = ccd.detect_chip(data.dates, data.spectra, data.qas)
+    >>> ccd.detect(**synthetic.pixel(data, 0))
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from ccd import app
+
+# Ordinal of 1982-11-01, around the start of the Landsat 4 archive
+START = 723850
+
+# Seasonal curve of each band, in the order of the spectra: mean value,
+# seasonal amplitude and the value an observation has under a cloud and
+# under snow. The thermal band is in celsius, scaled by 100
+BAND_VALUES = ((500, 150, 6000, 8000),
+               (800, 200, 6200, 8200),
+               (700, 250, 6400, 8300),
+               (3000, 900, 6600, 6000),
+               (2000, 500, 5000, 500),
+               (1200, 400, 4000, 300),
+               (2000, 1200, -2000, -500))
+
+# Value of fill observations
+FILL_VALUE = -9999
+
+# A synthetic chip
+#   dates: 1-d int64 ndarray of sorted ordinal dates
+#   spectra: 3-d int16 ndarray shaped as (bands, pixels, observations)
+#   qas: 2-d ndarray shaped as (pixels, observations), uint16 when
+#       bit-packed
+#   breaks: 2-d int64 ndarray shaped as (pixels, breaks), the ordinal date
+#       of each break
+Chip = namedtuple('Chip', ['dates', 'spectra', 'qas', 'breaks'])
+
+
+def acquisition_dates(observations, rng, start=START, interval=8,
+                      duplicates=0.0):
+    """
+    Sorted acquisition dates, irregularly spaced.
+
+    Args:
+        observations: number of dates
+        rng: numpy.random.RandomState
+        start: ordinal of the first date
+        interval: mean number of days between the dates
+        duplicates: rate of dates repeating the one before, as for
+            overlapping scenes
+
+    Returns:
+        1-d int64 ndarray
+    """
+    gaps = rng.randint(1, 2 * interval, size=observations)
+    gaps[0] = 0
+    gaps[rng.rand(observations) < duplicates] = 0
+
+    return start + np.cumsum(gaps, dtype=np.int64)
+
+
+def break_indices(pixels, observations, breaks, rng):
+    """
+    Positions of the breaks of each pixel, around evenly spaced points so
+    that every segment has about the same length.
+
+    Args:
+        pixels: number of pixels
+        observations: number of observations
+        breaks: number of breaks for each pixel
+        rng: numpy.random.RandomState
+
+    Returns:
+        2-d int64 ndarray shaped as (pixels, breaks), sorted for each pixel
+    """
+    length = observations / (breaks + 1)
+    centers = length * np.arange(1, breaks + 1)
+    jitter = rng.uniform(-length / 4, length / 4, size=(pixels, breaks))
+
+    return np.round(centers + jitter).astype(np.int64)
+
+
+def __covered(pixels, dates, rate, rng):
+    """
+    Which observations a cloud covers, acquisitions tend to be either mostly
+    clear or mostly cloudy.
+    """
+    if rate <= 0:
+        return np.zeros((pixels, dates.shape[0]), dtype=bool)
+
+    if rate >= 1:
+        return np.ones((pixels, dates.shape[0]), dtype=bool)
+
+    cover = rng.beta(rate, 1 - rate, size=dates.shape[0])
+
+    return rng.rand(pixels, dates.shape[0]) < cover
+
+
+def __snowed(pixels, dates, rate, rng):
+    """
+    Which observations are snow covered, more likely the closer to mid
+    January.
+    """
+    winter = (1 + np.cos(2 * np.pi * (dates - 15) / 365.2425)) / 2
+
+    return rng.rand(pixels, dates.shape[0]) < np.minimum(2 * rate * winter, 1)
+
+
+def __encode(flags, proc_params):
+    """
+    QA values for the observations flagged as fill, cloud or snow, clear
+    for the rest.
+    """
+    fill, cloud, snow = flags
+
+    if proc_params.QA_BITPACKED:
+        def value(offset):
+            return 1 << offset
+
+        dtype = np.uint16
+    else:
+        def value(offset):
+            return offset
+
+        dtype = np.int16
+
+    return np.select([fill, cloud, snow],
+                     [value(proc_params.QA_FILL),
+                      value(proc_params.QA_CLOUD),
+                      value(proc_params.QA_SNOW)],
+                     default=value(proc_params.QA_CLEAR)).astype(dtype)
+
+
+def chip(pixels=100, observations=1000, breaks=2, cloud=0.2, snow=0.0,
+         fill=0.0, duplicates=0.0, magnitude=800, noise=50, interval=8,
+         start=START, params=None, seed=0):
+    """
+    Generate a synthetic chip.
+
+    Args:
+        pixels: number of pixels
+        observations: number of observations, shared by all pixels
+        breaks: number of breaks in each pixel's time series
+        cloud: rate of cloudy observations
+        snow: rate of snow covered observations, over the year
+        fill: rate of fill observations
+        duplicates: rate of acquisition dates that repeat the previous one
+        magnitude: typical change in level of a band at a break
+        noise: standard deviation of the noise added to the bands
+        interval: mean number of days between acquisitions
+        start: ordinal of the first acquisition date
+        params: python dictionary to change module wide processing
+            parameters, the QA offsets and QA_BITPACKED are used to
+            encode the QA
+        seed: random seed
+
+    Returns:
+        Chip
+
+    Raises:
+        ValueError: if a segment would be shorter than a few observations
+    """
+    if observations < 4 * (breaks + 1):
+        raise ValueError('{} observations are too few for {} breaks'
+                         .format(observations, breaks))
+
+    proc_params = app.compile_params(params)
+    rng = np.random.RandomState(seed)
+
+    dates = acquisition_dates(observations, rng, start, interval, duplicates)
+    indices = break_indices(pixels, observations, breaks, rng)
+
+    # Segment of each observation
+    positions = np.arange(observations)
+    segments = np.zeros((pixels, observations), dtype=np.intp)
+    for idx in range(breaks):
+        segments += positions >= indices[:, idx:idx + 1]
+
+    phase = 2 * np.pi * dates / 365.2425
+    season = np.sin(phase - rng.uniform(0, 0.5, size=(pixels, 1)))
+
+    flags = (rng.rand(pixels, observations) < fill,
+             __covered(pixels, dates, cloud, rng),
+             __snowed(pixels, dates, snow, rng))
+
+    spectra = np.empty((len(BAND_VALUES), pixels, observations),
+                       dtype=np.int16)
+
+    for band, (mean, amplitude, cloudy, snowy) in enumerate(BAND_VALUES):
+        # Level and amplitude of each segment, the level jumps by about
+        # magnitude at each break, alternately up and down so that it stays
+        # around the mean. Dark bands start by going up
+        signs = rng.choice((-1, 1), size=(pixels, 1))
+        if mean < 1.25 * magnitude:
+            signs[:] = 1
+
+        jumps = magnitude * rng.uniform(0.75, 1.25, size=(pixels, breaks))
+        jumps *= signs * (-1) ** np.arange(breaks)
+        levels = mean + np.concatenate([np.zeros((pixels, 1)),
+                                        np.cumsum(jumps, axis=1)], axis=1)
+        amplitudes = amplitude * rng.uniform(0.5, 1.5,
+                                             size=(pixels, breaks + 1))
+
+        values = (np.take_along_axis(levels, segments, axis=1) +
+                  np.take_along_axis(amplitudes, segments, axis=1) * season +
+                  rng.normal(0, noise, size=(pixels, observations)))
+
+        # Keep the surface values in the valid range, so that only the
+        # spoiled observations are filtered out
+        if band < len(BAND_VALUES) - 1:
+            values = np.clip(values, 1, 9999)
+
+        values[flags[2]] = snowy
+        values[flags[1]] = cloudy
+        values[flags[0]] = FILL_VALUE
+
+        spectra[band] = np.round(values)
+
+    qas = __encode(flags, proc_params)
+
+    return Chip(dates=dates,
+                spectra=spectra,
+                qas=qas,
+                breaks=dates[indices])
+
+
+def pixel(synthetic, index=0):
+    """
+    The detect arguments of a pixel of a synthetic chip.
+
+    Args:
+        synthetic: Chip
+        index: pixel index
+
+    Returns:
+        dict of the dates, bands and qas keyword arguments of ccd.detect
+    """
+    names = ('blues', 'greens', 'reds', 'nirs', 'swir1s', 'swir2s',
+             'thermals')
+
+    arguments = {'dates': synthetic.dates, 'qas': synthetic.qas[index]}
+    for name, values in zip(names, synthetic.spectra[:, index]):
+        arguments[name] = values
+
+    return arguments
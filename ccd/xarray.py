@@ -0,0 +1,252 @@
+"""
+Run change detection across an xarray Dataset, such as one loaded from a
+datacube.
+
+The Dataset holds a variable for each spectral band and one for the QA,
+each with time, y and x dimensions. Pixels are run a chunk at a time through
+ccd.parallel.run_chip, and for Dask backed Datasets each chunk of y and x
+becomes a task of its own. The results come back as a Dataset of gridded
+variables on the same y and x coordinates.
+
+xarray is an optional dependency, only needed by this module, and Dask is
+only needed for chunked Datasets.
+
+Example:
+    >>> from ccd import xarray as ccd_xarray
+    >>> bands = {'blue': 'blue', 'green': 'green', 'red': 'red',
+    ...          'nir': 'nir', 'swir1': 'swir_1', 'swir2': 'swir_2',
+    ...          'thermal': 'surface_temperature'}
+    >>> results = ccd_xarray.detect_dataset(ds, bands, qa='pixel_qa',
+    ...                                     scale=10000)
+    >>> results.break_day.isel(segment=0)
+
+A number given as scale only applies to the reflectance bands, blue through
+swir2, so the thermal band above is left as it is.
+"""
+import numpy as np
+
+from ccd import app, parallel, results
+
+# Ordinal of 1970-01-01, numpy's datetime64 epoch
+EPOCH_ORDINAL = 719163
+
+# Bands that a numeric scale applies to
+REFLECTANCE_BANDS = results.BANDS[:6]
+
+# Gridded output variables, with the dimensions that follow y and x and
+# their dtype. Segment variables beyond a pixel's segment_count hold 0, or
+# NaN for floats
+OUTPUTS = (('segment_count', (), np.int32),
+           ('cloud_prob', (), np.float64),
+           ('snow_prob', (), np.float64),
+           ('water_prob', (), np.float64),
+           ('start_day', ('segment',), np.int64),
+           ('end_day', ('segment',), np.int64),
+           ('break_day', ('segment',), np.int64),
+           ('observation_count', ('segment',), np.int32),
+           ('change_probability', ('segment',), np.float64),
+           ('curve_qa', ('segment',), np.int32),
+           ('magnitude', ('segment', 'band'), np.float64),
+           ('rmse', ('segment', 'band'), np.float64),
+           ('intercept', ('segment', 'band'), np.float64),
+           ('coefficients', ('segment', 'band', 'coefficient'), np.float64))
+
+
+def ordinal_dates(values):
+    """
+    Convert time coordinate values to the ordinal dates taken by ccd.
+
+    Args:
+        values: 1-d array of datetime64 values, or of ordinal dates which
+            are returned as is
+
+    Returns:
+        1-d int64 ndarray
+    """
+    values = np.asarray(values)
+
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+    return values.astype(np.int64)
+
+
+def __outputs(masks):
+    """
+    The output variables, with the processing mask when requested.
+    """
+    if masks:
+        return OUTPUTS + (('processing_mask', ('time',), np.uint8),)
+
+    return OUTPUTS
+
+
+def __gridded(chip, count, max_segments, masks):
+    """
+    Lay the compact results of a chip out as arrays with the pixels first,
+    dropping the segments beyond max_segments.
+    """
+    pixels = chip.pixels
+    records = chip.segments
+
+    # Position of each segment within its pixel
+    bounds = np.concatenate([[0], np.cumsum(pixels['segments'])])
+    ranks = np.arange(records.shape[0]) - bounds[records['pixel']]
+    records = records[ranks < max_segments]
+    ranks = ranks[ranks < max_segments]
+
+    arrays = {'segment_count': pixels['segments'],
+              'cloud_prob': pixels['cloud_prob'],
+              'snow_prob': pixels['snow_prob'],
+              'water_prob': pixels['water_prob']}
+
+    for name, dims, dtype in OUTPUTS:
+        if dims[:1] != ('segment',):
+            continue
+
+        shape = (count, max_segments) + records.dtype[name].shape
+        fill = np.nan if np.issubdtype(dtype, np.floating) else 0
+
+        arrays[name] = np.full(shape, fill, dtype=dtype)
+        arrays[name][records['pixel'], ranks] = records[name]
+
+    if masks:
+        arrays['processing_mask'] = np.unpackbits(
+            chip.masks, axis=1)[:, :chip.dates.shape[0]]
+
+    return arrays
+
+
+def __detect_block(spectra, qas, dates, params, workers, chunk_size,
+                   max_segments, masks):
+    """
+    Run a block of pixels, laid out by xarray.apply_ufunc.
+
+    Args:
+        spectra: ndarray shaped as (y, x, band, time)
+        qas: ndarray shaped as (y, x, time)
+
+    Returns:
+        tuple of ndarrays shaped as (y, x) followed by the dimensions of
+        each of the outputs
+    """
+    shape = qas.shape[:-1]
+    count = int(np.prod(shape))
+
+    outputs = __outputs(masks)
+    sizes = {'segment': max_segments,
+             'band': len(results.BANDS),
+             'coefficient': results.NUM_COEFFICIENTS,
+             'time': dates.shape[0]}
+
+    if count == 0:
+        return tuple(np.zeros(shape + tuple(sizes[dim] for dim in dims),
+                              dtype=dtype)
+                     for _, dims, dtype in outputs)
+
+    spectra = spectra.reshape((count,) + spectra.shape[-2:])
+    qas = qas.reshape(count, qas.shape[-1])
+
+    chip = parallel.run_chip(dates, spectra.transpose(1, 0, 2), qas, params,
+                             workers, chunk_size, max_segments)
+
+    arrays = __gridded(chip, count, max_segments, masks)
+
+    return tuple(arrays[name].reshape(shape + arrays[name].shape[1:])
+                 .astype(dtype, copy=False)
+                 for name, _, dtype in outputs)
+
+
+def detect_dataset(ds, bands=None, qa='qa', time='time', y='y', x='x',
+                   params=None, scale=None, workers=1, chunk_size=None,
+                   max_segments=16, masks=False):
+    """
+    Detect change for every pixel of a Dataset.
+
+    Args:
+        ds: xarray.Dataset with a variable for each band and for the QA,
+            each with time, y and x dimensions, optionally Dask backed
+        bands: dict mapping the ccd band names, blue, green, red, nir,
+            swir1, swir2 and thermal, to the Dataset variables, defaults to
+            variables named after the bands
+        qa: name of the QA variable
+        time: name of the time dimension, its coordinate holds datetime64
+            values or ordinal dates
+        y: name of the y dimension
+        x: name of the x dimension
+        params: python dictionary to change module wide processing
+            parameters
+        scale: factor to multiply the band values by, such as 10000 for
+            reflectances stored as floats, either a number, applied to the
+            reflectance bands only, or a dict by ccd band name
+        workers: number of worker processes for each chunk, see
+            ccd.parallel.run_chip
+        chunk_size: most pixels handed to a worker at a time
+        max_segments: number of segments kept for each pixel
+        masks: whether to include the processing masks, as a variable with
+            a time dimension in date order
+
+    Returns:
+        xarray.Dataset with the OUTPUTS variables on the y and x
+        coordinates of ds, lazy when ds is Dask backed
+    """
+    import xarray
+
+    if bands is None:
+        bands = {band: band for band in results.BANDS}
+
+    proc_params = app.compile_params(params)
+
+    ds = ds.sortby(time)
+    dates = ordinal_dates(ds[time].values)
+
+    layers = []
+    for band in results.BANDS:
+        layer = ds[bands[band]]
+
+        if isinstance(scale, dict):
+            factor = scale.get(band)
+        else:
+            factor = scale if band in REFLECTANCE_BANDS else None
+
+        if factor is not None:
+            layer = layer * factor
+
+        layers.append(layer.transpose(time, y, x))
+
+    spectra = xarray.concat(layers, dim='band')
+    qas = ds[qa].transpose(time, y, x)
+
+    if spectra.chunks is not None:
+        # Each task needs the whole time series of its pixels
+        spectra = spectra.chunk({'band': -1, time: -1})
+        qas = qas.chunk({time: -1})
+
+    outputs = __outputs(masks)
+    core_dims = [[time if dim == 'time' else dim for dim in dims]
+                 for _, dims, _ in outputs]
+
+    blocks = xarray.apply_ufunc(
+        __detect_block, spectra, qas,
+        input_core_dims=[['band', time], [time]],
+        output_core_dims=core_dims,
+        kwargs={'dates': dates,
+                'params': proc_params,
+                'workers': workers,
+                'chunk_size': chunk_size,
+                'max_segments': max_segments,
+                'masks': masks},
+        dask='parallelized',
+        output_dtypes=[dtype for _, _, dtype in outputs],
+        dask_gufunc_kwargs={'output_sizes': {
+            'segment': max_segments,
+            'coefficient': results.NUM_COEFFICIENTS}})
+
+    variables = {name: block.transpose(*(dims + [y, x]))
+                 for (name, _, _), dims, block in zip(outputs, core_dims,
+                                                      blocks)}
+
+    return xarray.Dataset(variables).assign_coords(
+        segment=np.arange(max_segments),
+        band=list(results.BANDS),
+        coefficient=np.arange(results.NUM_COEFFICIENTS))
@@ -52,21 +52,33 @@ setup(
         # 'Programming Language :: Python :: 2.7',
         # 'Programming Language :: Python :: 3',
         # 'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
 
     keywords='python change detection',
 
     packages=['ccd', 'ccd.models'],
 
+    # multiprocessing.shared_memory, used by ccd.parallel, is new in 3.8
+    python_requires='>=3.8',
+
     install_requires=['numpy>=1.10.0',
-                      'scipy>=0.18.1',
-                      'scikit-learn>=0.18'],
+                      'scipy>=0.18.1'],
 
     extras_require={
+        # Only needed for the ccd.models.lasso fitters
+        'sklearn': ['scikit-learn>=0.18'],
+        # Only needed for ccd.xarray, Dask for chunked Datasets
+        'xarray': ['xarray>=0.16.1', 'dask[array]'],
+        # Only needed for ccd.io
+        'arrow': ['pyarrow>=1.0'],
         'test': ['aniso8601>=1.1.0',
+                 'scikit-learn>=0.18',
+                 'pyarrow>=1.0',
                  'flake8>=3.0.4',
                  'coverage>=4.2',
                  'pytest>=3.0.2',
@@ -82,7 +94,7 @@ setup(
 
     # data_files=[('my_data', ['data/data_file'])],
 
-    # entry_points={'console_scripts': ['pyccd-detect=ccd.cli:detect', ], },
+    entry_points={'console_scripts': ['pyccd-detect=ccd.cli:detect', ], },
     # entry_points='''
     #     [core_package.cli_plugins]
     #     sample=ccd.cli:sample
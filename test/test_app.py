@@ -0,0 +1,167 @@
+import copy
+import functools
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from ccd import app, parameters
+from ccd.models import lasso
+from ccd.change import adjustchgthresh
+
+
+def test_compile_params():
+    params = app.compile_params({'PEEK_SIZE': 8, 'CUSTOM': 'value'})
+
+    assert params.PEEK_SIZE == 8
+    assert params.MEOW_SIZE == parameters.defaults['MEOW_SIZE']
+    assert params.CUSTOM == 'value'
+    assert app.compile_params(params) is params
+
+    with pytest.raises(AttributeError):
+        params.PEEK_SIZE = 6
+
+    with pytest.raises(AttributeError):
+        params.MISSING
+
+    # Parameters dicts are accepted as well
+    defaults = app.compile_params(app.get_default_params())
+    assert defaults.asdict() == parameters.defaults
+
+
+def test_compiled_params_pickle():
+    params = app.compile_params({'QA_BITPACKED': False, 'CUSTOM': [1, 2]})
+    params.change_threshold(12)
+
+    loaded = pickle.loads(pickle.dumps(params))
+
+    assert loaded.asdict() == params.asdict()
+    assert loaded.thresholds == {}
+
+
+def test_change_threshold():
+    params = app.compile_params()
+    defpeek = params.PEEK_SIZE
+    defthresh = params.CHANGE_THRESHOLD
+
+    assert params.change_threshold(defpeek) == defthresh
+    assert params.change_threshold(12) == adjustchgthresh(12, defpeek,
+                                                          defthresh)
+    assert 12 in params.thresholds
+
+
+def test_run_params():
+    params = app.compile_params()
+    run_params = app.RunParameters(params, 12, params.change_threshold(12))
+
+    assert run_params.PEEK_SIZE == 12
+    assert run_params.MEOW_SIZE == params.MEOW_SIZE
+    assert params.PEEK_SIZE == parameters.defaults['PEEK_SIZE']
+
+
+def test_run_params_copy():
+    params = app.compile_params({'CUSTOM': 'value'})
+    run_params = app.RunParameters(params, 12, params.change_threshold(12))
+
+    for other in (pickle.loads(pickle.dumps(run_params)),
+                  copy.copy(run_params), copy.deepcopy(run_params)):
+        assert other.PEEK_SIZE == 12
+        assert other.CHANGE_THRESHOLD == run_params.CHANGE_THRESHOLD
+        assert other.CUSTOM == 'value'
+
+    with pytest.raises(AttributeError):
+        app.RunParameters.__new__(app.RunParameters).PEEK_SIZE
+
+
+def test_import_is_light():
+    # sklearn and scipy are only needed by optional code paths
+    statement = ('import sys, ccd; '
+                 'print(sorted(m for m in sys.modules '
+                 'if m.split(".")[0] in ("sklearn", "scipy")))')
+
+    output = subprocess.check_output([sys.executable, '-c', statement],
+                                     universal_newlines=True)
+
+    assert output.strip() == '[]'
+
+
+def test_resolve():
+    from ccd.models import gram_lasso
+
+    fitter = app.resolve('ccd.models.gram_lasso.fitted_models')
+    assert fitter is gram_lasso.fitted_models
+    assert app.resolve(fitter) is fitter
+
+    with pytest.raises(ValueError):
+        app.resolve('ccd.models.gram_lasso.missing')
+
+    with pytest.raises(ValueError):
+        app.resolve('not_a_module.fitter')
+
+
+def test_register():
+    def fitter(coef_matrix, spectra, max_iter, num_coefficients,
+               warm_start=None):
+        pass
+
+    app.register('test.registered_fitter', fitter)
+    params = app.compile_params({'FITTER_FN': 'test.registered_fitter'})
+
+    assert params.function('FITTER_FN') is fitter
+
+    # Callables can be handed over directly as well
+    params = app.compile_params({'FITTER_FN': fitter})
+    assert params.function('FITTER_FN') is fitter
+
+    with pytest.raises(TypeError):
+        app.register('test.not_callable', 'value')
+
+
+def test_compile_params_fails_fast():
+    with pytest.raises(ValueError):
+        app.compile_params({'FITTER_FN': 'ccd.models.missing.fitted_models'})
+
+    # Single band fitters of the earlier contract, taking dates, are adapted
+    params = app.compile_params({'FITTER_FN':
+                                 'ccd.models.lasso.fitted_model'})
+    fitter = params.function('FITTER_FN')
+    assert fitter.args[0] is lasso.fitted_model
+    assert fitter.args[1] == params.AVG_DAYS_YR
+
+    def fitter(dates, spectra_obs, max_iter, avg_days_yr, num_coefficients):
+        pass
+
+    with pytest.raises(ValueError):
+        app.check_fitter(fitter)
+
+    with pytest.raises(ValueError, match='FITTER_FN must be set'):
+        app.compile_params({'FITTER_FN': None})
+
+
+def test_check_fitter():
+    def fitter(coef_matrix, spectra, max_iter, num_coefficients, alpha=1):
+        pass
+
+    app.check_fitter(fitter, warm_start=False)
+    app.check_fitter(functools.partial(fitter, alpha=2), warm_start=False)
+
+    # Warm starts need the warm_start keyword
+    with pytest.raises(ValueError):
+        app.check_fitter(fitter)
+
+    params = app.compile_params({'FITTER_FN': fitter,
+                                 'LASSO_WARM_START': False})
+    assert params.function('FITTER_FN') is fitter
+
+    # The signature is inspected once for each fitter, not for each compile
+    checked = getattr(app, '__fitter_error')
+    misses = checked.cache_info().misses
+    for _ in range(3):
+        app.compile_params({'FITTER_FN': fitter, 'LASSO_WARM_START': False})
+    assert checked.cache_info().misses == misses
+
+    # Failures are cached too, and still raise every time
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            app.check_fitter(fitter)
@@ -99,3 +99,60 @@ def test_sort_dates():
     ans = np.array([0, 2, 4, 1, 3])
 
     assert np.array_equal(ans, ccd.__sort_dates(arr))
+
+
+def test_detect_chip():
+    """
+    Chip results should be identical to running each pixel through detect.
+    """
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    params = {'QA_BITPACKED': False,
+              'QA_FILL': 255,
+              'QA_CLEAR': 0,
+              'QA_WATER': 1,
+              'QA_SHADOW': 2,
+              'QA_SNOW': 3,
+              'QA_CLOUD': 4}
+
+    data = read_data(sample)
+    dates = data[0]
+
+    # normal, shifted, persistent snow and insufficient clear pixels
+    spectra = np.stack([data[1:8], data[1:8] + 100, data[1:8], data[1:8]],
+                       axis=1)
+    qas = np.stack([data[8], data[8], np.full_like(data[8], 3),
+                    np.where(np.arange(data[8].shape[0]) % 5, 4, data[8])])
+
+    results = ccd.detect_chip(dates, spectra, qas, params=params)
+
+    assert len(results) == qas.shape[0]
+
+    for idx, result in enumerate(results):
+        expected = ccd.detect(dates, *spectra[:, idx], qas[idx],
+                              params=params)
+
+        assert result == expected
+
+
+def test_detect_matrix():
+    """
+    Pre-stacked inputs should give the same results as detect, whether they
+    are sorted or not.
+    """
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    params = {'QA_BITPACKED': False,
+              'QA_FILL': 255,
+              'QA_CLEAR': 0,
+              'QA_WATER': 1,
+              'QA_SHADOW': 2,
+              'QA_SNOW': 3,
+              'QA_CLOUD': 4}
+
+    data = read_data(sample)
+    expected = ccd.detect(*data, params=params)
+
+    matrix = np.ascontiguousarray(data, dtype=np.int32)
+    assert ccd.detect_matrix(matrix, params=params) == expected
+
+    shuffled = matrix[:, np.random.RandomState(0).permutation(matrix.shape[1])]
+    assert ccd.detect_matrix(shuffled, params=params) == expected
@@ -0,0 +1,245 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+import ccd
+from ccd import cli, results, synthetic
+from test.shared import read_data
+
+sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+
+params = {'QA_BITPACKED': False,
+          'QA_FILL': 255,
+          'QA_CLEAR': 0,
+          'QA_WATER': 1,
+          'QA_SHADOW': 2,
+          'QA_SNOW': 3,
+          'QA_CLOUD': 4}
+
+
+def inputs(tmpdir):
+    data = read_data(sample)
+
+    pixel = str(tmpdir.join('pixel.npy'))
+    np.save(pixel, data)
+
+    chip = str(tmpdir.join('chip.npz'))
+    np.savez(chip, dates=data[0],
+             spectra=np.stack([data[1:8], data[1:8] + 100], axis=1),
+             qas=np.stack([data[8], data[8]]))
+
+    return [sample, pixel, chip]
+
+
+def test_input_paths(tmpdir):
+    paths = inputs(tmpdir)
+    tmpdir.join('notes.txt').write('')
+
+    manifest = tmpdir.join('manifest.txt')
+    manifest.write('# inputs\n{}\n\n{}\n'.format(paths[0], paths[1]))
+
+    found = cli.input_paths([str(tmpdir)], str(manifest))
+
+    assert found == [paths[2], paths[1], paths[0]]
+
+
+def test_load_input(tmpdir):
+    paths = inputs(tmpdir)
+
+    kind, arguments = cli.load_input(paths[1])
+    assert kind == 'pixel'
+    assert np.array_equal(arguments['qas'], read_data(sample)[8])
+
+    kind, arguments = cli.load_input(paths[2])
+    assert kind == 'chip'
+    assert arguments['spectra'].shape[:2] == (7, 2)
+
+
+def test_run_resume(tmpdir):
+    paths = inputs(tmpdir)
+    output = str(tmpdir.join('results.jsonl'))
+
+    stats = cli.run(paths, output, params=params, workers=2,
+                    stream=io.StringIO())
+
+    assert stats.pixels == 4
+    assert stats.fits > 0
+
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+
+    assert [(r['input'], r['pixel']) for r in records] == \
+        [(paths[0], 0), (paths[1], 0), (paths[2], 0), (paths[2], 1)]
+
+    # Compact lines, that read back as the results of detect
+    found = list(cli.read_results(output))
+    assert [(path, pixel) for path, pixel, _ in found] == \
+        [(r['input'], r['pixel']) for r in records]
+
+    for path, pixel, result in found[:2]:
+        expected = ccd.detect(*read_data(sample), params=params)
+
+        assert results.change_models(result.segments) == \
+            list(expected['change_models'])
+        assert list(results.unpack_mask(result.processing_mask,
+                                        result.observations)) == \
+            expected['processing_mask']
+        assert result.cloud_prob == expected['cloud_prob']
+
+    with np.load(paths[2]) as data:
+        chip = ccd.detect_chip(data['dates'], data['spectra'], data['qas'],
+                               params=params)
+
+    assert results.change_models(found[3][2].segments) == \
+        chip[1]['change_models']
+
+    # Interrupted while writing the chip
+    with open(output) as f:
+        complete = f.read()
+
+    progress = output + '.progress'
+    with open(progress) as f:
+        lines = f.readlines()
+    with open(progress, 'w') as f:
+        f.writelines(lines[:2])
+    with open(output, 'a') as f:
+        f.write('{"input":')
+
+    stats = cli.run(paths, output, params=params, workers=2, resume=True,
+                    stream=io.StringIO())
+
+    assert stats.inputs == 1
+    with open(output) as f:
+        assert f.read() == complete
+
+
+def test_detect_existing_output(tmpdir):
+    output = tmpdir.join('results.jsonl')
+    output.write('')
+
+    assert cli.detect([sample, '--output', str(output)]) == 2
+    assert os.path.getsize(str(output)) == 0
+
+
+def test_run_diagnostics(tmpdir):
+    paths = inputs(tmpdir)[:2]
+    output = str(tmpdir.join('results.jsonl'))
+    stream = io.StringIO()
+
+    stats = cli.run(paths, output, params=dict(params, DIAGNOSTICS=True),
+                    stream=stream)
+
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+
+    assert all(r['diagnostics']['procedure'] == 'standard_procedure'
+               for r in records)
+    assert stats.diagnostics['pixels'] == 2
+    assert stats.diagnostics['fitter_calls'] == \
+        sum(r['diagnostics']['counts']['fitter_calls'] for r in records)
+    assert 'diagnostics: ' in stream.getvalue()
+
+
+def test_run_failed_inputs(tmpdir):
+    paths = inputs(tmpdir)
+    output = str(tmpdir.join('results.jsonl'))
+
+    broken = str(tmpdir.join('broken.npy'))
+    np.save(broken, np.zeros((3, 10), dtype=np.int64))
+    missing = str(tmpdir.join('missing.npz'))
+
+    stream = io.StringIO()
+    stats = cli.run([broken, paths[0], missing, paths[2]], output,
+                    params=params, workers=2, stream=stream)
+
+    # The run carries on past the failed inputs
+    assert stats.pixels == 3
+    assert sorted(stats.failed) == sorted([broken, missing])
+    assert '2 inputs failed' in stream.getvalue()
+
+    with open(output) as f:
+        assert [json.loads(line)['input'] for line in f] == \
+            [paths[0], paths[2], paths[2]]
+
+    # Failed inputs are tried again on resume
+    stats = cli.run([broken, paths[0], missing, paths[2]], output,
+                    params=params, workers=2, resume=True,
+                    stream=io.StringIO())
+
+    assert stats.inputs == 0
+    assert sorted(stats.failed) == sorted([broken, missing])
+
+    assert cli.detect([broken, '--output', output, '--force']) == 1
+
+
+def test_run_unreadable_inputs(tmpdir):
+    output = str(tmpdir.join('results.jsonl'))
+
+    unsupported = str(tmpdir.join('bad.txt'))
+    tmpdir.join('bad.txt').write('')
+    missing = str(tmpdir.join('missing.npy'))
+
+    stats = cli.run([sample, unsupported, missing], output, params=params,
+                    workers=1, stream=io.StringIO())
+
+    assert stats.pixels == 1
+    assert sorted(stats.failed) == sorted([unsupported, missing])
+
+    with open(output) as f:
+        assert [json.loads(line)['input'] for line in f] == [sample]
+
+
+def test_skip_coefficients(tmpdir):
+    found = cli.input_paths(['test/resources'])
+
+    assert 'test/resources/test_3657_3610_observations.csv' in found
+    assert not any(path.endswith('_coefficients.csv') for path in found)
+
+    # Unless asked for
+    path = 'test/resources/test_3657_3610_coefficients.csv'
+    assert cli.input_paths([path]) == [path]
+
+    # Not the 9 columns of a pixel
+    wrong = tmpdir.join('wrong.csv')
+    wrong.write('724785,1,2,3\n724801,1,2,3\n')
+
+    with pytest.raises(ValueError):
+        cli.load_input(str(wrong))
+
+
+def test_workers_validation(tmpdir, capsys):
+    output = str(tmpdir.join('results.jsonl'))
+
+    for workers in ('0', '-2', 'many'):
+        with pytest.raises(SystemExit):
+            cli.detect([sample, '--output', output, '--workers', workers])
+
+        assert 'not a positive integer' in capsys.readouterr().err
+
+    with pytest.raises(ValueError):
+        cli.run([sample], output, params=params, workers=0)
+
+
+def test_run_duplicate_dates(tmpdir):
+    # Same day acquisitions of overlapping scenes
+    data = synthetic.chip(pixels=4, observations=800, duplicates=0.2,
+                          params=params, seed=5)
+    assert np.any(np.diff(data.dates) == 0)
+
+    chip = str(tmpdir.join('chip.npz'))
+    np.savez(chip, dates=data.dates, spectra=data.spectra, qas=data.qas)
+    output = str(tmpdir.join('results.jsonl'))
+
+    cli.run([chip], output, params=params, workers=2, stream=io.StringIO())
+
+    for _, pixel, result in cli.read_results(output):
+        expected = ccd.detect(params=params, **synthetic.pixel(data, pixel))
+
+        assert results.change_models(result.segments) == \
+            list(expected['change_models'])
+        assert list(results.unpack_mask(result.processing_mask,
+                                        result.observations)) == \
+            expected['processing_mask']
@@ -0,0 +1,88 @@
+import ccd
+from ccd import diagnostics
+from test.test_parallel import chip, params
+
+instrumented = dict(params, DIAGNOSTICS=True)
+
+
+def test_detect_diagnostics():
+    dates, spectra, qas = chip()
+
+    expected = ccd.detect(dates, *spectra[:, 0], qas[0], params=params)
+    output = ccd.detect(dates, *spectra[:, 0], qas[0], params=instrumented)
+
+    assert 'diagnostics' not in expected
+
+    # The results themselves are unchanged
+    block = output.pop('diagnostics')
+    assert output == expected
+
+    assert block['procedure'] == 'standard_procedure'
+    assert set(block['seconds']) >= {'initialize', 'lookforward', 'total'}
+    assert block['seconds']['total'] >= block['seconds']['initialize']
+
+    counts = block['counts']
+    assert counts['fitter_calls'] > 0
+    assert counts['tmask'] > 0
+    # The harmonic matrix of the time series and one for each Tmask
+    assert counts['design_matrices'] == counts['tmask'] + 1
+    assert sum(output['processing_mask']) + counts.get('outliers', 0) + \
+        counts.get('tmask_outliers', 0) <= len(dates)
+
+
+def test_detect_chip_diagnostics():
+    dates, spectra, qas = chip()
+
+    output = ccd.detect_chip(dates, spectra, qas, params=instrumented)
+
+    for idx, result in enumerate(output):
+        expected = ccd.detect(dates, *spectra[:, idx], qas[idx],
+                              params=instrumented)
+
+        assert result['diagnostics']['procedure'] == \
+            expected['diagnostics']['procedure']
+        assert result['diagnostics']['counts'] == \
+            expected['diagnostics']['counts']
+
+
+def test_columnar_diagnostics():
+    dates, spectra, qas = chip()
+    columnar = dict(instrumented, COLUMNAR_RESULTS=True)
+
+    output = ccd.detect(dates, *spectra[:, 0], qas[0], params=columnar)
+    expected = ccd.detect(dates, *spectra[:, 0], qas[0], params=instrumented)
+
+    assert output.diagnostics['counts'] == expected['diagnostics']['counts']
+
+    output = ccd.detect_chip(dates, spectra, qas, params=columnar)
+    expected = ccd.detect_chip(dates, spectra, qas, params=instrumented)
+
+    assert [block['counts'] for block in output.diagnostics] == \
+        [result['diagnostics']['counts'] for result in expected]
+
+    # Left unset while the mode is off
+    output = ccd.detect_chip(dates, spectra, qas,
+                             params=dict(params, COLUMNAR_RESULTS=True))
+    assert output.diagnostics is None
+
+
+def test_totals():
+    dates, spectra, qas = chip()
+
+    before = diagnostics.totals.copy()
+    output = ccd.detect_chip(dates, spectra, qas, params=instrumented)
+    summed = diagnostics.aggregate(result['diagnostics']
+                                   for result in output)
+
+    added = diagnostics.totals - before
+
+    assert summed['pixels'] == qas.shape[0] == added['pixels']
+    assert sum(summed['procedures'].values()) == qas.shape[0]
+    assert summed['counts']['fitter_calls'] == added['fitter_calls']
+
+    # Nothing is collected while the mode is off
+    before = diagnostics.totals.copy()
+    ccd.detect_chip(dates, spectra, qas, params=params)
+
+    assert diagnostics.totals == before
+    assert diagnostics.current() is diagnostics.IGNORED
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import ccd
+from ccd import io
+from test.test_parallel import chip, params
+
+
+def test_columns():
+    dates, spectra, qas = chip()
+    results = ccd.detect_chip(dates, spectra, qas, params=params)
+    columnar = ccd.detect_chip(dates, spectra, qas,
+                               params=dict(params, COLUMNAR_RESULTS=True))
+
+    data, algorithm = io.columns(results, [0, 30, 60, 90], 15)
+
+    assert algorithm == results[0]['algorithm']
+
+    # A row per segment, and one for the snow pixel without any
+    counts = [len(result['change_models']) for result in results]
+    assert list(data['null']) == [count == 0 for count in counts
+                                  for _ in range(max(count, 1))]
+    assert data['x'].shape[0] == sum(max(count, 1) for count in counts)
+    assert np.all(data['y'] == 15)
+
+    nir = [model['nir']['coefficients'][1] for result in results
+           for model in result['change_models']]
+    assert list(data['nir_coef_1'][~data['null']]) == nir
+
+    # Dicts and columnar results flatten the same
+    other, _ = io.columns(columnar, [0, 30, 60, 90], 15)
+    assert other.keys() == data.keys()
+    for name in data:
+        assert np.array_equal(other[name], data[name]), name
+
+
+def test_parquet(tmpdir):
+    pytest.importorskip('pyarrow')
+
+    dates, spectra, qas = chip()
+    results = ccd.detect_chip(dates, spectra, qas, params=params)
+    path = str(tmpdir.join('results.parquet'))
+
+    with io.ResultWriter(path) as writer:
+        writer.write(results[:2], [0, 30], [0, 0])
+        writer.write(results[2:], [0, 30], [30, 30])
+
+    reader = io.ResultReader(path)
+
+    # Row groups read by the lookups
+    read = []
+    read_row_group = reader.file.read_row_group
+
+    def counted(group, **kwargs):
+        read.append(group)
+        return read_row_group(group, **kwargs)
+
+    reader.file.read_row_group = counted
+
+    assert reader.file.num_row_groups == 2
+    assert reader.pixel(30, 30) == dict(results[3], change_models=list(
+        results[3]['change_models']))
+    assert read == [1]
+
+    assert reader.pixel(60, 60) is None
+    assert read == [1]
+
+    pixels = list(reader.pixels())
+    assert [coords for coords, _ in pixels] == [(0, 0), (30, 0), (0, 30),
+                                                (30, 30)]
+    for (_, result), expected in zip(pixels, results):
+        assert result == dict(expected, change_models=list(
+            expected['change_models']))
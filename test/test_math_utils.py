@@ -7,6 +7,11 @@ def test_euclidean_norm():
 
     assert ans == euclidean_norm(arr)
 
+    arr = np.array([np.arange(5), np.arange(5) * 2])
+    ans = np.array([30.0 ** .5, 120.0 ** .5])
+
+    assert np.allclose(ans, euclidean_norm(arr, axis=1))
+
 
 def test_sum_of_squares():
     arr = np.arange(5)
@@ -51,3 +56,35 @@ def test_calc_residuals():
 
 def test_kelvin_to_celsius():
     pass
+
+
+def test_majority():
+    assert majority(np.array([3, 1, 1, 3, 2])) == 1
+    assert majority(np.array([2.5, 0.5, 2.5])) == 2.5
+
+
+def test_adjusted_variogram():
+    # Every 16 days, the majority difference goes over 30 days at a lag of 2
+    dates = np.arange(0, 16 * 40, 16)
+    obs = np.array([np.arange(40) ** 2, np.arange(40) * 3])
+
+    assert variogram_lag(dates) == 2
+
+    diff = obs[:, 2:] - obs[:, :-2]
+    ans = np.median(np.abs(diff), axis=1)
+
+    assert np.array_equal(ans, adjusted_variogram(dates, obs))
+
+    # A chip of pixels sharing the dates
+    chip = np.array([obs, obs * 2, -obs])
+    vario = adjusted_variogram(dates, chip)
+
+    assert vario.shape == (3, 2)
+    assert np.array_equal(vario, np.array([ans, ans * 2, ans]))
+
+    # Not enough time for any lag, fall back to the first order variogram
+    dates = np.arange(10)
+
+    assert variogram_lag(dates) is None
+    assert np.array_equal(calculate_variogram(obs[:, :10]),
+                          adjusted_variogram(dates, obs[:, :10]))
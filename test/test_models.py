@@ -2,11 +2,15 @@
 Tests for any methods that reside in the ccd.models sub-module.
 """
 
+import functools
+
 import numpy as np
 
 from test.shared import read_data
 
-from ccd import models
+import ccd
+from ccd import app, change, models
+from ccd.models import lasso, gram_lasso
 
 
 def test_lasso_coefficient_matrix():
@@ -37,3 +41,252 @@ def test_lasso_coefficient_matrix():
         if unused_cols.shape[1] > 0:
             assert (np.where(unused_cols == 0)[0].size / unused_cols.shape[1])\
                    == len(dates)
+
+
+def test_gram_lasso_fitted_model():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    avg_days_yr = 365.2425
+    max_iter = 1000
+
+    data = read_data(sample)
+    dates = data[0]
+
+    for coefs in (4, 6, 8):
+        for spectrum in data[1:8]:
+            expected = lasso.fitted_model(dates, spectrum, max_iter,
+                                          avg_days_yr, coefs)
+            actual = gram_lasso.fitted_model(dates, spectrum, max_iter,
+                                             avg_days_yr, coefs)
+
+            assert np.allclose(expected.fitted_model.coef_,
+                               actual.fitted_model.coef_)
+            assert np.isclose(expected.fitted_model.intercept_,
+                              actual.fitted_model.intercept_)
+            assert np.isclose(expected.rmse, actual.rmse)
+            assert np.allclose(expected.residual, actual.residual)
+
+
+def test_gram_lasso_fitted_models():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    avg_days_yr = 365.2425
+    max_iter = 1000
+
+    data = read_data(sample)
+    dates = data[0]
+    spectra = data[1:8]
+
+    for coefs in (4, 6, 8):
+        # Full harmonic matrix, the fitters only use the columns they need
+        coef_matrix = lasso.coefficient_matrix(dates, avg_days_yr, 8)
+
+        expected = lasso.fitted_models(coef_matrix, spectra, max_iter, coefs)
+        actual = gram_lasso.fitted_models(coef_matrix, spectra, max_iter,
+                                          coefs)
+
+        assert len(actual) == spectra.shape[0]
+
+        for exp, act in zip(expected, actual):
+            assert np.allclose(exp.fitted_model.coef_, act.fitted_model.coef_)
+            assert np.isclose(exp.fitted_model.intercept_,
+                              act.fitted_model.intercept_)
+            assert np.isclose(exp.rmse, act.rmse)
+            assert np.allclose(exp.residual, act.residual)
+
+
+def test_band_fitter():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    avg_days_yr = 365.2425
+    max_iter = 1000
+
+    data = read_data(sample)
+    dates = data[0]
+    spectra = data[1:8]
+
+    fitter = models.band_fitter(lasso.fitted_model, avg_days_yr)
+    app.check_fitter(fitter)
+
+    for coefs in (4, 6, 8):
+        coef_matrix = lasso.coefficient_matrix(dates, avg_days_yr, 8)
+
+        expected = lasso.fitted_models(coef_matrix, spectra, max_iter, coefs)
+        actual = fitter(coef_matrix, spectra, max_iter, coefs)
+
+        assert len(actual) == spectra.shape[0]
+
+        for exp, act in zip(expected, actual):
+            assert np.allclose(exp.fitted_model.coef_, act.fitted_model.coef_)
+            assert np.isclose(exp.rmse, act.rmse)
+
+
+def test_gram_session():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    avg_days_yr = 365.2425
+    max_iter = 1000
+
+    data = read_data(sample)
+    dates = data[0]
+    spectra = data[1:8]
+    coef_matrix = lasso.coefficient_matrix(dates, avg_days_yr, 8)
+
+    session = models.fitter_session(gram_lasso.fitted_models, coef_matrix,
+                                    spectra, max_iter)
+    assert isinstance(session, gram_lasso.GramSession)
+
+    # Grow, shift, drop a row and jump, covering the incremental updates and
+    # the rebuilds
+    windows = [np.arange(0, 24), np.arange(0, 30), np.arange(3, 33),
+               np.delete(np.arange(3, 40), 10), np.arange(100, 160)]
+
+    for rows in windows:
+        for coefs in (4, 8):
+            expected = gram_lasso.fitted_models(coef_matrix[rows],
+                                                spectra[:, rows],
+                                                max_iter, coefs)
+            actual = session.fit(rows, coefs, residuals=False)
+
+            for exp, act in zip(expected, actual):
+                assert act.residual is None
+                assert np.allclose(exp.fitted_model.coef_,
+                                   act.fitted_model.coef_)
+                assert np.isclose(exp.fitted_model.intercept_,
+                                  act.fitted_model.intercept_)
+                assert np.isclose(exp.rmse, act.rmse)
+
+            actual = session.residuals(actual, rows)
+            for exp, act in zip(expected, actual):
+                assert np.allclose(exp.residual, act.residual)
+
+
+def test_gram_session_warm_start():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    avg_days_yr = 365.2425
+    max_iter = 1000
+
+    data = read_data(sample)
+    dates = data[0]
+    spectra = data[1:8]
+    coef_matrix = lasso.coefficient_matrix(dates, avg_days_yr, 8)
+
+    session = models.fitter_session(gram_lasso.fitted_models, coef_matrix,
+                                    spectra, max_iter, count_saved=True)
+
+    previous = session.fit(np.arange(0, 40), 4)
+    actual = session.fit(np.arange(0, 41), 6, warm_start=previous)
+    expected = gram_lasso.fitted_models(coef_matrix[:41], spectra[:, :41],
+                                        max_iter, 6)
+
+    for exp, act in zip(expected, actual):
+        assert np.allclose(exp.fitted_model.coef_, act.fitted_model.coef_,
+                           rtol=1e-2, atol=1e-2)
+        assert np.isclose(exp.rmse, act.rmse, rtol=1e-3)
+
+    assert session.counts['fits'] == 2 * spectra.shape[0]
+    assert session.counts['warm_fits'] == spectra.shape[0]
+    assert session.counts['iterations'] > 0
+    assert session.counts['iterations_saved'] == (
+        sum(model.fitted_model.n_iter_ for model in expected) -
+        sum(model.fitted_model.n_iter_ for model in actual))
+
+
+def test_fitter_session_reuse():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    data = read_data(sample)
+    dates = data[0]
+    spectra = data[1:8]
+    coef_matrix = lasso.coefficient_matrix(dates, 365.2425, 8)
+
+    for fitter_fn in (lasso.fitted_models, gram_lasso.fitted_models):
+        session = models.fitter_session(fitter_fn, coef_matrix, spectra, 1000)
+
+        first = session.fit(np.arange(0, 20), 4)
+        again = session.fit(np.arange(0, 20), 4, residuals=False)
+        assert again is first
+        assert session.counts['reused'] == 1
+
+        other = session.fit(np.arange(0, 20), 6)
+        assert other is not first
+        assert session.counts['fits'] == 2 * spectra.shape[0]
+
+
+def test_fitter_session_lookup():
+    data = read_data('test/resources/sample_WA_grid08_row999_col1_normal.csv')
+    coef_matrix = lasso.coefficient_matrix(data[0], 365.2425, 8)
+    spectra = data[1:8]
+
+    wrapped = functools.partial(gram_lasso.fitted_models)
+
+    def session(fitter_fn, **kwargs):
+        return models.fitter_session(fitter_fn, coef_matrix, spectra, 1000,
+                                     **kwargs)
+
+    assert type(session(lasso.fitted_models)) is models.FitterSession
+    assert type(session(wrapped)) is models.FitterSession
+    assert type(session(wrapped, session=gram_lasso.GramSession)) is \
+        gram_lasso.GramSession
+
+    # Through the parameters, as the standard procedure builds it
+    params = app.compile_params({'FITTER_FN': wrapped,
+                                 'FITTER_SESSION_FN':
+                                     'ccd.models.gram_lasso.GramSession'})
+    assert type(session(params.function('FITTER_FN'),
+                        session=params.function('FITTER_SESSION_FN'))) is \
+        gram_lasso.GramSession
+    assert app.compile_params().function('FITTER_SESSION_FN') is None
+
+    models.register_session(wrapped, gram_lasso.GramSession)
+    assert type(session(wrapped)) is gram_lasso.GramSession
+
+
+def test_calc_band_residuals():
+    sample = 'test/resources/sample_WA_grid08_row999_col1_normal.csv'
+    data = read_data(sample)
+    dates = data[0]
+    spectra = data[1:8]
+    coef_matrix = lasso.coefficient_matrix(dates, 365.2425, 8)
+
+    fitted = gram_lasso.fitted_models(coef_matrix[:40], spectra[:, :40],
+                                      1000, 8)
+    coefs, intercepts = change.stack_coefficients(fitted)
+
+    actual = change.calc_band_residuals(coef_matrix[40:46], spectra[:, 40:46],
+                                        coefs, intercepts)
+    expected = np.array([change.calc_residuals(coef_matrix[40:46],
+                                               spectra[idx, 40:46], model)
+                         for idx, model in enumerate(fitted)])
+
+    assert actual.shape == (spectra.shape[0], 6)
+    assert np.allclose(actual, expected)
+
+
+def test_predict_from_dates():
+    avg_days_yr = 365.2425
+    max_iter = 1000
+    data = read_data("test/resources/sample_2.csv")
+    dates, observations = data[0], data[1]
+    coef_matrix = lasso.coefficient_matrix(dates, avg_days_yr, 8)
+
+    model = gram_lasso.fitted_models(coef_matrix, data[1:2], max_iter, 8)[0]
+
+    # The earlier form of the calls, with the dates
+    assert np.array_equal(lasso.predict(model, dates, avg_days_yr),
+                          lasso.predict(model, coef_matrix))
+    assert np.array_equal(
+        change.calc_residuals(dates, observations, model, avg_days_yr),
+        change.calc_residuals(coef_matrix, observations, model))
+
+
+def test_warm_start_opt_in():
+    data = read_data('test/resources/test_3657_3610_observations.csv')
+    params = {'QA_BITPACKED': False, 'QA_FILL': 255, 'QA_CLEAR': 0,
+              'QA_WATER': 1, 'QA_SHADOW': 2, 'QA_SNOW': 3, 'QA_CLOUD': 4}
+
+    before = models.solver_counts['warm_fits']
+    cold = ccd.detect(*data, params=params)
+    assert models.solver_counts['warm_fits'] == before
+
+    warm = ccd.detect(*data, params=dict(params, LASSO_WARM_START=True))
+    assert models.solver_counts['warm_fits'] > before
+
+    # Same breaks, the models only move within the solver tolerance
+    assert [model['break_day'] for model in warm['change_models']] == \
+        [model['break_day'] for model in cold['change_models']]
@@ -0,0 +1,109 @@
+import numpy as np
+
+import ccd
+from ccd import parallel, synthetic
+from test.shared import read_data
+
+params = {'QA_BITPACKED': False,
+          'QA_FILL': 255,
+          'QA_CLEAR': 0,
+          'QA_WATER': 1,
+          'QA_SHADOW': 2,
+          'QA_SNOW': 3,
+          'QA_CLOUD': 4}
+
+
+def chip():
+    data = read_data('test/resources/sample_WA_grid08_row999_col1_normal.csv')
+
+    # normal, shifted, persistent snow and insufficient clear pixels
+    spectra = np.stack([data[1:8], data[1:8] + 100, data[1:8], data[1:8]],
+                       axis=1)
+    qas = np.stack([data[8], data[8], np.full_like(data[8], 3),
+                    np.where(np.arange(data[8].shape[0]) % 5, 4, data[8])])
+
+    return data[0], spectra, qas
+
+
+def test_detect_chip():
+    dates, spectra, qas = chip()
+
+    expected = ccd.detect_chip(dates, spectra, qas, params=params)
+
+    # One pixel per task, with the segments of a pixel overflowing its slot
+    results = parallel.detect_chip(dates, spectra, qas, params=params,
+                                   workers=2, chunk_size=1, max_segments=1)
+
+    assert results == expected
+
+
+def test_run_chip():
+    dates, spectra, qas = chip()
+
+    results = parallel.run_chip(dates, spectra, qas, params=params, workers=1)
+
+    assert results.pixels.shape == (qas.shape[0],)
+    assert results.masks.shape == (qas.shape[0], (dates.shape[0] + 7) // 8)
+    assert np.all(np.diff(results.segments['pixel']) >= 0)
+    assert results.pixels['segments'].sum() == results.segments.shape[0]
+    assert parallel.to_results(results) == ccd.detect_chip(dates, spectra,
+                                                           qas, params=params)
+
+
+def test_schedule():
+    costs = np.array([1] * 8 + [50] + [1] * 8 + [20])
+
+    batches = parallel.schedule(costs, workers=2)
+
+    # Every pixel once, the expensive ones first and on their own, the cheap
+    # ones in batches that shrink towards the end
+    assert sorted(np.concatenate(batches)) == list(range(costs.shape[0]))
+    assert [list(batch) for batch in batches[:2]] == [[8], [17]]
+
+    sizes = [len(batch) for batch in batches[2:]]
+    assert sizes[0] > 1
+    assert sizes == sorted(sizes, reverse=True)
+
+    assert max(len(batch) for batch in parallel.schedule(costs, 2, 1)) == 1
+
+
+def test_predicted_costs():
+    dates, spectra, qas = chip()
+    compiled = ccd.app.compile_params(params)
+    procedures = ccd.procedures.fit_procedures(qas, compiled)
+
+    costs = parallel.predicted_costs(qas, procedures, compiled)
+
+    # Two standard pixels, one snow pixel and one insufficient clear pixel
+    assert costs[0] == costs[1]
+    assert np.all(costs[:2] > costs[2:])
+
+
+def test_load_stats():
+    stats = parallel.load_stats(2.0, [(1, 1.0), (2, 0.5), (1, 0.5)], 3)
+
+    assert stats.busy == {1: 1.5, 2: 0.5}
+    assert stats.batches == 3
+    assert stats.imbalance == 1.5 / (2.0 / 3)
+    assert stats.efficiency == 2.0 / 6
+
+
+def test_run_chip_duplicate_dates():
+    # Overlapping scenes acquire some pixels twice on the same day
+    data = synthetic.chip(pixels=6, observations=800, duplicates=0.2,
+                          params=params, seed=5)
+    assert np.any(np.diff(data.dates) == 0)
+
+    # Sorted, and shuffled so that the dates have to be sorted
+    order = np.random.RandomState(0).permutation(data.dates.shape[0])
+
+    for indices in (slice(None), order):
+        dates = data.dates[indices]
+        spectra = data.spectra[..., indices]
+        qas = data.qas[:, indices]
+
+        expected = ccd.detect_chip(dates, spectra, qas, params=params)
+        chip = parallel.run_chip(dates, spectra, qas, params=params,
+                                 workers=2)
+
+        assert parallel.to_results(chip) == expected
@@ -1,6 +1,8 @@
 """
 Tests for the basic masking and filtering operations
 """
+import pytest
+
 from ccd.qa import *
 from ccd.app import get_default_params
 
@@ -103,3 +105,60 @@ def test_duplicate_values():
                     True, False], dtype=bool)
 
     assert np.array_equal(ans, mask_duplicate_values(arr))
+
+
+def test_unpackqa():
+    packints = np.array([1, 2, 4, 8, 16, 32, 832, 896, 1024, 3, 48, 66])
+    ans = np.array([qabitval(i, default_params) for i in packints])
+
+    assert np.array_equal(ans, unpackqa(packints, default_params))
+
+    chip = packints.reshape(3, 4)
+
+    assert np.array_equal(ans.reshape(3, 4), unpackqa(chip, default_params))
+
+
+def test_unpackqa_unsupported():
+    packints = [1, 0, 2, 64, 0]
+
+    with pytest.raises(ValueError) as e:
+        unpackqa(packints, default_params)
+
+    assert '[0, 64]' in str(e.value)
+
+
+def test_qa_lookup_table():
+    deafrica_params = get_default_params()
+    deafrica_params.update({'QA_FILL': 1,
+                            'QA_CLEAR': 0,
+                            'QA_WATER': 7,
+                            'QA_SHADOW': 4,
+                            'QA_SNOW': 5,
+                            'QA_CLOUD': 3,
+                            'QA_CIRRUS1': 2,
+                            'QA_CIRRUS2': 2,
+                            'QA_OCCLUSION': 4})
+
+    packints = np.arange(QA_LOOKUP_SIZE)
+
+    for params in (default_params, deafrica_params):
+        table = qa_lookup_table(params)
+
+        assert table is qa_lookup_table(params)
+        assert np.array_equal(decodeqa(packints, qa_offsets(params)), table)
+
+    assert qa_lookup_table(default_params) is not \
+        qa_lookup_table(deafrica_params)
+
+
+def test_unpackqa_dtypes():
+    packints = [1, 2, 4, 8, 16, 32, 832, 896, 1024]
+    ans = [0, 1, 2, 3, 4, 5, 1, 1, 1]
+
+    for dtype in (np.uint16, np.int16, np.int64):
+        arr = np.array(packints, dtype=dtype)
+
+        assert np.array_equal(ans, unpackqa(arr, default_params))
+
+    with pytest.raises(ValueError):
+        unpackqa(np.array([2, 2 ** 16]), default_params)
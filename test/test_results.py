@@ -0,0 +1,71 @@
+import numpy as np
+
+import ccd
+from ccd import results
+from test.test_parallel import chip, params
+
+columnar = dict(params, COLUMNAR_RESULTS=True)
+
+
+def test_detect_columnar():
+    dates, spectra, qas = chip()
+
+    for idx in range(qas.shape[0]):
+        expected = ccd.detect(dates, *spectra[:, idx], qas[idx],
+                              params=params)
+        output = ccd.detect(dates, *spectra[:, idx], qas[idx],
+                            params=columnar)
+
+        assert isinstance(output, results.ColumnarResults)
+        assert output.segments.dtype == results.SEGMENT_DTYPE
+        assert output.processing_mask.dtype == np.uint8
+        assert output.observations == dates.shape[0]
+        assert output.cloud_prob == expected['cloud_prob']
+
+        assert results.change_models(output.segments) == \
+            list(expected['change_models'])
+        assert list(results.unpack_mask(output.processing_mask,
+                                        output.observations)) == \
+            expected['processing_mask']
+
+
+def test_detect_chip_columnar():
+    dates, spectra, qas = chip()
+
+    expected = ccd.detect_chip(dates, spectra, qas, params=params)
+    output = ccd.detect_chip(dates, spectra, qas, params=columnar)
+
+    assert output.processing_mask.shape == (qas.shape[0],
+                                            (dates.shape[0] + 7) // 8)
+    masks = results.unpack_mask(output.processing_mask, output.observations)
+
+    for idx, result in enumerate(expected):
+        segments = output.segments[output.segments['pixel'] == idx]
+
+        assert results.change_models(segments) == \
+            list(result['change_models'])
+        assert list(masks[idx]) == result['processing_mask']
+        assert output.water_prob[idx] == result['water_prob']
+
+
+def test_segment_layout():
+    dates, spectra, qas = chip()
+
+    output = ccd.detect(dates, *spectra[:, 0], qas[0], params=columnar)
+    segments = output.segments
+
+    # segments x bands, and segments x bands x coefficients
+    assert segments['rmse'].shape == (segments.shape[0], len(results.BANDS))
+    assert segments['coefficients'].shape == (segments.shape[0],
+                                              len(results.BANDS),
+                                              results.NUM_COEFFICIENTS)
+
+
+def test_pack_mask():
+    mask = np.array([[1, 0, 1, 1, 0, 0, 0, 1, 1, 0],
+                     [0, 0, 0, 0, 0, 0, 0, 0, 0, 1]])
+
+    packed = results.pack_mask(mask)
+
+    assert packed.shape == (2, 2)
+    assert np.array_equal(results.unpack_mask(packed, 10), mask)
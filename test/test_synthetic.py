@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import ccd
+from ccd import app, qa, synthetic
+
+cfmask = {'QA_BITPACKED': False,
+          'QA_FILL': 255,
+          'QA_CLEAR': 0,
+          'QA_WATER': 1,
+          'QA_SHADOW': 2,
+          'QA_SNOW': 3,
+          'QA_CLOUD': 4}
+
+
+def test_chip_layout():
+    data = synthetic.chip(pixels=20, observations=3000, breaks=3, cloud=0.3,
+                          snow=0.1, fill=0.05, duplicates=0.05, seed=1)
+
+    assert data.dates.shape == (3000,)
+    assert data.spectra.shape == (7, 20, 3000)
+    assert data.spectra.dtype == np.int16
+    assert data.qas.shape == (20, 3000)
+    assert data.breaks.shape == (20, 3)
+
+    assert np.all(np.diff(data.dates) >= 0)
+    assert np.any(np.diff(data.dates) == 0)
+    assert np.all(np.diff(data.breaks, axis=1) > 0)
+
+    params = app.compile_params()
+    unpacked = qa.unpackqa(data.qas, params)
+
+    for offset, rate in ((params.QA_CLOUD, 0.3), (params.QA_FILL, 0.05)):
+        assert abs(np.mean(unpacked == offset) - rate) < 0.1
+
+    assert np.all(data.spectra[:, unpacked == params.QA_FILL] ==
+                  synthetic.FILL_VALUE)
+
+
+def test_seeded():
+    first = synthetic.chip(pixels=5, observations=500, cloud=0.2, seed=3)
+    again = synthetic.chip(pixels=5, observations=500, cloud=0.2, seed=3)
+    other = synthetic.chip(pixels=5, observations=500, cloud=0.2, seed=4)
+
+    for name in synthetic.Chip._fields:
+        assert np.array_equal(getattr(first, name), getattr(again, name))
+
+    assert not np.array_equal(first.spectra, other.spectra)
+
+
+def test_detect_breaks():
+    data = synthetic.chip(pixels=3, observations=1200, breaks=2, cloud=0.2,
+                          params=cfmask, seed=2)
+
+    assert set(np.unique(data.qas)) <= {0, 4}
+
+    results = ccd.detect_chip(data.dates, data.spectra, data.qas,
+                              params=cfmask)
+
+    for breaks, result in zip(data.breaks, results):
+        found = [model['break_day'] for model in result['change_models']
+                 if model['change_probability'] == 1]
+
+        assert len(found) == 2
+        assert np.all(np.abs(np.array(found) - breaks) < 100)
+
+    assert ccd.detect(params=cfmask, **synthetic.pixel(data, 1)) == \
+        results[1]
+
+
+def test_too_few_observations():
+    with pytest.raises(ValueError):
+        synthetic.chip(observations=10, breaks=4)
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+import ccd
+from ccd import results, synthetic
+
+params = {'QA_BITPACKED': False,
+          'QA_FILL': 255,
+          'QA_CLEAR': 0,
+          'QA_WATER': 1,
+          'QA_SHADOW': 2,
+          'QA_SNOW': 3,
+          'QA_CLOUD': 4}
+
+
+def series(seed=0, observations=1200):
+    data = synthetic.chip(pixels=1, observations=observations, breaks=2,
+                          cloud=0.3, params=params, seed=seed)
+
+    return data.dates, data.spectra[:, 0], data.qas[0]
+
+
+def test_update_matches_detect(monkeypatch):
+    resume = getattr(ccd, '__resume_procedure')
+    resumed = []
+
+    def spy(*args):
+        output = resume(*args)
+        resumed.append(output is not None)
+        return output
+
+    monkeypatch.setattr(ccd, '__resume_procedure', spy)
+
+    for seed in range(3):
+        dates, spectra, qas = series(seed)
+        start = 900
+
+        output, state = ccd.update(None, dates[:start], spectra[:, :start],
+                                   qas[:start], None, params=params)
+
+        assert output == ccd.detect(dates[:start], *spectra[:, :start],
+                                    qas[:start], params=params)
+
+        for size in (1, 3, 7, 20, 60, 209):
+            stop = start + size
+
+            output, state = ccd.update(output, dates[start:stop],
+                                       spectra[:, start:stop],
+                                       qas[start:stop], state)
+
+            assert output == ccd.detect(dates[:stop], *spectra[:, :stop],
+                                        qas[:stop], params=params)
+
+            start = stop
+
+        assert state.dates.shape == (1200,)
+
+    # Some of the updates did not change the variogram, and only ran the new
+    # observations
+    assert any(resumed)
+
+
+def test_update_inexact():
+    dates, spectra, qas = series(1)
+    start = 900
+
+    output, state = ccd.update(None, dates[:start], spectra[:, :start],
+                               qas[:start], None, params=params)
+    variogram = state.checkpoint.variogram
+
+    for stop in range(start + 50, 1201, 50):
+        output, state = ccd.update(output, dates[start:stop],
+                                   spectra[:, start:stop], qas[start:stop],
+                                   state, exact=False)
+        start = stop
+
+    expected = ccd.detect(dates, *spectra, qas, params=params)
+
+    # Every update resumed, keeping the first variogram
+    assert state.checkpoint.variogram is variogram
+    assert [model['break_day'] for model in output['change_models']] == \
+        [model['break_day'] for model in expected['change_models']]
+
+
+def test_update_starts_over():
+    dates, spectra, qas = series(2)
+
+    # Dates earlier than the previous ones
+    held = np.r_[np.arange(900), np.arange(1000, 1100)]
+    output, state = ccd.update(None, dates[held], spectra[:, held],
+                               qas[held], None, params=params)
+    later, _ = ccd.update(output, dates[900:1000], spectra[:, 900:1000],
+                          qas[900:1000], state)
+
+    assert later == ccd.detect(dates[:1100], *spectra[:, :1100],
+                               qas[:1100], params=params)
+
+    output, state = ccd.update(None, dates[:1000], spectra[:, :1000],
+                               qas[:1000], None, params=params)
+
+    # Other parameters
+    changed = dict(params, CHANGE_PROBABILITY=0.95)
+    later, state = ccd.update(output, dates[1000:], spectra[:, 1000:],
+                              qas[1000:], state, params=changed)
+
+    assert later == ccd.detect(dates, *spectra, qas, params=changed)
+    assert state.params['CHANGE_PROBABILITY'] == 0.95
+
+
+def test_update_mismatch():
+    dates, spectra, qas = series(0)
+
+    output, state = ccd.update(None, dates[:1000], spectra[:, :1000],
+                               qas[:1000], None, params=params)
+    other, _ = ccd.update(None, dates[:500], spectra[:, :500], qas[:500],
+                          None, params=params)
+
+    with pytest.raises(ValueError):
+        ccd.update(other, dates[1000:], spectra[:, 1000:], qas[1000:], state)
+
+
+def test_update_columnar():
+    dates, spectra, qas = series(0)
+    columnar = dict(params, COLUMNAR_RESULTS=True)
+
+    output, state = ccd.update(None, dates[:1000], spectra[:, :1000],
+                               qas[:1000], None, params=columnar)
+    output, state = ccd.update(output, dates[1000:], spectra[:, 1000:],
+                               qas[1000:], state)
+
+    expected = ccd.detect(dates, *spectra, qas, params=params)
+
+    assert isinstance(output, results.ColumnarResults)
+    assert results.change_models(output.segments) == \
+        list(expected['change_models'])
@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+import ccd
+from ccd import synthetic
+from ccd.models import gram_lasso
+from test.test_parallel import chip, params
+
+xarray = pytest.importorskip('xarray')
+
+from ccd import xarray as ccd_xarray  # noqa: E402
+
+
+def dataset(inputs=None, reverse=True):
+    """
+    A 2 x 2 pixel Dataset with a variable for each band and datetime64
+    times, reversed unless asked otherwise. The reflectances are stored as
+    floats, to be scaled by 10000, and the thermal band as it is.
+    """
+    dates, spectra, qas = chip() if inputs is None else inputs
+    order = slice(None, None, -1 if reverse else 1)
+
+    times = (dates - ccd_xarray.EPOCH_ORDINAL).astype('datetime64[D]')
+    coords = {'time': times[order], 'y': [10.0, 20.0], 'x': [1.0, 2.0]}
+
+    variables = {}
+    for band, values in zip(ccd.results.BANDS, scaled(spectra, 1 / 10000)):
+        variables['sr_' + band] = (('time', 'y', 'x'),
+                                   values.T[order].reshape(-1, 2, 2))
+    variables['pixel_qa'] = (('time', 'y', 'x'),
+                             qas.T[order].reshape(-1, 2, 2))
+
+    return xarray.Dataset(variables, coords=coords), (dates, spectra, qas)
+
+
+def scaled(spectra, factor):
+    """
+    Spectra with the reflectance bands multiplied by factor.
+    """
+    spectra = np.array(spectra, dtype=np.float64)
+    spectra[:6] *= factor
+
+    return spectra
+
+
+def test_ordinal_dates():
+    values = np.array(['1970-01-01', '2000-01-01'], dtype='datetime64[ns]')
+
+    assert list(ccd_xarray.ordinal_dates(values)) == [719163, 730120]
+    assert list(ccd_xarray.ordinal_dates([730120])) == [730120]
+
+
+def check(results, expected):
+    for idx, result in enumerate(expected):
+        pixel = results.isel(y=idx // 2, x=idx % 2)
+        models = result['change_models']
+
+        assert int(pixel.segment_count) == len(models)
+        assert float(pixel.cloud_prob) == result['cloud_prob']
+
+        for segment, model in enumerate(models):
+            assert int(pixel.break_day[segment]) == model['break_day']
+            assert np.allclose(pixel.coefficients.sel(band='nir')[segment],
+                               model['nir']['coefficients'])
+
+        assert list(pixel.processing_mask.values) == result['processing_mask']
+
+
+def test_detect_dataset():
+    ds, (dates, spectra, qas) = dataset()
+    bands = {band: 'sr_' + band for band in ccd.results.BANDS}
+
+    results = ccd_xarray.detect_dataset(ds, bands, qa='pixel_qa',
+                                        params=params, scale=10000,
+                                        max_segments=4, masks=True)
+
+    assert results.break_day.dims == ('segment', 'y', 'x')
+    assert results.magnitude.dims == ('segment', 'band', 'y', 'x')
+    assert list(results.y.values) == [10.0, 20.0]
+
+    expected = ccd.detect_chip(dates, scaled(scaled(spectra, 1 / 10000),
+                                             10000),
+                               qas, params=params)
+    check(results, expected)
+
+
+def test_detect_dataset_dask():
+    pytest.importorskip('dask')
+
+    ds, (dates, spectra, qas) = dataset()
+    bands = {band: 'sr_' + band for band in ccd.results.BANDS}
+
+    results = ccd_xarray.detect_dataset(ds.chunk({'y': 1, 'x': 1}), bands,
+                                        qa='pixel_qa', params=params,
+                                        scale=10000, max_segments=4,
+                                        masks=True)
+
+    assert results.break_day.chunks is not None
+
+    expected = ccd.detect_chip(dates, scaled(scaled(spectra, 1 / 10000),
+                                             10000),
+                               qas, params=params)
+    check(results.compute(), expected)
+
+
+def test_detect_dataset_duplicate_dates():
+    # Same day acquisitions of overlapping scenes, in acquisition order
+    data = synthetic.chip(pixels=4, observations=800, duplicates=0.2,
+                          params=params, seed=5)
+    assert np.any(np.diff(data.dates) == 0)
+
+    ds, (dates, spectra, qas) = dataset((data.dates, data.spectra, data.qas),
+                                        reverse=False)
+    bands = {band: 'sr_' + band for band in ccd.results.BANDS}
+
+    results = ccd_xarray.detect_dataset(ds, bands, qa='pixel_qa',
+                                        params=params, scale=10000,
+                                        max_segments=8, masks=True)
+
+    expected = ccd.detect_chip(dates, scaled(scaled(spectra, 1 / 10000),
+                                             10000),
+                               qas, params=params)
+    check(results, expected)
+
+
+def test_detect_dataset_thermal_unscaled():
+    ds, (dates, spectra, qas) = dataset()
+    bands = {band: 'sr_' + band for band in ccd.results.BANDS}
+
+    seen = []
+
+    def fitter(coef_matrix, spectra, max_iter, num_coefficients,
+               warm_start=None):
+        seen.append(spectra)
+        return gram_lasso.fitted_models(coef_matrix, spectra, max_iter,
+                                        num_coefficients, warm_start)
+
+    ccd_xarray.detect_dataset(ds, bands, qa='pixel_qa',
+                              params=dict(params, FITTER_FN=fitter),
+                              scale=10000)
+
+    thermal = np.concatenate([fitted[6] for fitted in seen])
+    assert seen
+    assert thermal.max() <= spectra[6].max()
+    assert thermal.max() > spectra[:6].max() / 10000